@@ -1,8 +1,7 @@
 import math
 
-import pandas as pd
-
 from params import exam_type_prob
+from utils import NA
 
 
 def get_mammo_1ss(env, patient, clinic, rg, pct_dx_after_ai, ai_on_dict, rad_change=False, rad_change_2=False):
@@ -49,42 +48,42 @@ def get_mammo_1ss(env, patient, clinic, rg, pct_dx_after_ai, ai_on_dict, rad_cha
         pct_mri_guided_bx_scheduled = pct_mri_guided_bx_scheduled_baseline
 
     # initiate timestamps
-    got_screen_us_machine_ts = pd.NA
-    got_screen_scanner_ts, got_dx_scanner_ts, got_us_machine_ts, got_us_machine_after_dx_scanner_ts = pd.NA, pd.NA, pd.NA, pd.NA
-    got_us_machine_bx_ts, got_scanner_after_us_bx_ts = pd.NA, pd.NA
-    got_dx_scanner_before_us_ts, got_scanner_bx_ts = pd.NA, pd.NA
-    got_scanner_after_mri_bx_ts = pd.NA
-    got_mri_machine_ts = pd.NA
-    got_dx_scanner_after_ai_ts, got_us_machine_after_dx_scanner_after_ai_ts, got_us_machine_after_ai_ts = pd.NA, pd.NA, pd.NA
-    got_dx_scanner_before_us_after_ai_ts = pd.NA
-
-    release_screen_us_machine_ts = pd.NA
-    release_scanner_after_post_bx_mammo_ts = pd.NA
-    release_dx_scanner_ts, release_us_machine_ts, release_dx_scanner_us_machine_ts, release_screen_scanner_ts = pd.NA, pd.NA, pd.NA, pd.NA
-    release_us_machine_after_bx_ts = pd.NA
-    release_dx_scanner_before_us_ts = pd.NA
-    release_dx_scanner_us_machine_after_ai_ts, release_dx_scanner_after_ai_ts, release_us_machine_after_ai_ts = pd.NA, pd.NA, pd.NA
-    release_dx_scanner_before_us_after_ai_ts = pd.NA
-    begin_ai_assess_ts, end_ai_assess_ts = pd.NA, pd.NA
-    release_mri_machine_ts = pd.NA
-
-    got_public_wait_room_ts, release_public_wait_room_ts = pd.NA, pd.NA
-    got_consent_staff_ts, release_consent_staff_ts = pd.NA, pd.NA
-    got_change_room_ts, release_change_room_ts = pd.NA, pd.NA
-    got_gowned_wait_room_ts, release_gowned_wait_room_ts = pd.NA, pd.NA
-    got_checkout_change_room_ts, release_checkout_change_room_ts = pd.NA, pd.NA
-
-    get_rad_dx_mammo_ts, release_rad_dx_mammo_ts = pd.NA, pd.NA
-    get_rad_dx_us_ts, release_rad_dx_us_ts = pd.NA, pd.NA
-    get_rad_dx_mammo_us_mammo_ts, release_rad_dx_mammo_us_mammo_ts = pd.NA, pd.NA
-    get_rad_dx_mammo_us_us_ts, release_rad_dx_mammo_us_us_ts = pd.NA, pd.NA
-    get_rad_ux_bx_ts, release_rad_us_bx_ts = pd.NA, pd.NA
-    get_rad_mri_bx_ts, release_rad_mri_bx_ts = pd.NA, pd.NA
-    get_rad_mammo_bx_ts, release_rad_mammo_bx_ts = pd.NA, pd.NA
-    get_rad_dx_mammo_us_mammo_after_ai_ts, release_rad_dx_mammo_us_mammo_after_ai_ts = pd.NA, pd.NA
-    get_rad_dx_mammo_us_us_after_ai_ts, release_rad_dx_mammo_us_us_after_ai_ts = pd.NA, pd.NA
-    get_rad_dx_mammo_after_ai_ts, release_rad_dx_mammo_after_ai_ts = pd.NA, pd.NA
-    get_rad_dx_us_after_ai_ts, release_rad_dx_us_after_ai_ts = pd.NA, pd.NA
+    got_screen_us_machine_ts = NA
+    got_screen_scanner_ts, got_dx_scanner_ts, got_us_machine_ts, got_us_machine_after_dx_scanner_ts = NA, NA, NA, NA
+    got_us_machine_bx_ts, got_scanner_after_us_bx_ts = NA, NA
+    got_dx_scanner_before_us_ts, got_scanner_bx_ts = NA, NA
+    got_scanner_after_mri_bx_ts = NA
+    got_mri_machine_ts = NA
+    got_dx_scanner_after_ai_ts, got_us_machine_after_dx_scanner_after_ai_ts, got_us_machine_after_ai_ts = NA, NA, NA
+    got_dx_scanner_before_us_after_ai_ts = NA
+
+    release_screen_us_machine_ts = NA
+    release_scanner_after_post_bx_mammo_ts = NA
+    release_dx_scanner_ts, release_us_machine_ts, release_dx_scanner_us_machine_ts, release_screen_scanner_ts = NA, NA, NA, NA
+    release_us_machine_after_bx_ts = NA
+    release_dx_scanner_before_us_ts = NA
+    release_dx_scanner_us_machine_after_ai_ts, release_dx_scanner_after_ai_ts, release_us_machine_after_ai_ts = NA, NA, NA
+    release_dx_scanner_before_us_after_ai_ts = NA
+    begin_ai_assess_ts, end_ai_assess_ts = NA, NA
+    release_mri_machine_ts = NA
+
+    got_public_wait_room_ts, release_public_wait_room_ts = NA, NA
+    got_consent_staff_ts, release_consent_staff_ts = NA, NA
+    got_change_room_ts, release_change_room_ts = NA, NA
+    got_gowned_wait_room_ts, release_gowned_wait_room_ts = NA, NA
+    got_checkout_change_room_ts, release_checkout_change_room_ts = NA, NA
+
+    get_rad_dx_mammo_ts, release_rad_dx_mammo_ts = NA, NA
+    get_rad_dx_us_ts, release_rad_dx_us_ts = NA, NA
+    get_rad_dx_mammo_us_mammo_ts, release_rad_dx_mammo_us_mammo_ts = NA, NA
+    get_rad_dx_mammo_us_us_ts, release_rad_dx_mammo_us_us_ts = NA, NA
+    get_rad_ux_bx_ts, release_rad_us_bx_ts = NA, NA
+    get_rad_mri_bx_ts, release_rad_mri_bx_ts = NA, NA
+    get_rad_mammo_bx_ts, release_rad_mammo_bx_ts = NA, NA
+    get_rad_dx_mammo_us_mammo_after_ai_ts, release_rad_dx_mammo_us_mammo_after_ai_ts = NA, NA
+    get_rad_dx_mammo_us_us_after_ai_ts, release_rad_dx_mammo_us_us_after_ai_ts = NA, NA
+    get_rad_dx_mammo_after_ai_ts, release_rad_dx_mammo_after_ai_ts = NA, NA
+    get_rad_dx_us_after_ai_ts, release_rad_dx_us_after_ai_ts = NA, NA
 
     # request a checkin staff
     with clinic.checkin_staff.request() as request:
@@ -140,8 +139,8 @@ def get_mammo_1ss(env, patient, clinic, rg, pct_dx_after_ai, ai_on_dict, rad_cha
                 yield env.process(clinic.consent_patient(patient))
                 release_consent_staff_ts = env.now
         else:
-            got_consent_staff_ts = pd.NA
-            release_consent_staff_ts = pd.NA
+            got_consent_staff_ts = NA
+            release_consent_staff_ts = NA
 
         # request change room
         with clinic.change_room.request() as request:
@@ -492,7 +491,7 @@ def get_mammo_1ss(env, patient, clinic, rg, pct_dx_after_ai, ai_on_dict, rad_cha
             with clinic.us_machine.request() as request, clinic.radiologist.request() as request_rad:
                 yield request & request_rad
                 got_us_machine_bx_ts = env.now
-                got_scanner_bx_ts = pd.NA
+                got_scanner_bx_ts = NA
                 yield env.process(clinic.get_us_guided_bx(patient))
                 release_us_machine_after_bx_ts = env.now
 
@@ -1,9 +1,8 @@
 import math
 import random
-import pandas as pd
 from numpy.random import default_rng
 import simpy
-from utils import MammoClinic, compute_durations_baseline
+from utils import NA, MammoClinic, compute_durations_baseline
 from params import exam_type_prob
 
 
@@ -27,33 +26,33 @@ def get_mammo(env, patient, clinic, rg):
     pct_mri_guided_bx_scheduled = sum(list(exam_type_distribution.values())[:8])
 
     # initiatie timestamps
-    got_screen_us_machine_ts = pd.NA
-    got_screen_scanner_ts, got_dx_scanner_ts, got_us_machine_ts, got_us_machine_after_dx_scanner_ts = pd.NA, pd.NA, pd.NA, pd.NA
-    got_us_machine_bx_ts, got_scanner_after_us_bx_ts = pd.NA, pd.NA
-    got_dx_scanner_before_us_ts, got_scanner_bx_ts = pd.NA, pd.NA
-    got_scanner_after_mri_bx_ts = pd.NA
-    got_mri_machine_ts = pd.NA
-
-    release_screen_us_machine_ts = pd.NA
-    release_scanner_after_post_bx_mammo_ts = pd.NA
-    release_dx_scanner_ts, release_us_machine_ts, release_dx_scanner_us_machine_ts, release_screen_scanner_ts = pd.NA, pd.NA, pd.NA, pd.NA
-    release_us_machine_after_bx_ts = pd.NA
-    release_dx_scanner_before_us_ts = pd.NA
-    release_mri_machine_ts = pd.NA
-
-    got_public_wait_room_ts, release_public_wait_room_ts = pd.NA, pd.NA
-    got_consent_staff_ts, release_consent_staff_ts = pd.NA, pd.NA
-    got_change_room_ts, release_change_room_ts = pd.NA, pd.NA
-    got_gowned_wait_room_ts, release_gowned_wait_room_ts = pd.NA, pd.NA
-    got_checkout_change_room_ts, release_checkout_change_room_ts = pd.NA, pd.NA
-
-    get_rad_dx_mammo_ts, release_rad_dx_mammo_ts = pd.NA, pd.NA
-    get_rad_dx_us_ts, release_rad_dx_us_ts = pd.NA, pd.NA
-    get_rad_dx_mammo_us_mammo_ts, release_rad_dx_mammo_us_mammo_ts = pd.NA, pd.NA
-    get_rad_dx_mammo_us_us_ts, release_rad_dx_mammo_us_us_ts = pd.NA, pd.NA
-    get_rad_us_bx_ts, release_rad_us_bx_ts = pd.NA, pd.NA
-    get_rad_mri_bx_ts, release_rad_mri_bx_ts = pd.NA, pd.NA
-    get_rad_mammo_bx_ts, release_rad_mammo_bx_ts = pd.NA, pd.NA
+    got_screen_us_machine_ts = NA
+    got_screen_scanner_ts, got_dx_scanner_ts, got_us_machine_ts, got_us_machine_after_dx_scanner_ts = NA, NA, NA, NA
+    got_us_machine_bx_ts, got_scanner_after_us_bx_ts = NA, NA
+    got_dx_scanner_before_us_ts, got_scanner_bx_ts = NA, NA
+    got_scanner_after_mri_bx_ts = NA
+    got_mri_machine_ts = NA
+
+    release_screen_us_machine_ts = NA
+    release_scanner_after_post_bx_mammo_ts = NA
+    release_dx_scanner_ts, release_us_machine_ts, release_dx_scanner_us_machine_ts, release_screen_scanner_ts = NA, NA, NA, NA
+    release_us_machine_after_bx_ts = NA
+    release_dx_scanner_before_us_ts = NA
+    release_mri_machine_ts = NA
+
+    got_public_wait_room_ts, release_public_wait_room_ts = NA, NA
+    got_consent_staff_ts, release_consent_staff_ts = NA, NA
+    got_change_room_ts, release_change_room_ts = NA, NA
+    got_gowned_wait_room_ts, release_gowned_wait_room_ts = NA, NA
+    got_checkout_change_room_ts, release_checkout_change_room_ts = NA, NA
+
+    get_rad_dx_mammo_ts, release_rad_dx_mammo_ts = NA, NA
+    get_rad_dx_us_ts, release_rad_dx_us_ts = NA, NA
+    get_rad_dx_mammo_us_mammo_ts, release_rad_dx_mammo_us_mammo_ts = NA, NA
+    get_rad_dx_mammo_us_us_ts, release_rad_dx_mammo_us_us_ts = NA, NA
+    get_rad_us_bx_ts, release_rad_us_bx_ts = NA, NA
+    get_rad_mri_bx_ts, release_rad_mri_bx_ts = NA, NA
+    get_rad_mammo_bx_ts, release_rad_mammo_bx_ts = NA, NA
 
     # request a checkin staff
     with clinic.checkin_staff.request() as request:
@@ -110,8 +109,8 @@ def get_mammo(env, patient, clinic, rg):
                 yield env.process(clinic.consent_patient(patient))
                 release_consent_staff_ts = env.now
         else:
-            got_consent_staff_ts = pd.NA
-            release_consent_staff_ts = pd.NA
+            got_consent_staff_ts = NA
+            release_consent_staff_ts = NA
 
         # request change room
         with clinic.change_room.request() as request:
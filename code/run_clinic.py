@@ -1,12 +1,12 @@
 import math
 
-import pandas as pd
 import simpy
 from numpy.random._generator import default_rng
 
 from clinic_wf_1ss import get_mammo_1ss
 from clinic_wf_no_1ss import get_mammo
-from utils import MammoClinic_1SS, MammoClinic
+from params import load_params
+from utils import MammoClinic_1SS, MammoClinic, write_patient_log
 
 
 def run_clinic(env, clinic, rg, pt_num_list, acc_pt_num_list, pct_dx_after_ai, ai_on_dict, rad_change, rad_change_2,
@@ -44,7 +44,7 @@ def run_clinic(env, clinic, rg, pt_num_list, acc_pt_num_list, pct_dx_after_ai, a
         elif math.floor(env.now) > cur_hour and patient >= acc_pt_num_list[cur_hour]:
             cur_hour = math.floor(env.now)
 
-def main(wf_1ss, rad_change, rad_change_2, seed=42, ai_time='none'):
+def simulate_day(wf_1ss, rad_change, rad_change_2, seed=42, ai_time='none'):
     rg = default_rng(seed=seed)
 
     stoptime = 9.5
@@ -81,8 +81,7 @@ def main(wf_1ss, rad_change, rad_change_2, seed=42, ai_time='none'):
                       13: False, 14: False, 15: False, 16: False}
 
     ### num pts per hour
-    num_pt_per_hour = pd.read_csv('./data/num_pt_per_hour_BK_22_12.csv')
-    pt_num_list = list(num_pt_per_hour.avg)
+    pt_num_list = list(load_params().pt_num_per_hour)
     pt_num_list[-1] *= 2
 
     acc_pt_num_list = []
@@ -115,20 +114,19 @@ def main(wf_1ss, rad_change, rad_change_2, seed=42, ai_time='none'):
 
     env.run()
 
-    # create output files
-    clinic_patient_log_df = pd.DataFrame(clinic.timestamps_list)
+    return clinic.timestamps_list, env.now
+
+def main(wf_1ss, rad_change, rad_change_2, seed=42, ai_time='none'):
+    timestamps_list, end_time = simulate_day(wf_1ss, rad_change, rad_change_2, seed=seed, ai_time=ai_time)
 
+    # create output files
     if wf_1ss:
-        clinic_patient_log_df.to_csv(
-            './output/log_1ss/clinic_patient_log_df_seed_' + str(seed) + '.csv', index=False)
+        write_patient_log(timestamps_list, './output/log_1ss/clinic_patient_log_df_seed_' + str(seed) + '.csv')
     else:
-        clinic_patient_log_df.to_csv(
-            './output/log_baseline/clinic_patient_log_df_baseline_seed_' + str(
-                seed) + '.csv', index=False)
+        write_patient_log(timestamps_list,
+                          './output/log_baseline/clinic_patient_log_df_baseline_seed_' + str(seed) + '.csv')
 
     # Note simulation end time
-    end_time = env.now
-
     print(f"Simulation ended at time {end_time}")
 
     return (end_time)
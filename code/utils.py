@@ -1,5 +1,41 @@
+import csv
+
 import simpy
 
+# Placeholder for timestamps a patient's path never reaches; written as an empty CSV field.
+NA = float('nan')
+
+
+def _csv_field(value):
+    if isinstance(value, float):
+        return '' if value != value else repr(float(value))
+    return '' if value is None else value
+
+
+def write_patient_log(timestamps_list, path):
+    """
+    Writes a day's timestamps dicts to a CSV file, one row per patient.
+
+    Columns appear in the order they were first recorded. Produces the same file
+    as pandas.DataFrame(timestamps_list).to_csv(path, index=False) without
+    importing pandas.
+    """
+    fieldnames = list(dict.fromkeys(key for timestamps in timestamps_list for key in timestamps))
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(fieldnames)
+        for timestamps in timestamps_list:
+            writer.writerow([_csv_field(timestamps.get(key)) for key in fieldnames])
+
+
+def service_time(rg, mean, sd):
+    """
+    Draws a normal service time. A draw below zero, rare as sd is at most a fifth of
+    the mean, is clamped to 0 because env.timeout() raises on negative delays.
+    """
+    return max(0.0, rg.normal(mean, sd))
+
+
 class MammoClinic(object):
     def __init__(self, env, num_checkin_staff, num_public_wait_room,
                  num_consent_staff,
@@ -23,43 +59,43 @@ class MammoClinic(object):
         self.radiologist = simpy.Resource(env, num_radiologist)
 
     def pt_checkin(self, patient):
-        yield self.env.timeout(self.rg.normal(0.05, 0.01))
+        yield self.env.timeout(service_time(self.rg, 0.05, 0.01))
 
     def use_public_wait_room(self, patient):
-        yield self.env.timeout(self.rg.normal(0.17, 0.034))
+        yield self.env.timeout(service_time(self.rg, 0.17, 0.034))
 
     def consent_patient(self, patient):
-        yield self.env.timeout(self.rg.normal(0.17, 0.034))
+        yield self.env.timeout(service_time(self.rg, 0.17, 0.034))
 
     def use_change_room(self, patient):
-        yield self.env.timeout(self.rg.normal(0.03, 0.006))
+        yield self.env.timeout(service_time(self.rg, 0.03, 0.006))
 
     def use_gowned_wait_room(self, patient):
-        yield self.env.timeout(self.rg.normal(0.017, 0.0034))
+        yield self.env.timeout(service_time(self.rg, 0.017, 0.0034))
 
     def get_screen_mammo(self, patient):
-        yield self.env.timeout(self.rg.normal(0.17, 0.034))
+        yield self.env.timeout(service_time(self.rg, 0.17, 0.034))
 
     def get_dx_mammo(self, patient):
-        yield self.env.timeout(self.rg.normal(0.50-0.083, 0.0834))
+        yield self.env.timeout(service_time(self.rg, 0.50-0.083, 0.0834))
 
     def get_dx_us(self, patient):
-        yield self.env.timeout(self.rg.normal(0.50-0.083, 0.0834))
+        yield self.env.timeout(service_time(self.rg, 0.50-0.083, 0.0834))
 
     def get_us_guided_bx(self, patient):
-        yield self.env.timeout(self.rg.normal(0.75, 0.15))
+        yield self.env.timeout(service_time(self.rg, 0.75, 0.15))
 
     def get_mammo_guided_bx(self, patient):
-        yield self.env.timeout(self.rg.normal(0.75, 0.15))
+        yield self.env.timeout(service_time(self.rg, 0.75, 0.15))
 
     def get_screen_us(self, patient):
-        yield self.env.timeout(self.rg.normal(0.25, 0.05))
+        yield self.env.timeout(service_time(self.rg, 0.25, 0.05))
 
     def get_mri_guided_bx(self, patient):
-        yield self.env.timeout(self.rg.normal(0.5, 0.1))
+        yield self.env.timeout(service_time(self.rg, 0.5, 0.1))
 
     def rad_review(self, patient):
-        yield self.env.timeout(self.rg.normal(0.083, 0.017))
+        yield self.env.timeout(service_time(self.rg, 0.083, 0.017))
 
 class MammoClinic_1SS(object):
     def __init__(self, env, num_checkin_staff, num_public_wait_room, num_consent_staff,
@@ -86,46 +122,46 @@ class MammoClinic_1SS(object):
             self.radiologist_same_day = simpy.Resource(env, num_radiologist_same_day)
 
     def pt_checkin(self, patient):
-        yield self.env.timeout(self.rg.normal(0.05, 0.01))
+        yield self.env.timeout(service_time(self.rg, 0.05, 0.01))
 
     def use_public_wait_room(self, patient):
-        yield self.env.timeout(self.rg.normal(0.17, 0.034))
+        yield self.env.timeout(service_time(self.rg, 0.17, 0.034))
 
     def consent_patient(self, patient):
-        yield self.env.timeout(self.rg.normal(0.17, 0.034))
+        yield self.env.timeout(service_time(self.rg, 0.17, 0.034))
 
     def use_change_room(self, patient):
-        yield self.env.timeout(self.rg.normal(0.03, 0.006))
+        yield self.env.timeout(service_time(self.rg, 0.03, 0.006))
 
     def use_gowned_wait_room(self, patient):
-        yield self.env.timeout(self.rg.normal(0.017, 0.0034))
+        yield self.env.timeout(service_time(self.rg, 0.017, 0.0034))
 
     def get_screen_mammo(self, patient):
-        yield self.env.timeout(self.rg.normal(0.17, 0.034))
+        yield self.env.timeout(service_time(self.rg, 0.17, 0.034))
 
     def get_dx_mammo(self, patient):
-        yield self.env.timeout(self.rg.normal(0.50-0.083, 0.0834))
+        yield self.env.timeout(service_time(self.rg, 0.50-0.083, 0.0834))
 
     def get_dx_us(self, patient):
-        yield self.env.timeout(self.rg.normal(0.50-0.083, 0.0834))
+        yield self.env.timeout(service_time(self.rg, 0.50-0.083, 0.0834))
 
     def get_us_guided_bx(self, patient):
-        yield self.env.timeout(self.rg.normal(0.75, 0.15))
+        yield self.env.timeout(service_time(self.rg, 0.75, 0.15))
 
     def get_mammo_guided_bx(self, patient):
-        yield self.env.timeout(self.rg.normal(1.25, 0.25))
+        yield self.env.timeout(service_time(self.rg, 1.25, 0.25))
 
     def get_ai_assess(self, patient):
-        yield self.env.timeout(self.rg.normal(0.25, 0.05))
+        yield self.env.timeout(service_time(self.rg, 0.25, 0.05))
 
     def get_screen_us(self, patient):
-        yield self.env.timeout(self.rg.normal(0.25, 0.05))
+        yield self.env.timeout(service_time(self.rg, 0.25, 0.05))
 
     def get_mri_guided_bx(self, patient):
-        yield self.env.timeout(self.rg.normal(0.5, 0.1))
+        yield self.env.timeout(service_time(self.rg, 0.5, 0.1))
 
     def rad_review(self, patient):
-        yield self.env.timeout(self.rg.normal(0.083, 0.017))
+        yield self.env.timeout(service_time(self.rg, 0.083, 0.017))
 
 
 def compute_durations_baseline(timestamp_df):
@@ -0,0 +1,94 @@
+import math
+import zlib
+from statistics import NormalDist
+
+import numpy as np
+from numpy.random import SeedSequence, default_rng
+
+# Smallest uniform used, so that mirrored draws of 0 stay finite.
+_TINY = 2.0 ** -54
+_STANDARD_NORMAL = NormalDist()
+
+# Day KPIs summarised by the --antithetic report of run_simulation.
+REPORT_KPIS = ['mean_total_system_time', 'p50_total_system_time', 'p90_total_system_time',
+               'max_total_system_time', 'n_patients']
+
+
+class AntitheticGenerator(object):
+    """
+    Stand-in for the numpy Generator of a SimulationContext that draws every variate
+    by inversion of one uniform, so that a day can be replayed with mirrored uniforms.
+
+    With mirror False a draw uses u, with mirror True it uses 1 - u: the exam-type
+    draw becomes 1 - u, and interarrival and service times come from the opposite
+    tail. To keep the two days of a pair in step although their patients take
+    different paths, interarrival times, exam types and each service-time
+    distribution (told apart by its parameters) take their uniforms from their own
+    stream of the seed: the k-th arrival, exam-type draw and e.g. check-in of the
+    mirrored day are paired with the k-th ones of the first day.
+
+    Both days have the distribution of a plain day, but not its values for a given
+    seed. Only the methods the simulation calls (random, exponential, normal) are provided.
+    """
+    def __init__(self):
+        self.mirror = False
+        self._seed = None
+        self._streams = {}
+
+    def reseed(self, seed, mirror=False):
+        """Starts the streams of a day from `seed`; mirror selects the second day of the pair."""
+        self._seed = seed
+        self._streams = {}
+        self.mirror = mirror
+
+    def _uniform(self, key):
+        if key not in self._streams:
+            # spawn key 0 is the pct_dx_after_ai stream of branching (see run_simulation.draw_pct_dx_after_ai)
+            spawn_key = (zlib.crc32(repr(key).encode()) + 1,)
+            self._streams[key] = default_rng(SeedSequence(self._seed, spawn_key=spawn_key))
+        u = max(self._streams[key].random(), _TINY)
+        return 1.0 - u if self.mirror else u
+
+    def exponential(self, scale=1.0):
+        return -scale * math.log(max(1.0 - self._uniform('interarrival'), _TINY))
+
+    def random(self):
+        return self._uniform('exam_type')
+
+    def normal(self, loc=0.0, scale=1.0):
+        u = self._uniform(('normal', loc, scale))
+        return loc + scale * _STANDARD_NORMAL.inv_cdf(min(max(u, _TINY), 1.0 - _TINY))
+
+
+def antithetic_summary(first, second, confidence=0.95):
+    """
+    Compares antithetic pairs with independent days for one KPI.
+
+    Args:
+        first (array-like): KPI of the first day of each pair.
+        second (array-like): KPI of the mirrored day of each pair.
+        confidence (float, optional): Level of the interval. Defaults to 0.95.
+
+    Returns:
+        dict: mean, half_width (of the interval from the pair means), correlation between
+              the days of a pair, variance_reduction (variance of the mean of two independent
+              days over that of a pair mean; above 1 means pairs help) and independent_days
+              (independent days needed for the same half width).
+    """
+    first, second = np.asarray(first, dtype=float), np.asarray(second, dtype=float)
+    keep = ~(np.isnan(first) | np.isnan(second))
+    first, second = first[keep], second[keep]
+    num_pairs = len(first)
+    pair_means = (first + second) / 2
+    pair_var = np.var(pair_means, ddof=1)
+    # both days of a pair have the distribution of a plain day
+    day_var = (np.var(first, ddof=1) + np.var(second, ddof=1)) / 2
+    z = _STANDARD_NORMAL.inv_cdf(0.5 + confidence / 2)
+    variance_reduction = day_var / 2 / pair_var if pair_var > 0 else math.inf
+    return {
+        'mean': float(pair_means.mean()),
+        'half_width': float(z * math.sqrt(pair_var / num_pairs)),
+        'correlation': float(np.corrcoef(first, second)[0, 1]) if day_var > 0 else math.nan,
+        'variance_reduction': float(variance_reduction),
+        'independent_days': float(2 * num_pairs * variance_reduction),
+    }
@@ -0,0 +1,122 @@
+import concurrent.futures
+import os
+import warnings
+
+import numpy as np
+
+from kpis import DAY_KPI_NAMES, day_kpis
+from scenarios import resolve_scenario, scenario_hash
+
+
+def init_worker():
+    """Initializer of the simulation worker pools, which run with warnings silenced."""
+    warnings.simplefilter('ignore')
+
+
+def chunk_seeds(seeds, workers, size=None):
+    """
+    Splits seeds into tasks for a pool of `workers`, by default a few tasks per worker
+    so that uneven tasks balance out.
+
+    Returns:
+        list: Lists of consecutive seeds.
+    """
+    size = size or max(1, -(-len(seeds) // (4 * workers)))
+    return [seeds[i:i + size] for i in range(0, len(seeds), size)]
+
+
+def run_chunk(scenario, seeds):
+    """
+    Simulates one scenario for several seeds in this process and returns one KPI row per seed.
+
+    Workers keep the SimulationContexts of recent scenarios (see run_simulation.get_context),
+    so later chunks of a scenario skip its setup.
+    """
+    from run_simulation import get_context
+
+    context = get_context(scenario)
+    rows = []
+    for seed in seeds:
+        context.reset(seed)
+        timestamps_list, _ = context.run()
+        kpis = day_kpis(timestamps_list, num_arrivals=context.num_arrivals)
+        rows.append([kpis[name] for name in DAY_KPI_NAMES])
+    return rows
+
+
+class BatchRunner(object):
+    """
+    Evaluates batches of (scenario, seed) days in a process pool and memoizes the results.
+
+    Every scenario in a batch is run on the same seeds, so candidates are compared
+    under common random numbers. Results are cached by (scenario hash, seed); a day
+    that was simulated before is not simulated again.
+
+    Args:
+        workers (int, optional): Worker processes. 1 runs in this process. Defaults to all cores.
+        chunk_size (int, optional): Seeds per task sent to a worker. Defaults to a size that
+                                    gives each worker a few tasks per batch.
+    """
+    def __init__(self, workers=None, chunk_size=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.cache = {}
+        self.num_simulated = 0
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def run(self, scenarios, seeds):
+        """
+        Simulates every scenario on every seed, skipping cached days.
+
+        Args:
+            scenarios (list): Scenario dicts, partial ones are completed with the defaults.
+            seeds (list): Seeds shared by all scenarios.
+
+        Returns:
+            numpy.ndarray: KPIs with shape (len(scenarios), len(seeds), len(DAY_KPI_NAMES)).
+        """
+        scenarios = [resolve_scenario(scenario) for scenario in scenarios]
+        keys = [scenario_hash(scenario) for scenario in scenarios]
+
+        tasks = []
+        queued = set()
+        for key, scenario in zip(keys, scenarios):
+            missing = [seed for seed in seeds if (key, seed) not in self.cache and (key, seed) not in queued]
+            queued.update((key, seed) for seed in missing)
+            tasks.extend((key, scenario, chunk) for chunk in chunk_seeds(missing, self.workers, self.chunk_size))
+
+        if self.workers == 1:
+            for key, scenario, chunk in tasks:
+                self._store(key, chunk, run_chunk(scenario, chunk))
+        elif tasks:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                                    initializer=init_worker)
+            futures = {self._pool.submit(run_chunk, scenario, chunk): (key, chunk)
+                       for key, scenario, chunk in tasks}
+            for future in concurrent.futures.as_completed(futures):
+                key, chunk = futures[future]
+                self._store(key, chunk, future.result())
+
+        return np.array([[self.cache[(key, seed)] for seed in seeds] for key in keys], dtype=float)
+
+    def _store(self, key, seeds, rows):
+        for seed, row in zip(seeds, rows):
+            self.cache[(key, seed)] = row
+        self.num_simulated += len(seeds)
+
+
+def kpi_column(name):
+    """Index of a day-level KPI in the last axis of BatchRunner.run() results."""
+    return DAY_KPI_NAMES.index(name)
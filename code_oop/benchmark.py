@@ -0,0 +1,272 @@
+import argparse
+import atexit
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from scenarios import SCENARIO_GRID, scenario_name
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IMPLEMENTATIONS = {
+    'code': os.path.join(HERE, '..', 'code'),
+    'code_oop': HERE,
+}
+DEFAULT_HISTORY = os.path.join(HERE, 'output', 'benchmark_history.jsonl')
+
+# Metrics where larger is better; everything else (memory) is smaller-is-better.
+THROUGHPUT_METRICS = ['replications_per_sec', 'events_per_sec', 'patients_per_sec', 'postprocess_rows_per_sec']
+MEMORY_METRICS = ['peak_rss_mb']
+
+
+def _import_implementation(impl):
+    """
+    Makes `impl` importable as flat modules and returns (main, compute_durations).
+
+    Both implementations use the same module names (utils, params, ...) and
+    relative paths, so each one is benchmarked in its own process whose working
+    directory is a scratch folder that links to the implementation's data.
+    """
+    impl_dir = os.path.abspath(IMPLEMENTATIONS[impl])
+    sys.path[:] = [impl_dir] + [p for p in sys.path if os.path.abspath(p or '.') != HERE]
+
+    scratch = tempfile.mkdtemp(prefix=f'bench_{impl}_')
+    os.symlink(os.path.join(impl_dir, 'data'), os.path.join(scratch, 'data'))
+    os.makedirs(os.path.join(scratch, 'output', 'log_1ss'))
+    os.makedirs(os.path.join(scratch, 'output', 'log_baseline'))
+    os.chdir(scratch)
+    atexit.register(shutil.rmtree, scratch, ignore_errors=True)
+
+    if impl == 'code':
+        from run_clinic import main
+        from utils import compute_durations_1ss, compute_durations_baseline
+
+        def compute_durations(df, wf_1ss):
+            return compute_durations_1ss(df) if wf_1ss else compute_durations_baseline(df)
+    else:
+        from run_simulation import main
+        from utils import compute_durations as _compute_durations
+
+        def compute_durations(df, wf_1ss):
+            return _compute_durations(df)
+    return main, compute_durations
+
+
+def run_worker(impl, scenario, seeds, warmup):
+    """
+    Times fixed-seed days of one scenario inside this process and returns the metrics.
+    """
+    import resource
+    import warnings
+    import contextlib
+    import io
+
+    import pandas as pd
+    import simpy
+
+    warnings.simplefilter('ignore')
+    main, compute_durations = _import_implementation(impl)
+
+    # count scheduler events by wrapping Environment.step
+    event_count = [0]
+    original_step = simpy.Environment.step
+
+    def counting_step(env):
+        event_count[0] += 1
+        return original_step(env)
+
+    simpy.Environment.step = counting_step
+
+    def log_path(seed):
+        if scenario['wf_1ss']:
+            return './output/log_1ss/clinic_patient_log_df_seed_' + str(seed) + '.csv'
+        return './output/log_baseline/clinic_patient_log_df_baseline_seed_' + str(seed) + '.csv'
+
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        for seed in seeds[:warmup]:
+            main(scenario['wf_1ss'], scenario['rad_change'], scenario['rad_change_2'],
+                 seed=seed, ai_time=scenario['ai_time'])
+
+    event_count[0] = 0
+    start = time.perf_counter()
+    with quiet:
+        for seed in seeds:
+            main(scenario['wf_1ss'], scenario['rad_change'], scenario['rad_change_2'],
+                 seed=seed, ai_time=scenario['ai_time'])
+    sim_seconds = time.perf_counter() - start
+
+    logs = [pd.read_csv(log_path(seed)) for seed in seeds]
+    num_rows = sum(len(df) for df in logs)
+    start = time.perf_counter()
+    for df in logs:
+        compute_durations(df, scenario['wf_1ss'])
+    post_seconds = time.perf_counter() - start
+
+    return {
+        'impl': impl,
+        'scenario': scenario_name(scenario),
+        'num_days': len(seeds),
+        'replications_per_sec': len(seeds) / sim_seconds,
+        'events_per_sec': event_count[0] / sim_seconds,
+        'patients_per_sec': num_rows / sim_seconds,
+        'postprocess_rows_per_sec': num_rows / post_seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(impls, scenarios, num_days, warmup, first_seed, label=None):
+    """
+    Runs one worker process per (implementation, scenario) and collects their metrics.
+
+    Returns:
+        dict: A history record with environment info and a 'results' list.
+    """
+    seeds = list(range(first_seed, first_seed + num_days))
+    results = []
+    for impl in impls:
+        for scenario in scenarios:
+            cmd = [sys.executable, os.path.abspath(__file__), 'worker', '--impl', impl,
+                   '--scenario', json.dumps(scenario), '--seeds', ','.join(map(str, seeds)),
+                   '--warmup', str(warmup)]
+            output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{impl:<9}{result['scenario']:<20}"
+                  f"{result['replications_per_sec']:8.2f} reps/s"
+                  f"{result['events_per_sec']:11.0f} events/s"
+                  f"{result['patients_per_sec']:9.0f} pts/s"
+                  f"{result['postprocess_rows_per_sec']:9.0f} rows/s"
+                  f"{result['peak_rss_mb']:8.1f} MB")
+
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'label': label,
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'num_days': num_days,
+        'first_seed': first_seed,
+        'results': results,
+    }
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_records(baseline, current, threshold):
+    """
+    Flags metrics that got worse by more than `threshold` (a fraction, e.g. 0.1).
+
+    Returns:
+        list: (impl, scenario, metric, baseline value, current value, relative change) of regressions.
+    """
+    base_results = {(r['impl'], r['scenario']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        base = base_results.get((result['impl'], result['scenario']))
+        if base is None:
+            continue
+        for metric in THROUGHPUT_METRICS + MEMORY_METRICS:
+            change = (result[metric] - base[metric]) / base[metric]
+            worse = -change if metric in THROUGHPUT_METRICS else change
+            if worse > threshold:
+                regressions.append((result['impl'], result['scenario'], metric, base[metric], result[metric], change))
+    return regressions
+
+
+def _find_record(history, ref):
+    """Selects a record by list index (e.g. '-2') or by label/git revision."""
+    try:
+        return history[int(ref)]
+    except ValueError:
+        matches = [r for r in history if ref in (r.get('label'), r.get('git_revision'))]
+        if not matches:
+            raise ValueError(f"No benchmark record with label or revision '{ref}'.")
+        return matches[-1]
+
+
+def run_benchmark_cli():
+    """
+    Command line entry point: `run` appends a record to the history file,
+    `compare` checks the newest record against an earlier one.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the clinic simulation implementations.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmark suite and append to the history file')
+    run_parser.add_argument('--impl', nargs='+', default=list(IMPLEMENTATIONS), choices=list(IMPLEMENTATIONS))
+    run_parser.add_argument('--scenario', nargs='+', default=None,
+                            help='Scenario names to run (default: the whole sweep grid)')
+    run_parser.add_argument('--num_days', type=int, default=20, help='Timed days per scenario')
+    run_parser.add_argument('--warmup', type=int, default=2, help='Untimed warm-up days per scenario')
+    run_parser.add_argument('--first_seed', type=int, default=1, help='Days use seeds first_seed, first_seed+1, ...')
+    run_parser.add_argument('--label', type=str, default=None, help='Optional label stored with the record')
+    run_parser.add_argument('--history', type=str, default=DEFAULT_HISTORY)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare the newest record against a baseline record')
+    compare_parser.add_argument('--baseline', type=str, default='-2',
+                                help='History index, label or git revision of the baseline (default: previous run)')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='Relative slowdown that counts as a regression')
+    compare_parser.add_argument('--history', type=str, default=DEFAULT_HISTORY)
+
+    worker_parser = subparsers.add_parser('worker')
+    worker_parser.add_argument('--impl', required=True, choices=list(IMPLEMENTATIONS))
+    worker_parser.add_argument('--scenario', required=True)
+    worker_parser.add_argument('--seeds', required=True)
+    worker_parser.add_argument('--warmup', type=int, default=2)
+
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        seeds = [int(s) for s in args.seeds.split(',')]
+        print(json.dumps(run_worker(args.impl, json.loads(args.scenario), seeds, args.warmup)))
+
+    elif args.command == 'run':
+        scenarios = SCENARIO_GRID
+        if args.scenario:
+            scenarios = [s for s in SCENARIO_GRID if scenario_name(s) in args.scenario]
+            if not scenarios:
+                raise ValueError(f"No scenario in the grid matches {args.scenario}.")
+        record = run_benchmarks(args.impl, scenarios, args.num_days, args.warmup, args.first_seed, args.label)
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        print(f"Appended results to {args.history}")
+
+    elif args.command == 'compare':
+        history = load_history(args.history)
+        if len(history) < 2:
+            raise ValueError(f"Need at least two records in {args.history} to compare.")
+        baseline = _find_record(history, args.baseline)
+        current = history[-1]
+        regressions = compare_records(baseline, current, args.threshold)
+        print(f"Baseline: {baseline['timestamp']} ({baseline.get('label') or baseline.get('git_revision')})")
+        print(f"Current:  {current['timestamp']} ({current.get('label') or current.get('git_revision')})")
+        if not regressions:
+            print(f"No regressions above {args.threshold:.0%}.")
+            return
+        for impl, scenario, metric, before, after, change in regressions:
+            print(f"REGRESSION {impl:<9}{scenario:<20}{metric:<26}{before:12.2f} -> {after:12.2f} ({change:+.1%})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_benchmark_cli()
@@ -0,0 +1,249 @@
+import argparse
+import concurrent.futures
+import json
+import math
+import time
+import warnings
+
+import numpy as np
+from numpy.random import SeedSequence, default_rng
+
+from kpis import DAY_KPI_NAMES
+from scenarios import SCENARIO_GRID, load_scenarios, resolve_scenario, scenario_labels
+
+METHODS = ['percentile', 'bca']
+REPORT_KPIS = ['mean_total_system_time', 'p90_total_system_time', 'mean_wait_for_checkin_staff',
+               'mean_wait_for_screen_scanner', 'mean_wait_for_dx_scanner', 'mean_wait_for_us_machine']
+# resamples per random stream: the streams, and so the intervals, do not depend on the number of workers
+BLOCK_RESAMPLES = 250
+
+
+def _resampled_means(values, present, block_seeds, block_sizes):
+    """
+    Column means of bootstrap resamples of the rows, for several blocks of resamples.
+
+    A resample is a vector of multinomial row counts, so a block of them is a
+    (resamples x rows) matrix C and its column means are (C @ values) / (C @ present),
+    one matrix product for all KPIs, with NaN entries (values 0, present 0) left out.
+    """
+    n = len(values)
+    blocks = []
+    for seed, size in zip(block_seeds, block_sizes):
+        counts = default_rng(seed).multinomial(n, np.full(n, 1.0 / n), size=size).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            blocks.append((counts @ values) / (counts @ present))
+    return np.concatenate(blocks)
+
+
+def bootstrap_means(table, num_resamples=2000, seed=0, workers=1):
+    """
+    Bootstrap distribution of the mean of every column of a replication x KPI table.
+
+    Resamples come in blocks of BLOCK_RESAMPLES, each from its own SeedSequence child
+    of `seed`, and the blocks are split across worker processes; the result is the
+    same for any number of workers.
+
+    Args:
+        table (numpy.ndarray): One row per replication, one column per KPI; NaN where undefined.
+        num_resamples (int, optional): Resamples. Defaults to 2000.
+        seed (int, optional): Seed of the resampling. Defaults to 0.
+        workers (int, optional): Worker processes. Defaults to 1.
+
+    Returns:
+        numpy.ndarray: Resampled means with shape (num_resamples, number of columns).
+    """
+    table = np.asarray(table, dtype=float)
+    present = (~np.isnan(table)).astype(float)
+    values = np.where(np.isnan(table), 0.0, table)
+    num_blocks = -(-num_resamples // BLOCK_RESAMPLES)
+    block_seeds = SeedSequence(seed).spawn(num_blocks)
+    block_sizes = [min(BLOCK_RESAMPLES, num_resamples - i * BLOCK_RESAMPLES) for i in range(num_blocks)]
+    workers = min(workers, num_blocks)
+    if workers == 1:
+        return _resampled_means(values, present, block_seeds, block_sizes)
+    # contiguous runs of blocks, so each worker gets the table once
+    bounds = [round(i * num_blocks / workers) for i in range(workers + 1)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = pool.map(_resampled_means, [values] * workers, [present] * workers,
+                         [block_seeds[a:b] for a, b in zip(bounds, bounds[1:])],
+                         [block_sizes[a:b] for a, b in zip(bounds, bounds[1:])])
+        return np.concatenate(list(parts))
+
+
+def _jackknife_acceleration(table):
+    """BCa acceleration of the mean of each column, from closed-form leave-one-out means."""
+    present = ~np.isnan(table)
+    count = present.sum(axis=0)
+    total = np.nansum(table, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        leave_one_out = (total - table) / (count - 1)
+        deviation = np.where(present, np.nanmean(leave_one_out, axis=0) - leave_one_out, 0.0)
+        return np.sum(deviation ** 3, axis=0) / (6 * np.sum(deviation ** 2, axis=0) ** 1.5)
+
+
+def _column_quantiles(boot, levels):
+    """
+    Quantiles of each column of the bootstrap means at that column's levels (linear
+    interpolation, as numpy.quantile), leaving out NaN means: resamples that drew no
+    day on which the KPI is defined.
+
+    Args:
+        boot (numpy.ndarray): Resampled means, shape (resamples, columns).
+        levels (numpy.ndarray): Levels, shape (number of quantiles, columns).
+    """
+    ordered = np.sort(boot, axis=0)  # NaN sorts last
+    valid = np.sum(~np.isnan(boot), axis=0)
+    position = np.clip(levels, 0, 1) * np.maximum(valid - 1, 0)
+    below = np.floor(position).astype(int)
+    above = np.minimum(below + 1, np.maximum(valid - 1, 0))
+    fraction = position - below
+    columns = np.arange(boot.shape[1])
+    quantiles = ordered[below, columns] * (1 - fraction) + ordered[above, columns] * fraction
+    return np.where(valid >= 2, quantiles, np.nan)
+
+
+def bootstrap_intervals(table, names=None, method='bca', confidence=0.95, num_resamples=2000, seed=0, workers=1):
+    """
+    Percentile or BCa bootstrap intervals of the mean of every KPI of a replication x KPI table.
+
+    BCa corrects the percentile interval for bias (z0, from the share of resampled means
+    below the estimate) and skewness (the acceleration, from the jackknife).
+
+    Args:
+        table (numpy.ndarray): One row per replication, one column per KPI; NaN where undefined.
+        names (list, optional): Column names. Defaults to kpis.DAY_KPI_NAMES.
+        method (str, optional): 'percentile' or 'bca'. Defaults to 'bca'.
+        confidence (float, optional): Level of the intervals. Defaults to 0.95.
+        num_resamples (int, optional): Bootstrap resamples. Defaults to 2000.
+        seed (int, optional): Seed of the resampling. Defaults to 0.
+        workers (int, optional): Worker processes. Defaults to 1.
+
+    Returns:
+        dict: KPI name -> {'n', 'mean', 'low', 'high'}; KPIs defined on fewer than 2 days get NaN bounds.
+    """
+    from scipy.special import ndtr, ndtri
+
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}.")
+    table = np.asarray(table, dtype=float)
+    names = names or DAY_KPI_NAMES
+    count = (~np.isnan(table)).sum(axis=0)
+    with warnings.catch_warnings():
+        # KPIs undefined on every day (e.g. AI waits without AI) have no mean
+        warnings.simplefilter('ignore', RuntimeWarning)
+        estimate = np.nanmean(table, axis=0)
+        acceleration = np.nan_to_num(_jackknife_acceleration(table))
+    boot = bootstrap_means(table, num_resamples, seed, workers)
+    tail = (1 - confidence) / 2
+    levels = np.array([np.full(table.shape[1], tail), np.full(table.shape[1], 1 - tail)])
+    if method == 'bca':
+        valid = np.maximum(np.sum(~np.isnan(boot), axis=0), 1)
+        below = (np.sum(boot < estimate, axis=0) + 0.5 * np.sum(boot == estimate, axis=0)) / valid
+        z0 = ndtri(np.clip(below, 1 / (valid + 1), valid / (valid + 1)))
+        z = ndtri(levels)
+        levels = ndtr(z0 + (z0 + z) / (1 - acceleration * (z0 + z)))
+    low, high = _column_quantiles(boot, levels)
+    return {name: {'n': int(count[column]), 'mean': float(estimate[column]),
+                   'low': float(low[column]) if count[column] >= 2 else math.nan,
+                   'high': float(high[column]) if count[column] >= 2 else math.nan}
+            for column, name in enumerate(names)}
+
+
+def paired_difference_intervals(first, second, names=None, **kwargs):
+    """
+    Bootstrap intervals of the mean difference first - second of two scenarios simulated
+    on the same seeds (row i of both tables is the same seed), resampling seeds so that
+    the pairing (common random numbers) is kept. Takes the options of bootstrap_intervals.
+    """
+    first, second = np.asarray(first, dtype=float), np.asarray(second, dtype=float)
+    if first.shape != second.shape:
+        raise ValueError(f"Paired tables must have the same shape, got {first.shape} and {second.shape}.")
+    return bootstrap_intervals(first - second, names, **kwargs)
+
+
+def _kpi_tables(args):
+    """Replication x KPI tables per scenario, simulated or read from a KPI store, and their labels."""
+    if args.store:
+        from kpi_store import KpiStore
+
+        store = KpiStore(args.store)
+        tables = []
+        for index in range(len(store.scenarios)):
+            table = np.array(store.data[store.rows(index)])
+            table[np.asarray(store.done[store.rows(index)]) == 0] = np.nan
+            tables.append(table)
+        return tables, scenario_labels(store.scenarios)
+    from batch import BatchRunner
+
+    scenarios = load_scenarios(args.scenario) if args.scenario else [resolve_scenario(s) for s in SCENARIO_GRID]
+    seeds = list(range(args.first_seed, args.first_seed + args.num_replications))
+    with BatchRunner(workers=args.workers) as runner:
+        kpis = runner.run(scenarios, seeds)
+    return list(kpis), scenario_labels(scenarios)
+
+
+def run_bootstrap():
+    """
+    Command line entry point: bootstrap CIs of every day KPI per scenario, and of the
+    paired differences to a reference scenario.
+    """
+    parser = argparse.ArgumentParser(description="Vectorized bootstrap intervals of day KPIs.")
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='Scenario file (default: every valid workflow, scenarios.SCENARIO_GRID)')
+    parser.add_argument('--store', type=str, default=None, help='Read the days from a kpi_store folder instead')
+    parser.add_argument('--num_replications', type=int, default=200, help='Days per scenario (on shared seeds)')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--method', type=str, default='bca', choices=METHODS, help='Interval method')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level')
+    parser.add_argument('--num_resamples', type=int, default=2000, help='Bootstrap resamples')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the resampling')
+    parser.add_argument('--reference', type=str, default=None,
+                        help='Scenario the others are compared to (name or index; default: the first)')
+    parser.add_argument('--kpis', nargs='+', default=REPORT_KPIS, choices=DAY_KPI_NAMES,
+                        help='KPIs to print (all are computed and written to --out)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes (simulation and resampling)')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file with the intervals of all KPIs')
+    args = parser.parse_args()
+
+    tables, labels = _kpi_tables(args)
+    if args.reference is None:
+        reference = 0
+    elif args.reference in labels:
+        reference = labels.index(args.reference)
+    else:
+        reference = int(args.reference)
+    options = {'method': args.method, 'confidence': args.confidence, 'num_resamples': args.num_resamples,
+               'seed': args.seed, 'workers': args.workers}
+
+    start = time.perf_counter()
+    results = {'method': args.method, 'confidence': args.confidence, 'num_resamples': args.num_resamples,
+               'reference': labels[reference], 'scenarios': {}, 'differences': {}}
+    for label, table in zip(labels, tables):
+        results['scenarios'][label] = bootstrap_intervals(table, **options)
+    for label, table in zip(labels, tables):
+        if label != labels[reference]:
+            results['differences'][label] = paired_difference_intervals(table, tables[reference], **options)
+    seconds = time.perf_counter() - start
+    print(f"{args.method} {args.confidence:.0%} intervals, {args.num_resamples} resamples, "
+          f"{len(labels)} scenarios x {len(DAY_KPI_NAMES)} KPIs in {seconds:.2f} s")
+
+    for name in args.kpis:
+        print(f"\n{name}")
+        print(f"{'scenario':<28}{'days':>6}{'mean':>10}{'CI':>22}{'minus ' + labels[reference]:>34}")
+        for label in labels:
+            s = results['scenarios'][label][name]
+            interval = f"[{s['low']:.4f}, {s['high']:.4f}]"
+            line = f"{label:<28}{s['n']:6d}{s['mean']:10.4f}{interval:>22}"
+            if label in results['differences']:
+                d = results['differences'][label][name]
+                line += f"{d['mean']:+12.4f} [{d['low']:+.4f}, {d['high']:+.4f}]"
+            print(line)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote the intervals to {args.out}")
+
+
+if __name__ == "__main__":
+    run_bootstrap()
@@ -0,0 +1,306 @@
+import argparse
+import concurrent.futures
+import copy
+import gc
+import hashlib
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+from batch import chunk_seeds
+from kpis import DAY_KPI_NAMES, day_kpis
+from scenarios import AI_TIMES, CLINIC_HOURS, load_scenarios, resolve_scenario, scenario_name
+
+# Scenario fields that only decide which arriving patients get the AI workflow.
+AI_FIELDS = ['wf_1ss', 'ai_time', 'ai_schedules']
+# Days snapshotted together: each forked copy finishes all of them for its variant,
+# so the cost of a fork is shared instead of paid again for every day.
+SEEDS_PER_FORK = 16
+
+
+def ai_hours(scenario):
+    """Clock hours in which arriving patients get the AI workflow."""
+    if not scenario['wf_1ss']:
+        return []
+    return sorted(scenario['ai_schedules'][scenario['ai_time']]['hours'])
+
+
+def prefix_key(scenario, branch_time):
+    """
+    Hash of everything that shapes a day up to `branch_time` (simulation hours).
+
+    Scenarios with equal keys simulate identical days until branch_time on the same
+    seed: they may only differ in the AI schedule of the clock hours that start at or
+    after branch_time, and in the pct_dx_after_ai distribution while AI is off before it.
+    A branched day draws pct_dx_after_ai once, so the variants that use AI must also
+    share its distribution (see shared_pct).
+    """
+    scenario = copy.deepcopy(resolve_scenario(scenario))
+    hours = [hour for hour in ai_hours(scenario) if hour - CLINIC_HOURS[0] < branch_time]
+    before_branch = {'hours': hours, 'pct_dx_after_ai': None}
+    if hours:
+        before_branch['pct_dx_after_ai'] = scenario['ai_schedules'][scenario['ai_time']]['pct_dx_after_ai']
+    for field in ['name'] + AI_FIELDS:
+        scenario.pop(field)
+    scenario['ai_before_branch'] = before_branch
+    canonical = json.dumps(scenario, sort_keys=True, separators=(',', ':'), default=float)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def shared_pct(scenarios):
+    """True if the scenarios that use AI all draw pct_dx_after_ai from the same distribution."""
+    dists = {json.dumps(scenario['ai_schedules'][scenario['ai_time']]['pct_dx_after_ai'])
+             for scenario in map(resolve_scenario, scenarios) if ai_hours(scenario)}
+    return len(dists) <= 1
+
+
+def shared_prefix_time(scenarios):
+    """
+    Latest whole clock hour (as simulation time) up to which all scenarios simulate
+    the same day; 0 if they already differ in the first hour or outside the AI fields,
+    or if their AI schedules draw pct_dx_after_ai from different distributions.
+    """
+    if not shared_pct(scenarios):
+        return 0
+    shared = 0
+    for branch_time in range(1, len(CLINIC_HOURS)):
+        if len({prefix_key(scenario, branch_time) for scenario in scenarios}) > 1:
+            break
+        shared = branch_time
+    return shared
+
+
+def _finish(context, variant):
+    context.switch_ai(variant)
+    timestamps_list, end_time = context.run()
+    return timestamps_list, end_time, context.num_arrivals
+
+
+def _fork_variant(contexts, variant):
+    """
+    Starts finishing the days of `contexts` for one variant in a forked copy of this process.
+
+    Returns:
+        tuple: (pid, read_fd) to pass to _collect().
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        # the copy lives for a few days; a collection would touch, and so copy, every page
+        gc.disable()
+        status = 0
+        try:
+            result = [_finish(context, variant) for context in contexts]
+        except BaseException as error:
+            result, status = error, 1
+        with os.fdopen(write_fd, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os._exit(status)
+    os.close(write_fd)
+    return pid, read_fd
+
+
+def _collect(pid, read_fd):
+    with os.fdopen(read_fd, 'rb') as f:
+        result = pickle.load(f)
+    os.waitpid(pid, 0)
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def _check_variants(variants, branch_time):
+    variants = [resolve_scenario(variant) for variant in variants]
+    if branch_time is None:
+        branch_time = shared_prefix_time(variants)
+    if len({prefix_key(variant, branch_time) for variant in variants}) > 1:
+        raise ValueError(f"The variants differ before branch_time {branch_time}; only the AI settings of later "
+                         f"hours may differ.")
+    if branch_time > 0 and not shared_pct(variants):
+        raise ValueError("The variants that use AI draw pct_dx_after_ai from different distributions, so they "
+                         "cannot branch from one day.")
+    return variants, branch_time
+
+
+def _prefix_variant(variants):
+    # a variant that uses AI, so that patients after the branch can take the AI workflow with
+    # the day's pct_dx_after_ai, which is the same for every variant that uses AI
+    return next((variant for variant in variants if ai_hours(variant)), variants[0])
+
+
+def _branch_days(contexts, variants, seeds, branch_time):
+    """
+    Finishes the days of several seeds for every variant from one snapshot of all of them.
+
+    Each context simulates the prefix of one seed; then one forked copy per variant but
+    the last finishes all the days, so the fixed cost of a fork is shared by len(seeds) days.
+
+    Returns:
+        list: Per seed, one (timestamps_list, end_time, num_arrivals) tuple per variant.
+    """
+    contexts = contexts[:len(seeds)]
+    for context, seed in zip(contexts, seeds):
+        context.reset(seed)
+        context.switch_ai(variants[0])
+        context.advance(branch_time)
+    # one copy at a time (cores are better spent on parallel seeds); this process continues
+    # with the last variant, and reset() restores the contexts' own AI settings
+    results = [_collect(*_fork_variant(contexts, variant)) for variant in variants[:-1]]
+    results.append([_finish(context, variants[-1]) for context in contexts])
+    return [list(days) for days in zip(*results)]
+
+
+def _replay_day(contexts, variants, seed):
+    results = []
+    for context, variant in zip(contexts, variants):
+        context.reset(seed)
+        results.append(_finish(context, variant))
+    return results
+
+
+def run_branches(variants, seed, branch_time=None, fork=None):
+    """
+    Simulates one day of several scenario variants that share a common prefix.
+
+    The shared part of the day is simulated once; at branch_time the whole simulation
+    state (pending events, resource queues, in-flight patients, random streams) is
+    snapshotted by forking the process, and each copy applies one variant's AI
+    settings and finishes the day. The results are identical to simulating every
+    variant from the start with the same seed. Where fork is not available the
+    prefix is replayed for every variant instead.
+
+    Only the prefix is saved: V variants that share a fraction f of the day cost
+    about 1 + (V - 1)(1 - f) days instead of V, e.g. 1.5 instead of 2 for none vs
+    afternoon. branch_kpis() snapshots SEEDS_PER_FORK days per fork, so that the
+    fork itself costs little next to that.
+
+    Variants are simulated in contexts that draw pct_dx_after_ai from its own stream
+    (see run_simulation.draw_pct_dx_after_ai), so that it does not shift the other
+    draws of AI variants; their days differ from those of run_simulation on a seed.
+
+    Args:
+        variants (list): Scenario dicts that only differ in their AI settings after branch_time
+                         (see prefix_key).
+        seed (int): Seed of the day.
+        branch_time (float, optional): Simulation time of the snapshot, in hours since opening.
+                                       Defaults to the latest time all variants share.
+        fork (bool, optional): Snapshot by forking. Defaults to True where os.fork exists.
+
+    Returns:
+        list: One (timestamps_list, end_time, num_arrivals) tuple per variant.
+    """
+    from run_simulation import get_context
+
+    variants, branch_time = _check_variants(variants, branch_time)
+    if fork is None:
+        fork = hasattr(os, 'fork')
+    if not fork or branch_time <= 0 or len(variants) == 1:
+        return _replay_day([get_context(variant, pct_stream=True) for variant in variants], variants, seed)
+    return _branch_days([get_context(_prefix_variant(variants), pct_stream=True)], variants, [seed], branch_time)[0]
+
+
+def _branch_chunk(variants, seeds, branch_time, fork, seeds_per_fork=SEEDS_PER_FORK):
+    from run_simulation import SimulationContext, get_context
+
+    variants, branch_time = _check_variants(variants, branch_time)
+    if fork is None:
+        fork = hasattr(os, 'fork')
+    if not fork or branch_time <= 0 or len(variants) == 1:
+        contexts = [get_context(variant, pct_stream=True) for variant in variants]
+        days = [_replay_day(contexts, variants, seed) for seed in seeds]
+    else:
+        # contexts of their own: each holds a different seed's day at the snapshot
+        prefix = _prefix_variant(variants)
+        contexts = [SimulationContext(prefix, pct_stream=True) for _ in range(min(seeds_per_fork, len(seeds)))]
+        days = []
+        for i in range(0, len(seeds), seeds_per_fork):
+            days.extend(_branch_days(contexts, variants, seeds[i:i + seeds_per_fork], branch_time))
+    rows = []
+    for seed_days in days:
+        row = []
+        for timestamps_list, _, num_arrivals in seed_days:
+            kpis = day_kpis(timestamps_list, num_arrivals=num_arrivals)
+            row.append([kpis[name] for name in DAY_KPI_NAMES])
+        rows.append(row)
+    return rows
+
+
+def branch_kpis(variants, seeds, branch_time=None, fork=None, workers=1):
+    """
+    Day-level KPIs of branched variants on common seeds, seeds split across worker processes.
+
+    Returns:
+        numpy.ndarray: Shape (len(variants), len(seeds), len(DAY_KPI_NAMES)), like BatchRunner.run().
+    """
+    variants = [resolve_scenario(variant) for variant in variants]
+    if branch_time is None:
+        branch_time = shared_prefix_time(variants)
+    seeds = list(seeds)
+    if workers == 1:
+        rows = _branch_chunk(variants, seeds, branch_time, fork)
+    else:
+        chunks = chunk_seeds(seeds, workers)
+        repeat = [None] * len(chunks)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_branch_chunk, [variants for _ in repeat], chunks, [branch_time for _ in repeat],
+                               [fork for _ in repeat])
+            rows = [row for chunk_rows in results for row in chunk_rows]
+    return np.array(rows, dtype=float).transpose(1, 0, 2)
+
+
+def run_branching():
+    """
+    Command line entry point: compares AI schedules on common seeds, simulating their shared prefix once.
+    """
+    parser = argparse.ArgumentParser(description="Compare scenario variants that branch from a shared morning.")
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='Scenario file with the variants (default: 1SS with each of --ai_times)')
+    parser.add_argument('--ai_times', nargs='+', default=['none', 'afternoon'], choices=AI_TIMES,
+                        help='AI times to compare when no scenario file is given')
+    parser.add_argument('--branch_time', type=float, default=None,
+                        help='Snapshot time in hours since opening (default: the latest time the variants share)')
+    parser.add_argument('--num_replications', type=int, default=20, help='Days (common seeds) per variant')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes over seeds')
+    parser.add_argument('--no_fork', action='store_true', help='Replay the prefix instead of forking')
+    parser.add_argument('--compare', action='store_true',
+                        help='Also simulate every variant from the start, check the results match and time both')
+    args = parser.parse_args()
+
+    if args.scenario:
+        variants = load_scenarios(args.scenario)
+    else:
+        variants = [resolve_scenario({'wf_1ss': True, 'ai_time': ai_time}) for ai_time in args.ai_times]
+    branch_time = shared_prefix_time(variants) if args.branch_time is None else args.branch_time
+    seeds = list(range(args.first_seed, args.first_seed + args.num_replications))
+    print(f"{len(variants)} variants branch at {CLINIC_HOURS[0] + branch_time:g}:00 (t = {branch_time:g} h)")
+
+    if args.compare:
+        # one day of each first, so neither timing includes setting up the contexts
+        branch_kpis(variants, seeds[:1], 0)
+    start = time.perf_counter()
+    kpis = branch_kpis(variants, seeds, branch_time, fork=not args.no_fork, workers=args.workers)
+    branched_seconds = time.perf_counter() - start
+
+    columns = ['mean_total_system_time', 'p90_total_system_time', 'n_patients']
+    print(f"\n{'variant':<28}" + ''.join(f"{name:>24}" for name in columns))
+    for variant, days in zip(variants, kpis):
+        print(f"{scenario_name(variant):<28}" + ''.join(f"{np.nanmean(days[:, DAY_KPI_NAMES.index(name)]):24.4f}"
+                                                          for name in columns))
+    print(f"\nBranched: {branched_seconds:.2f} s")
+
+    if args.compare:
+        start = time.perf_counter()
+        full = branch_kpis(variants, seeds, 0, workers=args.workers)
+        full_seconds = time.perf_counter() - start
+        same = np.array_equal(np.nan_to_num(kpis, nan=-1.0), np.nan_to_num(full, nan=-1.0))
+        print(f"From the start: {full_seconds:.2f} s ({full_seconds / branched_seconds:.2f}x); "
+              f"results {'identical' if same else 'DIFFER'}")
+
+
+if __name__ == "__main__":
+    run_branching()
@@ -1,11 +1,50 @@
 import math
-import pandas as pd
 from params import exam_type_prob
-from utils import MriGuidedBiopsyWorkflow, CheckinStaffHandler, MriOnlyWorkflow, PublicWaitRoomHandler, \
+from utils import NA, MriGuidedBiopsyWorkflow, CheckinStaffHandler, MriOnlyWorkflow, PublicWaitRoomHandler, \
     ScreenUSWorkflow, MammoGuidedBiopsyWorkflow, ChangeRoomHandler, USGuidedBiopsyWorkflow, DxUSWorkflow, \
     DxMammoWorkflow, DxMammoUSWorkflow, ScreenMammoDxUSWorkflow, ScreenMammoDxMammoWorkflow, \
     ScreenMammoDxMammoUSWorkflow, ScreenMammoNoDxWorkflow, GownedWaitRoomHandler, ConsentRoomHandler
 
+# The columns of a patient's log, in order: every patient has all of them,
+# NaN for the steps of other paths.
+LOG_COLUMNS = [
+    'patient_id', 'patient_type', 'arrival_ts',
+    'got_checkin_staff_ts', 'release_checkin_staff_ts',
+    'got_change_room_ts', 'release_change_room_ts',
+    'got_public_wait_room_ts', 'release_public_wait_room_ts',
+    'got_consent_staff_ts', 'release_consent_staff_ts',
+    'got_gowned_wait_room_ts', 'release_gowned_wait_room_ts',
+    'got_screen_scanner_ts', 'release_screen_scanner_ts',
+    'got_dx_scanner_after_ai_ts', 'release_dx_scanner_after_ai_ts',
+    'got_us_machine_after_ai_ts', 'release_us_machine_after_ai_ts',
+    'got_dx_scanner_before_us_after_ai_ts', 'release_dx_scanner_before_us_after_ai_ts',
+    'got_us_machine_after_dx_scanner_after_ai_ts', 'release_dx_scanner_us_machine_after_ai_ts',
+    'begin_ai_assess_ts', 'end_ai_assess_ts',
+    'got_dx_scanner_ts', 'release_dx_scanner_ts',
+    'got_us_machine_ts', 'release_us_machine_ts',
+    'got_dx_scanner_before_us_ts', 'release_dx_scanner_before_us_ts',
+    'got_us_machine_after_dx_scanner_ts', 'release_dx_scanner_us_machine_ts',
+    'got_us_machine_bx_ts', 'release_us_machine_after_bx_ts',
+    'got_scanner_bx_ts',
+    'got_scanner_after_us_bx_ts', 'release_scanner_after_post_bx_mammo_ts',
+    'got_screen_us_machine_ts', 'release_screen_us_machine_ts',
+    'got_scanner_after_mri_bx_ts',
+    'got_mri_machine_ts', 'release_mri_machine_ts',
+    'got_checkout_change_room_ts', 'release_checkout_change_room_ts',
+    'get_rad_dx_mammo_ts', 'release_rad_dx_mammo_ts',
+    'get_rad_dx_us_ts', 'release_rad_dx_us_ts',
+    'get_rad_dx_mammo_us_mammo_ts', 'release_rad_dx_mammo_us_mammo_ts',
+    'get_rad_dx_mammo_us_us_ts', 'release_rad_dx_mammo_us_us_ts',
+    'get_rad_us_bx_ts', 'release_rad_us_bx_ts',
+    'get_rad_mri_bx_ts', 'release_rad_mri_bx_ts',
+    'get_rad_mammo_bx_ts', 'release_rad_mammo_bx_ts',
+    'get_rad_dx_mammo_us_mammo_after_ai_ts', 'release_rad_dx_mammo_us_mammo_after_ai_ts',
+    'get_rad_dx_mammo_us_us_after_ai_ts', 'release_rad_dx_mammo_us_us_after_ai_ts',
+    'get_rad_dx_mammo_after_ai_ts', 'release_rad_dx_mammo_after_ai_ts',
+    'get_rad_dx_us_after_ai_ts', 'release_rad_dx_us_after_ai_ts',
+    'exit_system_ts',
+]
+
 
 class MammographyClinicWorkflow:
     """
@@ -38,7 +77,7 @@ class MammographyClinicWorkflow:
         number = self.rg.random()
 
         # Get exam type distribution based on current time
-        exam_type_distribution = exam_type_prob(arrival_ts)
+        exam_type_distribution = exam_type_prob(arrival_ts, self.clinic.exam_dicts)
 
         # Calculate exam percentage based on exam type
         pct_screen_mammo_scheduled_baseline = list(exam_type_distribution.values())[0]
@@ -74,46 +113,10 @@ class MammographyClinicWorkflow:
                     pct_screen_mammo_scheduled_baseline * self.pct_dx_after_ai * 0.15
             )
 
-        # Initialize all timestamps to pd.NA for this patient instance
-        timestamps = {
-            'patient_id': self.patient,
-            'patient_type': pd.NA,
-            'arrival_ts': arrival_ts,
-            'got_checkin_staff_ts': pd.NA, 'release_checkin_staff_ts': pd.NA,
-            'got_change_room_ts': pd.NA, 'release_change_room_ts': pd.NA,
-            'got_public_wait_room_ts': pd.NA, 'release_public_wait_room_ts': pd.NA,
-            'got_consent_staff_ts': pd.NA, 'release_consent_staff_ts': pd.NA,
-            'got_gowned_wait_room_ts': pd.NA, 'release_gowned_wait_room_ts': pd.NA,
-            'got_screen_scanner_ts': pd.NA, 'release_screen_scanner_ts': pd.NA,
-            'got_dx_scanner_after_ai_ts': pd.NA, 'release_dx_scanner_after_ai_ts': pd.NA,
-            'got_us_machine_after_ai_ts': pd.NA, 'release_us_machine_after_ai_ts': pd.NA,
-            'got_dx_scanner_before_us_after_ai_ts': pd.NA, 'release_dx_scanner_before_us_after_ai_ts': pd.NA,
-            'got_us_machine_after_dx_scanner_after_ai_ts': pd.NA, 'release_dx_scanner_us_machine_after_ai_ts': pd.NA,
-            'begin_ai_assess_ts': pd.NA, 'end_ai_assess_ts': pd.NA,
-            'got_dx_scanner_ts': pd.NA, 'release_dx_scanner_ts': pd.NA,
-            'got_us_machine_ts': pd.NA, 'release_us_machine_ts': pd.NA,
-            'got_dx_scanner_before_us_ts': pd.NA, 'release_dx_scanner_before_us_ts': pd.NA,
-            'got_us_machine_after_dx_scanner_ts': pd.NA, 'release_dx_scanner_us_machine_ts': pd.NA,
-            'got_us_machine_bx_ts': pd.NA, 'release_us_machine_after_bx_ts': pd.NA,
-            'got_scanner_bx_ts': pd.NA,
-            'got_scanner_after_us_bx_ts': pd.NA, 'release_scanner_after_post_bx_mammo_ts': pd.NA,
-            'got_screen_us_machine_ts': pd.NA, 'release_screen_us_machine_ts': pd.NA,
-            'got_scanner_after_mri_bx_ts': pd.NA,
-            'got_mri_machine_ts': pd.NA, 'release_mri_machine_ts': pd.NA,
-            'got_checkout_change_room_ts': pd.NA, 'release_checkout_change_room_ts': pd.NA,
-            'get_rad_dx_mammo_ts': pd.NA, 'release_rad_dx_mammo_ts': pd.NA,
-            'get_rad_dx_us_ts': pd.NA, 'release_rad_dx_us_ts': pd.NA,
-            'get_rad_dx_mammo_us_mammo_ts': pd.NA, 'release_rad_dx_mammo_us_mammo_ts': pd.NA,
-            'get_rad_dx_mammo_us_us_ts': pd.NA, 'release_rad_dx_mammo_us_us_ts': pd.NA,
-            'get_rad_us_bx_ts': pd.NA, 'release_rad_us_bx_ts': pd.NA,
-            'get_rad_mri_bx_ts': pd.NA, 'release_rad_mri_bx_ts': pd.NA,
-            'get_rad_mammo_bx_ts': pd.NA, 'release_rad_mammo_bx_ts': pd.NA,
-            'get_rad_dx_mammo_us_mammo_after_ai_ts': pd.NA, 'release_rad_dx_mammo_us_mammo_after_ai_ts': pd.NA,
-            'get_rad_dx_mammo_us_us_after_ai_ts': pd.NA, 'release_rad_dx_mammo_us_us_after_ai_ts': pd.NA,
-            'get_rad_dx_mammo_after_ai_ts': pd.NA, 'release_rad_dx_mammo_after_ai_ts': pd.NA,
-            'get_rad_dx_us_after_ai_ts': pd.NA, 'release_rad_dx_us_after_ai_ts': pd.NA,
-            'exit_system_ts': pd.NA
-        }
+        # Initialize all timestamps to NA for this patient instance
+        timestamps = dict.fromkeys(LOG_COLUMNS, NA)
+        timestamps['patient_id'] = self.patient
+        timestamps['arrival_ts'] = arrival_ts
 
         # Handle common steps
         yield self.env.process(CheckinStaffHandler(self.env, self.patient, self.clinic, timestamps).run())
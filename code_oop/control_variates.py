@@ -0,0 +1,231 @@
+import argparse
+import concurrent.futures
+import json
+import math
+
+import numpy as np
+
+from batch import chunk_seeds
+from kpis import DAY_KPI_NAMES, day_kpis
+from params import exam_type_prob
+from run_simulation import ContextCache, SimulationContext
+from scenarios import load_scenarios, resolve_scenario, scenario_hash, scenario_name
+
+# Covariates of a day, each the realized count minus its expectation given the day so
+# far, so each has mean 0 exactly, whatever the arrival process caps or the queues do:
+# - arrivals: interarrival draws minus the draws the time they took would predict
+#   (sum of 1 - iat / mean iat; zero mean by Wald's identity), i.e. the arrival surplus,
+# - diagnostic_patients: patients with an exam other than a plain screening mammo,
+#   minus the sum of those exams' shares in the exam mix of each arrival's hour,
+# - same_day_workups: screening patients turned into same-day dx workups by AI,
+#   minus the sum of screen share x pct_dx_after_ai over arrivals while AI was on,
+# - service_surplus: service-time draws minus their means, in hours (zero mean like arrivals).
+COVARIATE_NAMES = ['arrivals', 'diagnostic_patients', 'same_day_workups', 'service_surplus']
+REPORT_KPIS = ['mean_total_system_time', 'p50_total_system_time', 'p90_total_system_time',
+               'max_total_system_time', 'n_patients']
+
+
+class CovariateRecorder(object):
+    """
+    Wraps the Generator of a SimulationContext and records the draws behind the
+    covariates: the interarrival times of run_clinic, the exam-type uniform of each
+    arrival and the service times of the clinic. All draws are passed through, so the
+    day is the same as without it.
+    """
+    def __init__(self, context):
+        self.context = context
+        self.rg = context.rg
+        self.interarrival = []
+        self.exam_draws = []
+        self.service_surplus = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.rg, name)
+
+    def clear(self):
+        self.interarrival = []
+        self.exam_draws = []
+        self.service_surplus = 0.0
+
+    def exponential(self, scale=1.0):
+        value = self.rg.exponential(scale)
+        self.interarrival.append(value / scale)
+        return value
+
+    def normal(self, loc=0.0, scale=1.0):
+        value = self.rg.normal(loc, scale)
+        self.service_surplus += value - loc
+        return value
+
+    def random(self):
+        value = self.rg.random()
+        self.exam_draws.append((self.context.env.now, value))
+        return value
+
+    def covariates(self):
+        """The day's covariates, in COVARIATE_NAMES order."""
+        context = self.context
+        arrivals = len(self.interarrival) - sum(self.interarrival)
+        diagnostic = same_day = 0.0
+        for arrival_ts, number in self.exam_draws:
+            # the first exam type is the plain screening mammo (see clinic_wf_1ss)
+            screen = next(iter(exam_type_prob(arrival_ts, context.clinic.exam_dicts).values()))
+            diagnostic += (number > screen) - (1 - screen)
+            hour = math.floor(arrival_ts) + 7
+            if context.wf_1ss and context.ai_on_dict[hour]:
+                # AI turns the top pct_dx_after_ai of the screening share into same-day workups
+                low = min(max(screen * (1 - context.pct_dx_after_ai), 0.0), screen)
+                same_day += (low < number <= screen) - (screen - low)
+        return [arrivals, diagnostic, same_day, self.service_surplus]
+
+
+_recorders = ContextCache()
+
+
+def covariate_recorder(scenario):
+    """
+    This process's CovariateRecorder for a scenario, with a SimulationContext of its own
+    that draws through it; created on first use.
+    """
+    def create():
+        # a context of its own: get_context's may be shared with plain runs in this process
+        context = SimulationContext(scenario)
+        context.rg = context.clinic.rg = CovariateRecorder(context)
+        return context.rg
+
+    return _recorders.get(scenario_hash(scenario), create)
+
+
+def _covariate_chunk(scenario, seeds):
+    recorder = covariate_recorder(scenario)
+    context = recorder.context
+    rows = []
+    for seed in seeds:
+        context.reset(seed)
+        recorder.clear()
+        timestamps_list, _ = context.run()
+        kpis = day_kpis(timestamps_list, num_arrivals=context.num_arrivals)
+        rows.append(([kpis[name] for name in DAY_KPI_NAMES], recorder.covariates()))
+    return rows
+
+
+def covariate_kpis(scenario, seeds, workers=1):
+    """
+    Simulates a scenario on `seeds` and returns day KPIs with the day's covariates.
+
+    Returns:
+        tuple: (kpis with shape (len(seeds), len(DAY_KPI_NAMES)),
+                covariates with shape (len(seeds), len(COVARIATE_NAMES))).
+    """
+    scenario = resolve_scenario(scenario)
+    seeds = list(seeds)
+    if workers == 1:
+        rows = _covariate_chunk(scenario, seeds)
+    else:
+        chunks = chunk_seeds(seeds, workers)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_covariate_chunk, [scenario] * len(chunks), chunks)
+            rows = [row for chunk_rows in results for row in chunk_rows]
+    return np.array([row[0] for row in rows], dtype=float), np.array([row[1] for row in rows], dtype=float)
+
+
+def cv_estimate(y, covariates, confidence=0.95):
+    """
+    Control-variate estimate of the mean of `y` with covariates of known mean 0.
+
+    The estimate is the intercept of the least-squares fit of y on the covariates,
+    i.e. mean(y) - beta' mean(covariates); its interval uses the residual variance
+    with n - q - 1 degrees of freedom. Covariates that are constant (e.g. same-day
+    workups without AI) are left out. Days where y is NaN are dropped.
+
+    Returns:
+        dict: mean, half_width, plain_mean, plain_half_width, beta (per covariate, 0 if
+              left out), variance_reduction (plain over adjusted variance of the mean) and
+              equivalent_replications (plain days needed for the same half width).
+    """
+    from scipy import stats
+
+    keep = ~np.isnan(y)
+    y, covariates = y[keep], covariates[keep]
+    n = len(y)
+    used = np.flatnonzero(covariates.std(axis=0) > 0)
+    plain_var = np.var(y, ddof=1) / n
+    plain_half = stats.t.ppf(0.5 + confidence / 2, n - 1) * math.sqrt(plain_var)
+
+    design = np.column_stack([np.ones(n), covariates[:, used]])
+    dof = n - design.shape[1]
+    if dof < 2:
+        raise ValueError(f"{n} days are too few for {len(used)} covariates.")
+    coef, _, _, _ = np.linalg.lstsq(design, y, rcond=None)
+    residuals = y - design @ coef
+    cv_var = residuals @ residuals / dof * np.linalg.inv(design.T @ design)[0, 0]
+    beta = np.zeros(covariates.shape[1])
+    beta[used] = coef[1:]
+    variance_reduction = plain_var / cv_var if cv_var > 0 else math.inf
+    return {
+        'mean': float(coef[0]),
+        'half_width': float(stats.t.ppf(0.5 + confidence / 2, dof) * math.sqrt(cv_var)),
+        'plain_mean': float(y.mean()),
+        'plain_half_width': float(plain_half),
+        'beta': beta.tolist(),
+        'variance_reduction': float(variance_reduction),
+        'equivalent_replications': float(n * variance_reduction),
+    }
+
+
+def cv_summary(kpis, covariates, names=None, confidence=0.95):
+    """
+    cv_estimate for each of `names` (default: all day KPIs) from covariate_kpis() output,
+    leaving out KPIs that are constant or undefined on too many days (e.g. AI waits without AI).
+    """
+    summary = {}
+    for name in names or DAY_KPI_NAMES:
+        y = kpis[:, DAY_KPI_NAMES.index(name)]
+        present = y[~np.isnan(y)]
+        if len(present) > covariates.shape[1] + 2 and present.std() > 0:
+            summary[name] = cv_estimate(y, covariates, confidence)
+    return summary
+
+
+def run_control_variates():
+    """
+    Command line entry point: day KPIs of scenarios with control-variate adjusted means and CIs.
+    """
+    parser = argparse.ArgumentParser(description="Control-variate estimates of day KPIs.")
+    parser.add_argument('--scenario', type=str, default=None, help='Scenario file (default: the baseline scenario)')
+    parser.add_argument('--kpis', nargs='+', default=REPORT_KPIS, choices=DAY_KPI_NAMES, help='Day KPIs to report')
+    parser.add_argument('--num_replications', type=int, default=50, help='Days per scenario')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the intervals')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file with the estimates of every KPI')
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenario) if args.scenario else [resolve_scenario({})]
+    seeds = range(args.first_seed, args.first_seed + args.num_replications)
+    results = {}
+    for scenario in scenarios:
+        kpis, covariates = covariate_kpis(scenario, seeds, args.workers)
+        summary = cv_summary(kpis, covariates, confidence=args.confidence)
+        results[scenario_name(scenario)] = summary
+        print(f"\n{scenario_name(scenario)} ({args.num_replications} days); "
+              f"covariates: {', '.join(COVARIATE_NAMES)}")
+        print(f"{'KPI':<26}{'plain mean':>12}{'+/-':>9}{'CV mean':>10}{'+/-':>9}{'var. reduction':>16}"
+              f"{'plain days for same CI':>24}")
+        for name in args.kpis:
+            if name not in summary:
+                print(f"{name:<26}{'(constant or undefined on most days)':>56}")
+                continue
+            estimate = summary[name]
+            print(f"{name:<26}{estimate['plain_mean']:12.4f}{estimate['plain_half_width']:9.4f}"
+                  f"{estimate['mean']:10.4f}{estimate['half_width']:9.4f}{estimate['variance_reduction']:15.2f}x"
+                  f"{estimate['equivalent_replications']:24.0f}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'covariates': COVARIATE_NAMES, 'seeds': list(seeds), 'scenarios': results}, f, indent=2)
+        print(f"\nWrote the estimates to {args.out}")
+
+
+if __name__ == "__main__":
+    run_control_variates()
@@ -0,0 +1,199 @@
+import argparse
+import concurrent.futures
+import importlib
+import json
+import os
+import sys
+import warnings
+
+import numpy as np
+
+from kpis import DAY_KPI_NAMES, day_kpis, patient_kpis
+from scenarios import SCENARIO_GRID, scenario_name
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Engine name -> (implementation folder, module, function). The function must accept
+# (wf_1ss, rad_change, rad_change_2, seed=..., ai_time=...) and return
+# (timestamps_list, end_time) without writing files. A faster engine is added by
+# putting its entry here or passing --engine name=folder:module:function.
+ENGINES = {
+    'code': (os.path.join(HERE, '..', 'code'), 'run_clinic', 'simulate_day'),
+    'code_oop': (HERE, 'run_simulation', 'simulate_day'),
+}
+
+_engine_function = None
+
+
+def _init_engine(impl_dir, module_name, function_name):
+    """
+    Process-pool initializer: makes one engine importable in this worker.
+
+    Engines use the same flat module names (utils, params, ...) and paths relative
+    to their folder, so a worker only ever hosts a single engine.
+    """
+    global _engine_function
+    warnings.simplefilter('ignore')
+    impl_dir = os.path.abspath(impl_dir)
+    sys.path[:] = [impl_dir] + [p for p in sys.path if os.path.abspath(p or '.') != HERE]
+    os.chdir(impl_dir)
+    module = importlib.import_module(module_name)
+    _engine_function = getattr(module, function_name)
+
+
+def _run_replication(scenario, seed):
+    timestamps_list, _ = _engine_function(scenario['wf_1ss'], scenario['rad_change'], scenario['rad_change_2'],
+                                          seed=seed, ai_time=scenario['ai_time'])
+    return seed, day_kpis(timestamps_list), patient_kpis(timestamps_list)['total_system_time']
+
+
+def run_engine(engine, scenarios, seeds, workers):
+    """
+    Runs every (scenario, seed) pair on one engine in a process pool.
+
+    Returns:
+        dict: scenario name -> {'days': (len(seeds), len(DAY_KPI_NAMES)) array in seed
+              order, 'los': pooled per-patient total_system_time array}.
+    """
+    impl_dir, module_name, function_name = ENGINES[engine]
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_engine,
+                                                initargs=(impl_dir, module_name, function_name)) as pool:
+        for scenario in scenarios:
+            futures = [pool.submit(_run_replication, scenario, seed) for seed in seeds]
+            by_seed = {}
+            los = []
+            for future in concurrent.futures.as_completed(futures):
+                seed, kpis, patient_los = future.result()
+                by_seed[seed] = [kpis[name] for name in DAY_KPI_NAMES]
+                los.append(patient_los)
+            results[scenario_name(scenario)] = {
+                'days': np.array([by_seed[seed] for seed in seeds], dtype=float),
+                'los': np.concatenate(los),
+            }
+    return results
+
+
+def holm_adjust(p_values):
+    """Holm-Bonferroni adjusted p-values (NaNs are left out and stay NaN)."""
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = np.full_like(p_values, np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    order = valid[np.argsort(p_values[valid])]
+    running_max = 0.0
+    for rank, index in enumerate(order):
+        running_max = max(running_max, (len(order) - rank) * p_values[index])
+        adjusted[index] = min(1.0, running_max)
+    return adjusted
+
+
+def compare_samples(results_a, results_b, alpha):
+    """
+    Runs two-sample tests on every day-level KPI and on the pooled patient LOS.
+
+    Day-level KPIs are independent across replications, so Kolmogorov-Smirnov and
+    Welch t-tests apply directly. The pooled per-patient LOS test treats patients
+    as independent, which they are not within a day; it is reported as a
+    distribution check but not counted towards divergence.
+
+    Returns:
+        list: One dict per metric with means, test statistics, Holm-adjusted p-value
+              and a 'divergent' flag.
+    """
+    from scipy import stats
+
+    rows = []
+    for k, name in enumerate(DAY_KPI_NAMES):
+        a = results_a['days'][:, k]
+        b = results_b['days'][:, k]
+        a = a[~np.isnan(a)]
+        b = b[~np.isnan(b)]
+        row = {'metric': name, 'mean_a': float(np.mean(a)) if len(a) else np.nan,
+               'mean_b': float(np.mean(b)) if len(b) else np.nan, 'n_a': len(a), 'n_b': len(b),
+               'ks_p': np.nan, 'welch_p': np.nan}
+        if len(a) >= 2 and len(b) >= 2 and not (np.ptp(a) == 0 and np.ptp(b) == 0 and a[0] == b[0]):
+            row['ks_p'] = float(stats.ks_2samp(a, b).pvalue)
+            row['welch_p'] = float(stats.ttest_ind(a, b, equal_var=False).pvalue)
+        rows.append(row)
+
+    # a metric diverges if either test rejects after Holm correction over all metrics
+    combined = [min(2 * min(r['ks_p'], r['welch_p']), 1.0) if not np.isnan(r['ks_p']) else np.nan for r in rows]
+    adjusted = holm_adjust(combined)
+    for row, p_adj in zip(rows, adjusted):
+        row['p_adjusted'] = float(p_adj)
+        row['divergent'] = bool(p_adj < alpha)
+
+    los_a, los_b = results_a['los'], results_b['los']
+    rows.append({'metric': 'patient_total_system_time (pooled)', 'mean_a': float(np.mean(los_a)),
+                 'mean_b': float(np.mean(los_b)), 'n_a': len(los_a), 'n_b': len(los_b),
+                 'ks_p': float(stats.ks_2samp(los_a, los_b).pvalue), 'welch_p': np.nan,
+                 'p_adjusted': np.nan, 'divergent': False})
+    return rows
+
+
+def print_report(engine_a, engine_b, scenario, rows, show_all):
+    divergent = [r for r in rows if r['divergent']]
+    print(f"\n== {scenario}: {engine_a} (a) vs {engine_b} (b), {len(divergent)} divergent metric(s)")
+    print(f"{'metric':<42}{'mean a':>10}{'mean b':>10}{'KS p':>10}{'Welch p':>10}{'Holm p':>10}")
+    for r in rows:
+        if not (show_all or r['divergent'] or 'pooled' in r['metric']):
+            continue
+        flag = '  DIVERGENT' if r['divergent'] else ''
+        print(f"{r['metric']:<42}{r['mean_a']:10.4f}{r['mean_b']:10.4f}"
+              f"{r['ks_p']:10.3g}{r['welch_p']:10.3g}{r['p_adjusted']:10.3g}{flag}")
+
+
+def run_equivalence():
+    """
+    Command line entry point: paired replications on two engines and a divergence report.
+    """
+    parser = argparse.ArgumentParser(description="Statistical equivalence check between simulation engines.")
+    parser.add_argument('--engines', nargs=2, default=['code', 'code_oop'], help='Two engine names to compare')
+    parser.add_argument('--engine', action='append', default=[],
+                        help='Register an extra engine as name=folder:module:function')
+    parser.add_argument('--num_replications', type=int, default=50, help='Paired replications (seeds) per scenario')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--scenario', nargs='+', default=None, help='Scenario names (default: the whole grid)')
+    parser.add_argument('--alpha', type=float, default=0.01, help='Family-wise significance level per scenario')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes per engine (default: all cores)')
+    parser.add_argument('--show_all', action='store_true', help='Print every metric, not just divergent ones')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file for the full report')
+    args = parser.parse_args()
+
+    for spec in args.engine:
+        name, target = spec.split('=', 1)
+        folder, module_name, function_name = target.split(':')
+        ENGINES[name] = (os.path.abspath(folder), module_name, function_name)
+
+    scenarios = SCENARIO_GRID
+    if args.scenario:
+        scenarios = [s for s in SCENARIO_GRID if scenario_name(s) in args.scenario]
+        if not scenarios:
+            raise ValueError(f"No scenario in the grid matches {args.scenario}.")
+
+    seeds = list(range(args.first_seed, args.first_seed + args.num_replications))
+    engine_a, engine_b = args.engines
+    results_a = run_engine(engine_a, scenarios, seeds, args.workers)
+    results_b = run_engine(engine_b, scenarios, seeds, args.workers)
+
+    report = {}
+    any_divergent = False
+    for scenario in scenarios:
+        name = scenario_name(scenario)
+        rows = compare_samples(results_a[name], results_b[name], args.alpha)
+        print_report(engine_a, engine_b, name, rows, args.show_all)
+        report[name] = rows
+        any_divergent = any_divergent or any(r['divergent'] for r in rows)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'engines': args.engines, 'seeds': seeds, 'alpha': args.alpha, 'scenarios': report},
+                      f, indent=2, default=float)
+        print(f"\nWrote report to {args.out}")
+
+    if any_divergent:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_equivalence()
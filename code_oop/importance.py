@@ -0,0 +1,292 @@
+import argparse
+import concurrent.futures
+import json
+import math
+import warnings
+from statistics import NormalDist
+
+import numpy as np
+
+from batch import chunk_seeds
+from kpis import patient_kpis
+from run_simulation import ContextCache, SimulationContext
+from scenarios import load_scenarios, resolve_scenario, scenario_hash, scenario_name
+
+# Services whose draws are shifted toward long times by default: the longest
+# procedures, which hold a scanner or US machine and a radiologist.
+LONG_SERVICES = ['get_mri_guided_bx', 'get_us_guided_bx', 'get_mammo_guided_bx']
+
+
+class TiltedSampler(object):
+    """
+    Draws a day's random inputs from a distribution tilted toward congestion and
+    keeps the log likelihood ratio of the plain over the tilted distribution.
+
+    Interarrival times are drawn with the arrival rate multiplied by arrival_tilt,
+    and the normal service times in service_shifts with their mean moved up by the
+    given number of SDs. Every other draw is passed through. For any outcome h of the
+    day, E_plain[h] = E_tilted[exp(log_weight) * h], whatever run_clinic's caps do
+    with the extra arrivals, because the weight covers every tilted draw. The sums
+    kept per day (draw counts, standardized draws) are what the cross-entropy update
+    of the tilt needs.
+
+    Args:
+        context (SimulationContext): Context whose generator and service draws to take over.
+        arrival_tilt (float): Factor on the arrival rates (1 = untilted).
+        service_shifts (dict): Service name -> mean shift in SDs; listed services are tracked
+                               for tuning even when their shift is 0.
+    """
+    def __init__(self, context, arrival_tilt, service_shifts):
+        self.context = context
+        self.rg = context.rg
+        self.arrival_tilt = arrival_tilt
+        self.service_shifts = service_shifts
+        self.services = sorted(service_shifts)
+        self.clear()
+        context.rg = self
+        # the instance attribute shadows MammoClinic._draw
+        context.clinic._draw = self._draw
+
+    def __getattr__(self, name):
+        return getattr(self.rg, name)
+
+    def clear(self):
+        self.log_weight = 0.0
+        self.arrival_draws = 0
+        self.arrival_sum = 0.0
+        self.service_draws = dict.fromkeys(self.services, 0)
+        self.service_sums = dict.fromkeys(self.services, 0.0)
+
+    def exponential(self, scale=1.0):
+        value = self.rg.exponential(scale / self.arrival_tilt)
+        self.log_weight += -math.log(self.arrival_tilt) + value * (self.arrival_tilt - 1) / scale
+        self.arrival_draws += 1
+        self.arrival_sum += value / scale
+        return value
+
+    def _draw(self, name):
+        mean, sd = self.context.clinic.service_times[name]
+        shift = self.service_shifts.get(name)
+        if shift is None:
+            return max(0.0, self.rg.normal(mean, sd))
+        value = self.rg.normal(mean + shift * sd, sd)
+        z = (value - mean) / sd
+        self.log_weight += -shift * z + shift * shift / 2
+        self.service_draws[name] += 1
+        self.service_sums[name] += z
+        # clamped after the draw, as in MammoClinic._draw
+        return max(0.0, value)
+
+    def statistics(self):
+        """Arrival draws and their standardized sum, then draws and z sum per tracked service."""
+        row = [self.arrival_draws, self.arrival_sum]
+        for name in self.services:
+            row += [self.service_draws[name], self.service_sums[name]]
+        return row
+
+
+# Columns of tilted_days() output before the sampler statistics.
+DAY_COLUMNS = ['log_weight', 'exceedances', 'patients', 'unfinished', 'max_los']
+
+# the cross-entropy steps make a new sampler per tilt
+_samplers = ContextCache()
+
+
+def _sampler(scenario, arrival_tilt, service_shifts):
+    key = (scenario_hash(scenario), arrival_tilt, tuple(sorted(service_shifts.items())))
+    return _samplers.get(key, lambda: TiltedSampler(SimulationContext(scenario), arrival_tilt, service_shifts))
+
+
+def _tilted_chunk(scenario, seeds, threshold, arrival_tilt, service_shifts):
+    sampler = _sampler(scenario, arrival_tilt, service_shifts)
+    context = sampler.context
+    rows = []
+    for seed in seeds:
+        context.reset(seed)
+        sampler.clear()
+        timestamps_list, _ = context.run()
+        los = patient_kpis(timestamps_list)['total_system_time']
+        rows.append([sampler.log_weight, float(np.sum(los > threshold)), float(len(los)),
+                     float(context.num_arrivals - len(los)), float(np.max(los)) if len(los) else 0.0]
+                    + sampler.statistics())
+    return rows
+
+
+def tilted_days(scenario, seeds, threshold=3.0, arrival_tilt=1.0, service_shifts=None, workers=1):
+    """
+    Simulates days under the tilted distribution.
+
+    Returns:
+        numpy.ndarray: One row per seed: the DAY_COLUMNS (log likelihood ratio, patients with
+                       total_system_time above threshold, patients who left, patients still in
+                       the clinic at the end, longest stay) followed by TiltedSampler.statistics().
+    """
+    scenario = resolve_scenario(scenario)
+    service_shifts = dict(service_shifts or {})
+    seeds = list(seeds)
+    if workers == 1:
+        rows = _tilted_chunk(scenario, seeds, threshold, arrival_tilt, service_shifts)
+    else:
+        chunks = chunk_seeds(seeds, workers)
+        repeat = [None] * len(chunks)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_tilted_chunk, [scenario for _ in repeat], chunks, [threshold for _ in repeat],
+                               [arrival_tilt for _ in repeat], [service_shifts for _ in repeat])
+            rows = [row for chunk_rows in results for row in chunk_rows]
+    return np.array(rows, dtype=float)
+
+
+def cross_entropy_tilt(scenario, threshold, services, days_per_step=200, elite_fraction=0.1, max_steps=25,
+                       first_seed=1_000_001, workers=1, verbose=True):
+    """
+    Tunes the arrival tilt and service shifts by the multilevel cross-entropy method.
+
+    Each step simulates days under the current tilt, takes as level the smaller of
+    the threshold and the longest stay reached by the top elite_fraction of days,
+    and refits the tilt to the elite days weighted by their likelihood ratios
+    (closed-form for the exponential rate factor and the normal mean shifts). Stops
+    when the level reaches the threshold (with a warning if it does not within
+    max_steps). Seeds start at first_seed, away from the ones used for estimation.
+
+    Returns:
+        tuple: (arrival_tilt, service_shifts dict, days simulated while tuning).
+    """
+    arrival_tilt, shifts = 1.0, dict.fromkeys(services, 0.0)
+    for step in range(max_steps):
+        seeds = range(first_seed + step * days_per_step, first_seed + (step + 1) * days_per_step)
+        days = tilted_days(scenario, seeds, threshold, arrival_tilt, shifts, workers)
+        weights, max_los = np.exp(days[:, 0]), days[:, 4]
+        level = min(threshold, float(np.quantile(max_los, 1 - elite_fraction)))
+        elite = weights * (max_los >= level)
+        statistics = days[:, len(DAY_COLUMNS):]
+        arrival_tilt = float(elite @ statistics[:, 0] / (elite @ statistics[:, 1]))
+        for i, name in enumerate(sorted(shifts)):
+            draws, sums = elite @ statistics[:, 2 + 2 * i], elite @ statistics[:, 3 + 2 * i]
+            shifts[name] = float(sums / draws) if draws > 0 else 0.0
+        if verbose:
+            tilt = ', '.join(f"{name} {shift:+.2f} SD" for name, shift in sorted(shifts.items()))
+            print(f"CE step {step}: level {level:.3f} h; arrival rate x{arrival_tilt:.3f}; {tilt}")
+        if level >= threshold:
+            break
+    else:
+        warnings.warn(f"The cross-entropy levels stopped at {level:.3f} h, below the threshold {threshold:g} h; "
+                      f"the tilt may be too weak for a useful estimate.")
+    return arrival_tilt, shifts, (step + 1) * days_per_step
+
+
+def tail_estimate(days, confidence=0.95, tuning_days=0):
+    """
+    Likelihood-ratio weighted estimates from tilted_days() output.
+
+    Args:
+        days (numpy.ndarray): tilted_days() output.
+        confidence (float, optional): Confidence level of the half widths. Defaults to 0.95.
+        tuning_days (int, optional): Days spent finding the tilt, counted in the cost. Defaults to 0.
+
+    Returns:
+        dict: exceedances_per_day (expected patients above the threshold per plain day) and
+              p_day (probability a plain day has any), each with a half width; p_patient
+              (exceedances over weighted patients per day, patients_per_day being the latter);
+              ess (effective sample size of the weights); cost, the days simulated including
+              tuning_days; and plain_days, the plain Monte Carlo days that would give the same
+              half width for exceedances_per_day (from the plain variance estimated by the
+              same weighted sample).
+    """
+    weights = np.exp(days[:, 0])
+    exceed, patients = days[:, 1], days[:, 2]
+    n = len(days)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    result = {'days': n, 'cost': n + tuning_days, 'ess': float(weights.sum() ** 2 / np.sum(weights ** 2))}
+    for name, outcome in [('exceedances_per_day', exceed), ('p_day', (exceed > 0).astype(float))]:
+        weighted = weights * outcome
+        result[name] = float(weighted.mean())
+        result[name + '_half_width'] = float(z * weighted.std(ddof=1) / math.sqrt(n))
+    weighted = weights * exceed
+    plain_var = max(np.mean(weights * exceed ** 2) - weighted.mean() ** 2, 0.0)
+    tilted_var = weighted.var(ddof=1)
+    result['plain_days'] = float(n * plain_var / tilted_var) if tilted_var > 0 else math.nan
+    result['patients_per_day'] = float(np.mean(weights * patients))
+    result['p_patient'] = float(weighted.mean() / result['patients_per_day'])
+    result['unfinished_per_day'] = float(np.mean(weights * days[:, 3]))
+    return result
+
+
+def _point(value, half_width):
+    """An estimate, or only its upper confidence bound when the half width exceeds it."""
+    if half_width > value:
+        return f"< {value + half_width:.2e}"
+    return f"{value:.3e}"
+
+
+def run_importance():
+    """
+    Command line entry point: estimates how often a patient's length of stay exceeds a threshold.
+    """
+    parser = argparse.ArgumentParser(description="Importance sampling of long lengths of stay.")
+    parser.add_argument('--scenario', type=str, default=None, help='Scenario file (default: the baseline scenario)')
+    parser.add_argument('--threshold', type=float, default=3.0, help='Length of stay threshold, hours')
+    parser.add_argument('--services', nargs='+', default=LONG_SERVICES, help='Service times to tilt')
+    parser.add_argument('--arrival_tilt', type=float, default=None,
+                        help='Factor on the arrival rates; with --service_shift skips the cross-entropy tuning')
+    parser.add_argument('--service_shift', type=float, default=None, help='Mean shift of the --services draws, in SDs')
+    parser.add_argument('--ce_days', type=int, default=200, help='Days per cross-entropy step')
+    parser.add_argument('--ce_elite', type=float, default=0.1, help='Elite fraction of the cross-entropy steps')
+    parser.add_argument('--num_replications', type=int, default=400, help='Tilted days for the estimate')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+    parser.add_argument('--compare', action='store_true', help='Also run as many plain days and estimate from them')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file with the tilts and estimates')
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenario) if args.scenario else [resolve_scenario({})]
+    seeds = range(args.first_seed, args.first_seed + args.num_replications)
+    results = {}
+    for scenario in scenarios:
+        unknown = set(args.services) - set(scenario['service_times'])
+        if unknown:
+            raise ValueError(f"Unknown services {sorted(unknown)}; choose from {list(scenario['service_times'])}.")
+        print(f"\n{scenario_name(scenario)}: P(total_system_time > {args.threshold:g} h)")
+        tuning_days = 0
+        if args.arrival_tilt is None or args.service_shift is None:
+            arrival_tilt, shifts, tuning_days = cross_entropy_tilt(scenario, args.threshold, args.services,
+                                                                   args.ce_days, args.ce_elite, workers=args.workers)
+        else:
+            arrival_tilt, shifts = args.arrival_tilt, dict.fromkeys(args.services, args.service_shift)
+        tilted = tail_estimate(tilted_days(scenario, seeds, args.threshold, arrival_tilt, shifts, args.workers),
+                               tuning_days=tuning_days)
+        estimates = {'tilted': tilted}
+        # a NaN plain_days (no exceedances) compares False and falls back too
+        method = 'tilted' if tilted['plain_days'] >= tilted['cost'] else 'plain'
+        if method == 'plain':
+            print(f"Importance sampling took {tilted['cost']} days ({tuning_days} tuning) for a CI that plain "
+                  f"Monte Carlo gets in about {tilted['plain_days']:.0f}; estimating from plain days instead.")
+        if args.compare or method == 'plain':
+            estimates['plain'] = tail_estimate(tilted_days(scenario, seeds, args.threshold, workers=args.workers))
+        results[scenario_name(scenario)] = {'arrival_tilt': arrival_tilt, 'service_shifts': shifts,
+                                            'tuning_days': tuning_days, 'method': method, **estimates}
+
+        print(f"{'sampling':<10}{'per patient':>14}{'exceed/day':>14}{'+/-':>12}{'P(day has one)':>16}"
+              f"{'ESS':>8}{'days simulated':>16}{'plain days for same CI':>24}")
+        bounds_only = False
+        for label, estimate in estimates.items():
+            half_width = estimate['exceedances_per_day_half_width']
+            bounds_only |= half_width > estimate['exceedances_per_day'] or \
+                estimate['p_day_half_width'] > estimate['p_day']
+            per_patient = _point(estimate['p_patient'], half_width / estimate['patients_per_day'])
+            print(f"{label:<10}{per_patient:>14}{_point(estimate['exceedances_per_day'], half_width):>14}"
+                  f"{half_width:12.2e}{_point(estimate['p_day'], estimate['p_day_half_width']):>16}"
+                  f"{estimate['ess']:8.0f}{estimate['cost']:16d}{estimate['plain_days']:24.3g}")
+        if bounds_only:
+            print("(< marks an upper confidence bound, shown instead of estimates whose half width exceeds them)")
+        if estimates[method]['unfinished_per_day'] > 0:
+            print(f"(patients still in the clinic at the end, not counted: "
+                  f"{estimates[method]['unfinished_per_day']:.3g} per day)")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'threshold': args.threshold, 'seeds': list(seeds), 'scenarios': results}, f, indent=2)
+        print(f"\nWrote the estimates to {args.out}")
+
+
+if __name__ == "__main__":
+    run_importance()
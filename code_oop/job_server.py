@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import json
+import os
+import socket
+import time
+
+from batch import init_worker, run_chunk
+from kpis import DAY_KPI_NAMES
+from scenarios import load_scenarios, resolve_scenario, scenario_hash, scenario_name
+
+DEFAULT_ADDRESS = '127.0.0.1:8642'
+
+
+def _parse_address(address):
+    """'unix:/path/to.sock' or 'host:port' -> ('unix', path) or ('tcp', (host, port))."""
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, port = address.rsplit(':', 1)
+    return 'tcp', (host, int(port))
+
+
+class JobServer(object):
+    """
+    Long-running simulation service shared by several clients on one machine.
+
+    Clients submit jobs (scenarios x seeds) over a socket as JSON lines and get one
+    line back per simulated day as it finishes. Behind the asyncio front end a
+    single process pool runs at most one day per core, whoever asked for it:
+
+    - a day already computed is answered from the result cache,
+    - a day that is queued or running for another job is awaited, not run twice,
+    - queued days are dispatched round-robin over clients, so a big sweep does not
+      starve a small one submitted after it.
+
+    Days of a client that disconnects still run and are cached.
+
+    Args:
+        workers (int, optional): Worker processes. Defaults to all cores.
+        cache_path (str, optional): JSON lines file the result cache is loaded from and appended to,
+                                    so it survives restarts. Defaults to an in-memory cache only.
+    """
+    def __init__(self, workers=None, cache_path=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_path = cache_path
+        self.cache = {}
+        self.futures = {}
+        self.waiters = collections.Counter()
+        self.queues = collections.OrderedDict()
+        self.running = 0
+        self.num_simulated = 0
+        self.num_jobs = 0
+        self._pool = None
+        self._wakeup = None
+        if cache_path and os.path.exists(cache_path):
+            self._load_cache()
+
+    def _load_cache(self):
+        with open(self.cache_path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record['kpi_names'] == DAY_KPI_NAMES:
+                    self.cache[(record['hash'], record['seed'])] = record['kpis']
+
+    def _store(self, key, row):
+        self.cache[key] = row
+        if self.cache_path:
+            with open(self.cache_path, 'a') as f:
+                f.write(json.dumps({'hash': key[0], 'seed': key[1], 'kpi_names': DAY_KPI_NAMES, 'kpis': row}) + '\n')
+
+    def _request(self, client, key, scenario, seed):
+        """Future of one day's KPI row, queueing the day for `client` unless it is cached or pending."""
+        if key in self.futures:
+            return self.futures[key]
+        future = asyncio.get_running_loop().create_future()
+        if key in self.cache:
+            future.set_result(self.cache[key])
+            return future
+        self.futures[key] = future
+        self.queues.setdefault(client, collections.deque()).append((key, scenario, seed))
+        self._wakeup.set()
+        return future
+
+    def _release(self, keys, drop=False):
+        """
+        Ends a job's interest in its days; with drop, the days no other job waits for are
+        taken off the queue and their futures cancelled (days already running still finish).
+        """
+        dropped = set()
+        for key in keys:
+            self.waiters[key] -= 1
+            if self.waiters[key] <= 0:
+                del self.waiters[key]
+                if drop and key in self.futures:
+                    dropped.add(key)
+        if not dropped:
+            return
+        for client, queue in list(self.queues.items()):
+            kept = collections.deque(item for item in queue if item[0] not in dropped)
+            for key, _, _ in queue:
+                if key in dropped:
+                    self.futures.pop(key).cancel()
+            if kept:
+                self.queues[client] = kept
+            else:
+                del self.queues[client]
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.running < self.workers and self.queues:
+                # the client at the front gets one day, then goes to the back of the line
+                client, queue = self.queues.popitem(last=False)
+                key, scenario, seed = queue.popleft()
+                if queue:
+                    self.queues[client] = queue
+                self.running += 1
+                task = loop.run_in_executor(self._pool, run_chunk, scenario, [seed])
+                task.add_done_callback(functools.partial(self._finished, key))
+
+    def _finished(self, key, task):
+        self.running -= 1
+        future = self.futures.pop(key)
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            row = task.result()[0]
+            self.num_simulated += 1
+            self._store(key, row)
+            future.set_result(row)
+        self._wakeup.set()
+
+    async def _run_job(self, message, client, write):
+        self.num_jobs += 1
+        job = message.get('job', self.num_jobs)
+        start = time.perf_counter()
+        specs = message['scenarios'] if 'scenarios' in message else [message.get('scenario', {})]
+        scenarios = [resolve_scenario(spec) for spec in specs]
+        if 'seeds' in message:
+            seeds = [int(seed) for seed in message['seeds']]
+        else:
+            first_seed = int(message.get('first_seed', 1))
+            seeds = list(range(first_seed, first_seed + int(message.get('num_replications', 10))))
+
+        days, keys = [], []
+        for index, scenario in enumerate(scenarios):
+            key_hash = scenario_hash(scenario)
+            for seed in seeds:
+                key = (key_hash, seed)
+                cached = key in self.cache
+                future = self._request(client, key, scenario, seed)
+                self.waiters[key] += 1
+                keys.append(key)
+                days.append(asyncio.ensure_future(
+                    _labelled(future, {'scenario': index, 'hash': key_hash, 'seed': seed, 'cached': cached})))
+
+        num_cached = 0
+        failed = False
+        try:
+            for day in asyncio.as_completed(days):
+                message, row = await day
+                num_cached += message['cached']
+                await write(dict(job=job, **message, kpis=dict(zip(DAY_KPI_NAMES, row))))
+        except ConnectionError:
+            raise
+        except Exception:
+            # a failed job gives up its other days; those of a disconnected client still run (see above)
+            failed = True
+            for day in days:
+                day.cancel()
+            raise
+        finally:
+            self._release(keys, drop=failed)
+        await write({'job': job, 'done': True, 'days': len(days), 'from_cache': num_cached,
+                     'seconds': round(time.perf_counter() - start, 3)})
+
+    def status(self):
+        return {'workers': self.workers, 'running': self.running,
+                'queued': {str(client): len(queue) for client, queue in self.queues.items()},
+                'cached_days': len(self.cache), 'simulated_days': self.num_simulated, 'jobs': self.num_jobs}
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info('peername') or id(writer)
+        lock = asyncio.Lock()
+        jobs = set()
+
+        async def write(message):
+            async with lock:
+                writer.write((json.dumps(message) + '\n').encode())
+                await writer.drain()
+
+        async def run(message, client):
+            try:
+                await self._run_job(message, client, write)
+            except ConnectionError:
+                pass
+            except Exception as error:
+                await write({'job': message.get('job'), 'error': f'{type(error).__name__}: {error}'})
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError as error:
+                    await write({'error': f'Invalid JSON: {error}'})
+                    continue
+                op = message.get('op', 'submit')
+                if op == 'status':
+                    await write(self.status())
+                elif op == 'submit':
+                    task = asyncio.ensure_future(run(message, message.get('client', str(peer))))
+                    jobs.add(task)
+                    task.add_done_callback(jobs.discard)
+                else:
+                    await write({'error': f"Unknown op {op!r}, expected 'submit' or 'status'."})
+            if jobs:
+                await asyncio.wait(jobs)
+        except ConnectionError:
+            pass
+        finally:
+            for task in jobs:
+                task.cancel()
+            writer.close()
+
+    async def serve(self, address=DEFAULT_ADDRESS):
+        """Serves clients on `address` ('host:port' or 'unix:/path') until cancelled."""
+        self._wakeup = asyncio.Event()
+        self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        kind, where = _parse_address(address)
+        if kind == 'unix':
+            if os.path.exists(where):
+                os.remove(where)
+            server = await asyncio.start_unix_server(self._handle, path=where)
+        else:
+            server = await asyncio.start_server(self._handle, *where)
+        dispatcher = asyncio.ensure_future(self._dispatch())
+        print(f"Serving {self.workers} workers on {address} ({len(self.cache)} cached days)", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dispatcher.cancel()
+            self._pool.shutdown()
+
+
+async def _labelled(future, message):
+    # shielded: a job cancelled with its connection must not cancel a day other jobs wait for
+    return message, await asyncio.shield(future)
+
+
+def _connect(address):
+    kind, where = _parse_address(address)
+    if kind == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(where)
+        return sock
+    return socket.create_connection(where)
+
+
+def submit(scenarios, seeds, address=DEFAULT_ADDRESS, client=None):
+    """
+    Submits a job to a running JobServer and yields its messages as they arrive,
+    one per day ({'scenario', 'hash', 'seed', 'cached', 'kpis'}) and finally one with 'done'.
+    Works from notebooks and scripts.
+
+    Args:
+        scenarios (list): Scenario dicts, partial ones are completed with the defaults.
+        seeds (list): Seeds to simulate every scenario on.
+        address (str, optional): Server address. Defaults to DEFAULT_ADDRESS.
+        client (str, optional): Name the server shares cores by. Defaults to the connection.
+    """
+    message = {'op': 'submit', 'scenarios': scenarios, 'seeds': list(seeds)}
+    if client:
+        message['client'] = client
+    with _connect(address) as sock, sock.makefile('rw') as stream:
+        stream.write(json.dumps(message) + '\n')
+        stream.flush()
+        for line in stream:
+            reply = json.loads(line)
+            if 'error' in reply:
+                raise ValueError(reply['error'])
+            yield reply
+            if reply.get('done'):
+                return
+
+
+def server_status(address=DEFAULT_ADDRESS):
+    with _connect(address) as sock, sock.makefile('rw') as stream:
+        stream.write(json.dumps({'op': 'status'}) + '\n')
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+def run_job_server():
+    """
+    Command line entry point: runs the server, submits a job to it or shows its status.
+    """
+    parser = argparse.ArgumentParser(description="Shared local simulation job server.")
+    parser.add_argument('command', choices=['serve', 'submit', 'status'])
+    parser.add_argument('--address', type=str, default=DEFAULT_ADDRESS, help="host:port or unix:/path/to.sock")
+    parser.add_argument('--workers', type=int, default=None, help='serve: worker processes (default: all cores)')
+    parser.add_argument('--cache', type=str, default=None, help='serve: JSON lines file to persist the result cache')
+    parser.add_argument('--scenario', type=str, default=None, help='submit: scenario file (default: the baseline)')
+    parser.add_argument('--num_replications', type=int, default=10, help='submit: days per scenario')
+    parser.add_argument('--first_seed', type=int, default=1, help='submit: seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--client', type=str, default=None, help='submit: name to share cores by')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(JobServer(args.workers, args.cache).serve(args.address))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'status':
+        print(json.dumps(server_status(args.address), indent=2))
+    else:
+        scenarios = load_scenarios(args.scenario) if args.scenario else [resolve_scenario({})]
+        seeds = range(args.first_seed, args.first_seed + args.num_replications)
+        print(f"{'scenario':<28}{'seed':>6}{'cached':>8}{'mean LOS':>10}{'p90 LOS':>10}{'patients':>10}")
+        for reply in submit(scenarios, seeds, args.address, args.client):
+            if reply.get('done'):
+                print(f"{reply['days']} days ({reply['from_cache']} from cache) in {reply['seconds']:.2f} s")
+                break
+            kpis = reply['kpis']
+            print(f"{scenario_name(scenarios[reply['scenario']]):<28}{reply['seed']:>6}{str(reply['cached']):>8}"
+                  f"{kpis['mean_total_system_time']:10.3f}{kpis['p90_total_system_time']:10.3f}"
+                  f"{kpis['n_patients']:10.0f}", flush=True)
+
+
+if __name__ == "__main__":
+    run_job_server()
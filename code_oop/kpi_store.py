@@ -0,0 +1,293 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import time
+
+import numpy as np
+
+from batch import init_worker, run_chunk
+from kpis import DAY_KPI_NAMES
+from scenarios import SCENARIO_GRID, load_scenarios, resolve_scenario, scenario_hash, scenario_labels
+
+STORE_FORMAT = 1
+# rows read at a time by the out-of-core statistics
+CHUNK_ROWS = 1 << 16
+_BOOTSTRAP_BLOCK = 2048
+
+
+class KpiStore(object):
+    """
+    On-disk matrix of day KPIs for a sweep: one row per (scenario, replication), one
+    float64 column per name in kpis.DAY_KPI_NAMES, backed by numpy.memmap.
+
+    A store is a folder with kpis.f64 (the matrix, NaN until written), done.u8 (one
+    flag per row, set after the row's values are flushed) and store.json (scenarios,
+    seeds, columns and shape). Row i * len(seeds) + j holds scenario i on seeds[j].
+    Rows are written as days finish, so a store can be opened read-only and
+    summarised while a sweep is still filling it, and an interrupted sweep resumes
+    with the rows not yet done.
+
+    Args:
+        path (str): Folder of an existing store (see create).
+        mode (str, optional): 'r' to read, 'r+' to also write rows. Defaults to 'r'.
+    """
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        with open(os.path.join(path, 'store.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['format'] != STORE_FORMAT:
+            raise ValueError(f"{path} has store format {self.meta['format']}, expected {STORE_FORMAT}.")
+        self.scenarios = self.meta['scenarios']
+        self.seeds = self.meta['seeds']
+        self.kpi_names = self.meta['kpi_names']
+        self.num_rows = len(self.scenarios) * len(self.seeds)
+        self.data = np.memmap(os.path.join(path, 'kpis.f64'), dtype=np.float64, mode=mode,
+                              shape=(self.num_rows, len(self.kpi_names)))
+        self.done = np.memmap(os.path.join(path, 'done.u8'), dtype=np.uint8, mode=mode, shape=(self.num_rows,))
+
+    @classmethod
+    def create(cls, path, scenarios, seeds):
+        """Creates an empty store for scenarios x seeds and returns it opened for writing."""
+        scenarios = [resolve_scenario(scenario) for scenario in scenarios]
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, 'store.json')):
+            raise ValueError(f"{path} already holds a store.")
+        num_rows = len(scenarios) * len(seeds)
+        data = np.memmap(os.path.join(path, 'kpis.f64'), dtype=np.float64, mode='w+',
+                         shape=(num_rows, len(DAY_KPI_NAMES)))
+        for start in range(0, num_rows, CHUNK_ROWS):
+            data[start:start + CHUNK_ROWS] = np.nan
+        data.flush()
+        done = np.memmap(os.path.join(path, 'done.u8'), dtype=np.uint8, mode='w+', shape=(num_rows,))
+        done.flush()
+        del data, done
+        meta = {'format': STORE_FORMAT, 'kpi_names': DAY_KPI_NAMES, 'dtype': 'float64',
+                'shape': [num_rows, len(DAY_KPI_NAMES)], 'seeds': list(seeds), 'scenarios': scenarios,
+                'scenario_hashes': [scenario_hash(scenario) for scenario in scenarios]}
+        # the sidecar goes last: a folder without it is not a store yet
+        with open(os.path.join(path, 'store.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        return cls(path, mode='r+')
+
+    def rows(self, scenario_index):
+        """Row slice of one scenario."""
+        return slice(scenario_index * len(self.seeds), (scenario_index + 1) * len(self.seeds))
+
+    def write(self, rows, values):
+        """Writes KPI rows (values has shape (len(rows), len(kpi_names))) and marks them done."""
+        self.data[rows] = values
+        self.data.flush()
+        self.done[rows] = 1
+        self.done.flush()
+
+    def pending(self, scenario_index):
+        """Replication indices of a scenario not written yet."""
+        return np.flatnonzero(self.done[self.rows(scenario_index)] == 0)
+
+    def chunks(self, name, scenario_index, chunk_rows=CHUNK_ROWS):
+        """Yields the finished, non-NaN values of a KPI for one scenario, chunk_rows rows at a time."""
+        column = self.kpi_names.index(name)
+        rows = self.rows(scenario_index)
+        for start in range(rows.start, rows.stop, chunk_rows):
+            stop = min(start + chunk_rows, rows.stop)
+            values = np.array(self.data[start:stop, column])
+            values = values[(np.asarray(self.done[start:stop]) == 1) & ~np.isnan(values)]
+            if len(values):
+                yield values
+
+    def close(self):
+        if self.mode != 'r':
+            self.data.flush()
+            self.done.flush()
+        self.data = self.done = None
+
+
+def fill_store(store, workers=1, chunk_size=200, progress=None):
+    """
+    Simulates every row of a store that is not done yet, writing each chunk of days as
+    it finishes; at most 2 * workers chunks are in flight, so memory stays flat.
+
+    Args:
+        store (KpiStore): Store opened with mode 'r+'.
+        workers (int, optional): Worker processes. Defaults to 1.
+        chunk_size (int, optional): Days per task. Defaults to 200.
+        progress (callable, optional): Called with the number of rows written after each chunk.
+    """
+    tasks = []
+    for index, scenario in enumerate(store.scenarios):
+        pending = store.pending(index)
+        for start in range(0, len(pending), chunk_size):
+            replications = pending[start:start + chunk_size]
+            tasks.append((scenario, [store.seeds[j] for j in replications],
+                          store.rows(index).start + replications))
+    written = 0
+    if workers == 1:
+        for scenario, seeds, rows in tasks:
+            store.write(rows, run_chunk(scenario, seeds))
+            written += len(rows)
+            if progress:
+                progress(written)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        queue = iter(tasks)
+        in_flight = {}
+
+        def submit_next():
+            task = next(queue, None)
+            if task is not None:
+                in_flight[pool.submit(run_chunk, task[0], task[1])] = task[2]
+
+        for _ in range(2 * workers):
+            submit_next()
+        while in_flight:
+            finished, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                rows = in_flight.pop(future)
+                store.write(rows, future.result())
+                written += len(rows)
+                if progress:
+                    progress(written)
+                submit_next()
+
+
+def poisson_bootstrap(chunks, num_resamples=1000, confidence=0.95, seed=0):
+    """
+    Bootstrap percentile CI of a mean in one pass over chunks of values.
+
+    Each resample weights every value by an independent Poisson(1) count instead of
+    drawing n values with replacement (the Poisson bootstrap), so resamples are built
+    chunk by chunk from running sums and the values never have to fit in memory.
+
+    Returns:
+        dict: n, mean, low and high.
+    """
+    rng = np.random.default_rng(seed)
+    weighted = np.zeros(num_resamples)
+    weights = np.zeros(num_resamples)
+    total, n = 0.0, 0
+    for values in chunks:
+        # blocks of values keep the (num_resamples x block) count matrix small
+        for start in range(0, len(values), _BOOTSTRAP_BLOCK):
+            block = values[start:start + _BOOTSTRAP_BLOCK]
+            counts = rng.poisson(1.0, size=(num_resamples, len(block)))
+            weighted += counts @ block
+            weights += counts.sum(axis=1)
+        total += values.sum()
+        n += len(values)
+    if n == 0:
+        return {'n': 0, 'mean': np.nan, 'low': np.nan, 'high': np.nan}
+    means = weighted[weights > 0] / weights[weights > 0]
+    low, high = np.percentile(means, [50 * (1 - confidence), 50 * (1 + confidence)])
+    return {'n': n, 'mean': total / n, 'low': float(low), 'high': float(high)}
+
+
+def streaming_histogram(chunk_source, bins=30):
+    """
+    Histogram in two passes over chunks of values: one for the range, one for the counts.
+
+    Args:
+        chunk_source (callable): Returns a fresh iterator over the chunks (called twice).
+        bins (int, optional): Number of bins. Defaults to 30.
+
+    Returns:
+        tuple: (counts, bin edges), as numpy.histogram.
+    """
+    low, high = np.inf, -np.inf
+    for values in chunk_source():
+        low, high = min(low, values.min()), max(high, values.max())
+    if low > high:
+        return np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1)
+    edges = np.linspace(low, high if high > low else low + 1, bins + 1)
+    counts = np.zeros(bins, dtype=np.int64)
+    for values in chunk_source():
+        counts += np.histogram(values, bins=edges)[0]
+    return counts, edges
+
+
+def run_kpi_store():
+    """
+    Command line entry point: fills a KPI store, or reports progress, bootstrap CIs or
+    histograms from it (also while it is being filled).
+    """
+    parser = argparse.ArgumentParser(description="Memory-mapped day KPI matrix for large sweeps.")
+    parser.add_argument('command', choices=['run', 'status', 'summary', 'hist'])
+    parser.add_argument('--store', type=str, default='./output/kpi_store', help='Store folder')
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='run: scenario file (default: every valid workflow, scenarios.SCENARIO_GRID)')
+    parser.add_argument('--num_replications', type=int, default=1000, help='run: days per scenario')
+    parser.add_argument('--first_seed', type=int, default=1, help='run: seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--chunk_size', type=int, default=200, help='run: days per task')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='run: worker processes')
+    parser.add_argument('--kpi', type=str, default='mean_total_system_time', choices=DAY_KPI_NAMES,
+                        help='summary/hist: KPI to summarise')
+    parser.add_argument('--num_resamples', type=int, default=1000, help='summary: bootstrap resamples')
+    parser.add_argument('--confidence', type=float, default=0.95, help='summary: confidence level')
+    parser.add_argument('--bins', type=int, default=30, help='hist: number of bins')
+    parser.add_argument('--plot', type=str, default=None, help='hist: also save the histograms to this image file')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if os.path.exists(os.path.join(args.store, 'store.json')):
+            store = KpiStore(args.store, mode='r+')
+            print(f"Resuming {args.store}: {int(np.sum(store.done))} of {store.num_rows} days done")
+        else:
+            scenarios = load_scenarios(args.scenario) if args.scenario else \
+                [resolve_scenario(s) for s in SCENARIO_GRID]
+            seeds = range(args.first_seed, args.first_seed + args.num_replications)
+            store = KpiStore.create(args.store, scenarios, seeds)
+            print(f"Created {args.store}: {len(scenarios)} scenarios x {len(seeds)} days, "
+                  f"{store.data.nbytes / 2 ** 20:.1f} MiB")
+        start = time.perf_counter()
+        remaining = store.num_rows - int(np.sum(store.done))
+        step = max(1, remaining // 20)
+        reported = [0]
+
+        def progress(written):
+            if written - reported[0] >= step or written == remaining:
+                reported[0] = written
+                elapsed = time.perf_counter() - start
+                print(f"{written}/{remaining} days, {written / elapsed:.0f} days/s", flush=True)
+
+        fill_store(store, args.workers, args.chunk_size, progress)
+        store.close()
+        return
+
+    store = KpiStore(args.store)
+    labels = scenario_labels(store.scenarios)
+    if args.command == 'status':
+        print(f"{args.store}: {int(np.sum(store.done))} of {store.num_rows} days done")
+        for index, label in enumerate(labels):
+            print(f"{label:<28}{int(np.sum(store.done[store.rows(index)])):>10}/{len(store.seeds)}")
+    elif args.command == 'summary':
+        print(f"{args.kpi}: mean with a {args.confidence:.0%} Poisson bootstrap CI ({args.num_resamples} resamples)")
+        print(f"{'scenario':<28}{'days':>9}{'mean':>10}{'low':>10}{'high':>10}")
+        for index, label in enumerate(labels):
+            result = poisson_bootstrap(store.chunks(args.kpi, index), args.num_resamples, args.confidence)
+            print(f"{label:<28}{result['n']:9d}{result['mean']:10.4f}{result['low']:10.4f}{result['high']:10.4f}")
+    else:
+        histograms = [streaming_histogram(lambda index=index: store.chunks(args.kpi, index), args.bins)
+                      for index in range(len(labels))]
+        for label, (counts, edges) in zip(labels, histograms):
+            print(f"\n{label}: {args.kpi} ({counts.sum()} days)")
+            scale = 50 / max(counts.max(), 1)
+            for count, low, high in zip(counts, edges[:-1], edges[1:]):
+                print(f"{low:9.4f} - {high:<9.4f}{count:8d} {'#' * int(round(count * scale))}")
+        if args.plot:
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+
+            fig, ax = plt.subplots(figsize=(8, 5))
+            for label, (counts, edges) in zip(labels, histograms):
+                ax.stairs(counts / max(counts.sum(), 1), edges, label=label)
+            ax.set_xlabel(args.kpi)
+            ax.set_ylabel('share of days')
+            ax.legend(fontsize='small')
+            fig.savefig(args.plot, dpi=150, bbox_inches='tight')
+            print(f"\nSaved {args.plot}")
+
+
+if __name__ == "__main__":
+    run_kpi_store()
@@ -0,0 +1,131 @@
+import math
+
+import numpy as np
+
+# Per-patient KPIs defined directly on the raw timestamp columns, so they mean the
+# same thing for every engine regardless of what its compute_durations adds.
+# Each KPI is (end column, start column); alternatives cover column names that
+# differ between implementations (./code logs get_rad_ux_bx_ts).
+PATIENT_KPIS = {
+    'total_system_time': [('exit_system_ts', 'arrival_ts')],
+    'wait_for_checkin_staff': [('got_checkin_staff_ts', 'arrival_ts')],
+    'checkin_time': [('release_checkin_staff_ts', 'got_checkin_staff_ts')],
+    'wait_for_public_wait_room': [('got_public_wait_room_ts', 'release_checkin_staff_ts')],
+    'public_wait_room_time': [('release_public_wait_room_ts', 'got_public_wait_room_ts')],
+    'consent_time': [('release_consent_staff_ts', 'got_consent_staff_ts')],
+    'change_room_time': [('release_change_room_ts', 'got_change_room_ts')],
+    'gowned_wait_room_time': [('release_gowned_wait_room_ts', 'got_gowned_wait_room_ts')],
+    'wait_for_screen_scanner': [('got_screen_scanner_ts', 'release_gowned_wait_room_ts')],
+    'screen_mammo_time': [('release_screen_scanner_ts', 'got_screen_scanner_ts')],
+    'wait_for_ai_assess': [('begin_ai_assess_ts', 'release_screen_scanner_ts')],
+    'ai_assess_time': [('end_ai_assess_ts', 'begin_ai_assess_ts')],
+    'wait_for_dx_scanner': [('got_dx_scanner_ts', 'release_gowned_wait_room_ts')],
+    'dx_mammo_time': [('release_dx_scanner_ts', 'got_dx_scanner_ts')],
+    'wait_for_us_machine': [('got_us_machine_ts', 'release_gowned_wait_room_ts')],
+    'dx_us_time': [('release_us_machine_ts', 'got_us_machine_ts')],
+    'dx_mammo_us_time': [('release_dx_scanner_us_machine_ts', 'got_dx_scanner_before_us_ts')],
+    'screen_dx_after_ai_time': [('release_dx_scanner_us_machine_after_ai_ts', 'end_ai_assess_ts'),
+                                ('release_dx_scanner_after_ai_ts', 'end_ai_assess_ts'),
+                                ('release_us_machine_after_ai_ts', 'end_ai_assess_ts')],
+    'us_guided_bx_time': [('release_scanner_after_post_bx_mammo_ts', 'got_us_machine_bx_ts')],
+    'mammo_guided_bx_time': [('release_scanner_after_post_bx_mammo_ts', 'got_scanner_bx_ts')],
+    'rad_us_bx_time': [('release_rad_us_bx_ts', 'get_rad_us_bx_ts'),
+                       ('release_rad_us_bx_ts', 'get_rad_ux_bx_ts')],
+    'checkout_change_room_time': [('release_checkout_change_room_ts', 'got_checkout_change_room_ts')],
+}
+
+# Normalised patient_type labels ('screen + dx mammo US' and 'screen + dx mammo us'
+# are the same path in the two implementations).
+PATIENT_TYPES = ['screen', 'screen + dx mammo us', 'screen + dx mammo', 'screen + dx us',
+                 'dx mammo us', 'dx mammo', 'dx us', 'us bx', 'mammo bx', 'screen us',
+                 'mri-guided bx', 'mri']
+
+
+def normalize_patient_type(patient_type):
+    if not isinstance(patient_type, str):
+        return None
+    return patient_type.lower()
+
+
+def _as_float(value):
+    if value is None:
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def column_array(rows, name):
+    """Collects one timestamp column from a list of timestamps dicts; missing -> NaN."""
+    return np.array([_as_float(row.get(name)) for row in rows], dtype=float)
+
+
+def patient_kpis(rows):
+    """
+    Computes PATIENT_KPIS for every patient of one simulated day.
+
+    Args:
+        rows (list): Timestamps dicts, e.g. clinic.timestamps_list.
+
+    Returns:
+        dict: KPI name -> float array with one entry per patient (NaN where the step did not occur).
+    """
+    cache = {}
+
+    def col(name):
+        if name not in cache:
+            cache[name] = column_array(rows, name)
+        return cache[name]
+
+    kpis = {}
+    for name, alternatives in PATIENT_KPIS.items():
+        values = np.full(len(rows), np.nan)
+        for end_col, start_col in alternatives:
+            candidate = col(end_col) - col(start_col)
+            values = np.where(np.isnan(values), candidate, values)
+        kpis[name] = values
+    return kpis
+
+
+def day_kpis(rows, num_arrivals=None):
+    """
+    Summarises one simulated day into a flat dict of scalar KPIs.
+
+    Contains the patient count, the mean/p50/p90/max length of stay, the mean of
+    every per-patient KPI over the patients it applies to, the count of each
+    patient type, and the number of patients still in the clinic when the event
+    queue ran dry (n_unfinished; they are missing from rows and from the LOS).
+
+    Args:
+        rows (list): Timestamps dicts, e.g. clinic.timestamps_list.
+        num_arrivals (int, optional): Patients that arrived, e.g. SimulationContext.num_arrivals.
+                                      Without it n_unfinished is NaN.
+
+    Returns:
+        dict: KPI name -> float.
+    """
+    per_patient = patient_kpis(rows)
+    los = per_patient['total_system_time']
+    summary = {
+        'n_patients': float(len(rows)),
+        'n_unfinished': float(num_arrivals - len(rows)) if num_arrivals is not None else math.nan,
+        'mean_total_system_time': float(np.mean(los)) if len(los) else math.nan,
+        'p50_total_system_time': float(np.percentile(los, 50)) if len(los) else math.nan,
+        'p90_total_system_time': float(np.percentile(los, 90)) if len(los) else math.nan,
+        'max_total_system_time': float(np.max(los)) if len(los) else math.nan,
+    }
+    for name, values in per_patient.items():
+        if name == 'total_system_time':
+            continue
+        present = values[~np.isnan(values)]
+        summary['mean_' + name] = float(present.mean()) if len(present) else math.nan
+
+    types = [normalize_patient_type(row.get('patient_type')) for row in rows]
+    for patient_type in PATIENT_TYPES:
+        summary['n_' + patient_type.replace(' + ', '_').replace(' ', '_').replace('-', '_')] = \
+            float(types.count(patient_type))
+    return summary
+
+
+DAY_KPI_NAMES = list(day_kpis([]).keys())
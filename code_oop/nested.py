@@ -0,0 +1,261 @@
+import argparse
+import concurrent.futures
+import json
+import math
+import time
+from statistics import NormalDist
+
+import numpy as np
+from numpy.random import default_rng
+
+from batch import init_worker
+from kpis import DAY_KPI_NAMES, day_kpis
+from scenarios import AI_TIMES, load_scenario, resolve_scenario, scenario_name
+
+REPORT_KPIS = ['mean_total_system_time', 'p90_total_system_time', 'n_screen_dx_mammo_us']
+
+
+def parameter_draws(scenario, num_outer, first_seed):
+    """
+    The outer draws of pct_dx_after_ai: one per outer index from the scenario's
+    normal(mean, sd), each from its own stream, so a draw depends only on (first_seed, index).
+    """
+    mean, sd = scenario['ai_schedules'][scenario['ai_time']]['pct_dx_after_ai']
+    return [float(default_rng([first_seed, index]).normal(mean, sd)) for index in range(num_outer)]
+
+
+def _outer_task(scenario, pct, seeds):
+    """
+    The inner replications of one outer draw: every day on `seeds` with pct_dx_after_ai
+    held at `pct` instead of drawn per day.
+
+    Returns:
+        tuple: (KPI rows, seconds spent on the days, seconds spent on the whole task).
+    """
+    from run_simulation import get_context
+
+    start = time.perf_counter()
+    context = get_context(scenario)
+    rows = []
+    day_seconds = 0.0
+    for seed in seeds:
+        day_start = time.perf_counter()
+        context.reset(seed, pct_dx_after_ai=pct)
+        timestamps_list, _ = context.run()
+        kpis = day_kpis(timestamps_list, num_arrivals=context.num_arrivals)
+        rows.append([kpis[name] for name in DAY_KPI_NAMES])
+        day_seconds += time.perf_counter() - day_start
+    return rows, day_seconds, time.perf_counter() - start
+
+
+def nested_days(scenario, num_outer, num_inner, first_seed=1, workers=1):
+    """
+    Runs a nested design: num_outer draws of pct_dx_after_ai, each with num_inner days.
+    Outer draws run in parallel; draw i uses the seeds first_seed + i * num_inner onwards.
+
+    Returns:
+        dict: 'pct' (the outer draws), 'kpis' with shape (num_outer, num_inner, len(DAY_KPI_NAMES)),
+              'day_seconds' (per simulated day), 'outer_seconds' (per outer draw, beyond its days)
+              and 'wall_seconds'.
+    """
+    draws = parameter_draws(scenario, num_outer, first_seed)
+    seeds = [list(range(first_seed + i * num_inner, first_seed + (i + 1) * num_inner)) for i in range(num_outer)]
+    start = time.perf_counter()
+    if workers == 1:
+        results = [_outer_task(scenario, pct, outer_seeds) for pct, outer_seeds in zip(draws, seeds)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            results = list(pool.map(_outer_task, [scenario] * num_outer, draws, seeds))
+    wall = time.perf_counter() - start
+    day_seconds = sum(result[1] for result in results)
+    task_seconds = sum(result[2] for result in results)
+    # besides the set-up in the task, an outer draw costs its share of dispatching (wall time not spent in tasks)
+    dispatch = max(0.0, wall * min(workers, num_outer) - task_seconds)
+    return {
+        'pct': draws,
+        'kpis': np.array([result[0] for result in results], dtype=float),
+        'day_seconds': day_seconds / (num_outer * num_inner),
+        'outer_seconds': (task_seconds - day_seconds + dispatch) / num_outer,
+        'wall_seconds': wall,
+    }
+
+
+def variance_components(y, confidence=0.95):
+    """
+    One-way random-effects ANOVA of a KPI from a balanced nested design.
+
+    Args:
+        y (numpy.ndarray): KPI values with shape (num_outer, num_inner).
+        confidence (float, optional): Level of the interval of the mean. Defaults to 0.95.
+
+    Returns:
+        dict: mean and half_width (from the outer means, t with num_outer - 1 df), between (variance
+              due to pct_dx_after_ai, floored at 0), within (day-to-day variance for a given value),
+              share (between over the total) and between_se (standard error of between).
+    """
+    from scipy import stats
+
+    num_outer, num_inner = y.shape
+    outer_means = y.mean(axis=1)
+    msb = num_inner * np.var(outer_means, ddof=1)
+    msw = np.sum((y - outer_means[:, None]) ** 2) / (num_outer * (num_inner - 1))
+    between = max(0.0, (msb - msw) / num_inner)
+    return {
+        'mean': float(outer_means.mean()),
+        'half_width': float(stats.t.ppf(0.5 + confidence / 2, num_outer - 1) * math.sqrt(msb / num_inner / num_outer)),
+        'between': float(between),
+        'within': float(msw),
+        'share': float(between / (between + msw)) if between + msw > 0 else math.nan,
+        'between_se': math.sqrt(between_variance(between, msw, num_outer, num_inner)),
+    }
+
+
+def between_variance(between, within, num_outer, num_inner):
+    """Sampling variance of the ANOVA estimate of the between-draw variance (normal theory)."""
+    return 2 / num_inner ** 2 * ((within + num_inner * between) ** 2 / (num_outer - 1)
+                                 + within ** 2 / (num_outer * (num_inner - 1)))
+
+
+def optimal_allocation(between, within, day_seconds, outer_seconds, half_width=None, between_rse=None,
+                       confidence=0.95, max_inner=200):
+    """
+    The cheapest nested design that meets the precision targets, given pilot estimates
+    of the variance components and of the cost of a day and of an outer draw.
+
+    For every num_inner from 2 to max_inner the smallest num_outer meeting the targets is
+    found, and the design with the lowest num_outer * (outer_seconds + num_inner * day_seconds)
+    is kept. More inner days per draw pin down the day-to-day variance and spread the cost of
+    a draw; more outer draws are what reduce the error from parameter uncertainty.
+
+    Args:
+        between (float): Variance due to pct_dx_after_ai.
+        within (float): Day-to-day variance for a given pct_dx_after_ai.
+        day_seconds (float): CPU seconds per simulated day.
+        outer_seconds (float): CPU seconds per outer draw, beyond its days.
+        half_width (float, optional): Target half width of the interval of the KPI mean.
+        between_rse (float, optional): Target standard error of `between`, relative to it.
+        confidence (float, optional): Level of the interval. Defaults to 0.95.
+        max_inner (int, optional): Largest num_inner considered. Defaults to 200.
+
+    Returns:
+        dict: num_outer, num_inner and cpu_seconds of the best design.
+    """
+    if half_width is None and between_rse is None:
+        raise ValueError("Give a target half_width, a target between_rse or both.")
+    if between_rse is not None and between <= 0:
+        raise ValueError("The pilot shows no variance due to pct_dx_after_ai, so it cannot be estimated "
+                         "to a relative precision; use a half_width target or a larger pilot.")
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    def meets(num_outer, num_inner):
+        if half_width is not None and z * math.sqrt((between + within / num_inner) / num_outer) > half_width:
+            return False
+        if between_rse is not None and \
+                between_variance(between, within, num_outer, num_inner) > (between_rse * between) ** 2:
+            return False
+        return True
+
+    best = None
+    for num_inner in range(2, max_inner + 1):
+        low, high = 2, 2
+        while not meets(high, num_inner):
+            low, high = high, high * 2
+        while low < high:
+            middle = (low + high) // 2
+            if meets(middle, num_inner):
+                high = middle
+            else:
+                low = middle + 1
+        cost = high * (outer_seconds + num_inner * day_seconds)
+        if best is None or cost < best['cpu_seconds']:
+            best = {'num_outer': high, 'num_inner': num_inner, 'cpu_seconds': cost}
+    return best
+
+
+def _report(design, names, confidence):
+    print(f"{'KPI':<26}{'mean':>10}{'+/-':>9}{'param. var.':>13}{'+/- se':>10}{'day var.':>11}{'param. share':>14}")
+    summary = {}
+    for name in names:
+        y = design['kpis'][:, :, DAY_KPI_NAMES.index(name)]
+        if np.isnan(y).any():
+            print(f"{name:<26}{'(undefined on some days)':>40}")
+            continue
+        components = variance_components(y, confidence)
+        summary[name] = components
+        print(f"{name:<26}{components['mean']:10.4f}{components['half_width']:9.4f}{components['between']:13.3g}"
+              f"{components['between_se']:10.2g}{components['within']:11.3g}{components['share']:13.1%}")
+    return summary
+
+
+def run_nested():
+    """
+    Command line entry point: nested simulation separating the uncertainty about
+    pct_dx_after_ai from day-to-day randomness, with a pilot-based choice of design.
+    """
+    parser = argparse.ArgumentParser(description="Nested simulation over draws of pct_dx_after_ai.")
+    parser.add_argument('--scenario', type=str, default=None, help='Scenario file with the 1SS scenario')
+    parser.add_argument('--ai_time', type=str, default='afternoon', choices=[t for t in AI_TIMES if t != 'none'],
+                        help='AI time of the 1SS scenario when no scenario file is given')
+    parser.add_argument('--kpi', type=str, default='mean_total_system_time', choices=DAY_KPI_NAMES,
+                        help='KPI the design is sized for')
+    parser.add_argument('--kpis', nargs='+', default=REPORT_KPIS, choices=DAY_KPI_NAMES, help='Day KPIs to report')
+    parser.add_argument('--half_width', type=float, default=None, help='Target CI half width of the KPI mean')
+    parser.add_argument('--between_rse', type=float, default=None,
+                        help='Target standard error of the parameter variance, relative to it (default 0.25 '
+                             'when no target is given)')
+    parser.add_argument('--pilot', type=str, default='10x5', help='Pilot design, outer x inner')
+    parser.add_argument('--design', type=str, default=None,
+                        help='Run this design (outer x inner) instead of the optimal one')
+    parser.add_argument('--pilot_only', action='store_true', help='Stop after the pilot and the proposed design')
+    parser.add_argument('--max_inner', type=int, default=200, help='Largest number of days per outer draw')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the intervals')
+    parser.add_argument('--first_seed', type=int, default=1, help='First seed of the pilot; the main run follows it')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes (outer draws run in parallel)')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file with the estimates')
+    args = parser.parse_args()
+
+    if args.scenario:
+        scenario = load_scenario(args.scenario)
+    else:
+        scenario = resolve_scenario({'wf_1ss': True, 'ai_time': args.ai_time})
+    mean_sd = scenario['ai_schedules'][scenario['ai_time']]['pct_dx_after_ai']
+    if not scenario['wf_1ss'] or mean_sd is None:
+        raise ValueError("A nested run needs a 1SS scenario with AI on in some hours.")
+    between_rse = args.between_rse if args.between_rse is not None or args.half_width is not None else 0.25
+    pilot_outer, pilot_inner = (int(value) for value in args.pilot.split('x'))
+
+    print(f"{scenario_name(scenario)}: pct_dx_after_ai ~ normal({mean_sd[0]}, {mean_sd[1]}) per outer draw")
+    pilot = nested_days(scenario, pilot_outer, pilot_inner, args.first_seed, args.workers)
+    print(f"\nPilot {pilot_outer} x {pilot_inner} in {pilot['wall_seconds']:.1f} s "
+          f"({pilot['day_seconds'] * 1000:.1f} ms per day, {pilot['outer_seconds'] * 1000:.1f} ms per outer draw)")
+    pilot_summary = _report(pilot, args.kpis, args.confidence)
+    components = variance_components(pilot['kpis'][:, :, DAY_KPI_NAMES.index(args.kpi)], args.confidence)
+    allocation = optimal_allocation(components['between'], components['within'], pilot['day_seconds'],
+                                    pilot['outer_seconds'], args.half_width, between_rse, args.confidence,
+                                    args.max_inner)
+    targets = ', '.join(text for text in [f'half width {args.half_width}' if args.half_width else None,
+                                           f'parameter variance rse {between_rse}' if between_rse else None] if text)
+    print(f"\nCheapest design for {args.kpi} ({targets}): {allocation['num_outer']} x {allocation['num_inner']}, "
+          f"about {allocation['cpu_seconds']:.0f} CPU s "
+          f"({allocation['cpu_seconds'] / min(args.workers, allocation['num_outer']):.0f} s on {args.workers} workers)")
+    results = {'scenario': scenario_name(scenario), 'pilot': {'design': [pilot_outer, pilot_inner],
+                                                              'estimates': pilot_summary},
+               'allocation': allocation}
+
+    if not args.pilot_only:
+        if args.design:
+            num_outer, num_inner = (int(value) for value in args.design.split('x'))
+        else:
+            num_outer, num_inner = allocation['num_outer'], allocation['num_inner']
+        design = nested_days(scenario, num_outer, num_inner, args.first_seed + pilot_outer * pilot_inner, args.workers)
+        print(f"\nDesign {num_outer} x {num_inner} in {design['wall_seconds']:.1f} s")
+        results['design'] = {'design': [num_outer, num_inner], 'estimates': _report(design, args.kpis, args.confidence)}
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote the estimates to {args.out}")
+
+
+if __name__ == "__main__":
+    run_nested()
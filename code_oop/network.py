@@ -0,0 +1,325 @@
+import argparse
+import concurrent.futures
+import copy
+import hashlib
+import itertools
+import json
+import time
+import warnings
+
+import numpy as np
+import simpy
+from numpy.random import SeedSequence, default_rng
+
+from batch import init_worker
+from kpis import DAY_KPI_NAMES, day_kpis
+from params import CLINIC_HOURS, exam_dicts_from_rows, load_params
+from run_simulation import ContextCache, ReplayEnvironment, run_clinic
+from scenarios import read_file, resolve_scenario, scenario_hash
+from utils import MammoClinic
+
+REPORT_KPIS = ['n_patients', 'mean_total_system_time', 'p90_total_system_time', 'mean_wait_for_ai_assess']
+
+
+def site_scenario(site):
+    """
+    The resolved scenario of a site spec: its 'scenario' fields, with arrivals and exam
+    mix read from the site's own 'data_dir' (the two input CSVs of ./data, same names)
+    when it has one, the last hour's arrivals doubled as for a single clinic.
+    """
+    spec = copy.deepcopy(site.get('scenario', {}))
+    if site.get('data_dir'):
+        params = load_params(site['data_dir'])
+        arrivals = list(params.pt_num_per_hour)
+        arrivals[-1] *= 2
+        spec.setdefault('arrivals_per_hour', arrivals)
+        spec.setdefault('exam_mix', np.asarray(params.exam_percent).tolist())
+    return resolve_scenario(spec)
+
+
+def load_network(spec):
+    """
+    Validates a network spec and resolves its sites.
+
+    A spec is {'sites': [...], 'pools': {name: radiologists}}. Each site has a 'name', a
+    (partial) 'scenario', optionally a 'data_dir' with its own input CSVs, and optionally
+    a 'pool': pooled sites send the reads they would give their own same-day radiologist
+    (1SS with rad_change) to the pool's radiologists, who serve every site of the pool.
+    {'generate': {...}} instead builds a synthetic network (see synthetic_network).
+
+    Returns:
+        tuple: (sites, pools) - site dicts with 'index', 'name', 'scenario' (resolved) and
+               'pool', and {pool name: radiologists}.
+    """
+    if 'generate' in spec:
+        spec = synthetic_network(**spec['generate'])
+    pools = {name: int(capacity) for name, capacity in spec.get('pools', {}).items()}
+    sites = []
+    names = set()
+    for index, site in enumerate(spec['sites']):
+        name = site.get('name', f'site{index}')
+        if name in names:
+            raise ValueError(f"Site name {name!r} is used twice.")
+        names.add(name)
+        scenario = site_scenario(site)
+        pool = site.get('pool')
+        if pool is not None:
+            if pool not in pools:
+                raise ValueError(f"Site {name!r} uses pool {pool!r}, which is not in 'pools'.")
+            if not (scenario['wf_1ss'] and scenario['rad_change']):
+                raise ValueError(f"Site {name!r} is in pool {pool!r} but has no same-day radiologist reads "
+                                 f"to share; pooled sites need wf_1ss and rad_change.")
+        sites.append({'index': index, 'name': name, 'scenario': scenario, 'pool': pool})
+    for name, capacity in pools.items():
+        if capacity < 1:
+            raise ValueError(f"Pool {name!r} needs at least one radiologist.")
+    return sites, pools
+
+
+def synthetic_network(num_sites, pool_size=10, pool_radiologists=2, base=None, arrival_spread=0.3, seed=0):
+    """
+    A network spec of num_sites copies of a base scenario (default: 1SS any hour with a
+    same-day radiologist) with arrivals scaled by a random factor in 1 +/- arrival_spread,
+    grouped into pools of pool_size consecutive sites sharing pool_radiologists.
+    """
+    base = base or {'wf_1ss': True, 'ai_time': 'any', 'rad_change': True}
+    default_arrivals = arrival_rates(resolve_scenario(base))
+    rng = default_rng(seed)
+    sites, pools = [], {}
+    for index in range(num_sites):
+        scenario = copy.deepcopy(base)
+        factor = rng.uniform(1 - arrival_spread, 1 + arrival_spread)
+        scenario['arrivals_per_hour'] = [float(rate) * factor for rate in default_arrivals]
+        site = {'name': f'site{index:04d}', 'scenario': scenario}
+        if pool_size > 1:
+            site['pool'] = f'pool{index // pool_size:04d}'
+            pools[site['pool']] = pool_radiologists
+        sites.append(site)
+    return {'sites': sites, 'pools': pools}
+
+
+def arrival_rates(scenario):
+    """Mean arrivals per clinic hour of a resolved scenario, as SimulationContext uses them."""
+    if scenario['arrivals_per_hour'] is None:
+        rates = list(load_params().pt_num_per_hour)
+        rates[-1] *= 2
+        return rates
+    return [float(rate) for rate in scenario['arrivals_per_hour']]
+
+
+def components(sites):
+    """
+    Splits the sites into groups that share no pool. Sites of different groups never
+    interact, so each group runs in an event loop of its own and the cost per event
+    depends on the size of the group, not of the network.
+    """
+    groups = {}
+    for site in sites:
+        groups.setdefault(site['pool'] if site['pool'] is not None else ('site', site['index']), []).append(site)
+    return list(groups.values())
+
+
+class NetworkContext(object):
+    """
+    Long-lived setup for replications of a group of sites in one SimPy environment, in
+    the way of run_simulation.SimulationContext: one MammoClinic per site with its own
+    resources, arrival process, AI schedule and random stream, and the shared radiologist
+    pools standing in for the same-day radiologists of their sites. reset() rewinds it all.
+
+    Each site draws from SeedSequence(seed, spawn_key=(site index,)), so a site's days do not
+    depend on which other sites are simulated with it.
+
+    Args:
+        sites (list): Site dicts from load_network().
+        pools (dict): {pool name: radiologists}.
+    """
+    def __init__(self, sites, pools):
+        self.sites = sites
+        self.env = ReplayEnvironment()
+        self._arrivals = []
+        self.pools = {site['pool']: simpy.Resource(self.env, pools[site['pool']])
+                      for site in sites if site['pool'] is not None}
+        self.clinics, self.rgs, self.ai_on, self.rates = [], [], [], []
+        self._resources = list(self.pools.values())
+        for site in sites:
+            scenario = site['scenario']
+            resources = scenario['resources']
+            rg = default_rng()
+            clinic = MammoClinic(
+                self.env,
+                resources['num_checkin_staff'],
+                resources['num_public_wait_room'],
+                resources['num_consent_staff'],
+                resources['num_change_room'],
+                resources['num_gowned_wait_room'],
+                resources['num_scanner'],
+                resources['num_us_machine'],
+                resources['num_radiologist'],
+                resources['num_radiologist_same_day'],
+                scenario['rad_change'],
+                scenario['rad_change_2'],
+                rg,
+                service_times=scenario['service_times'],
+                exam_dicts=exam_dicts_from_rows(scenario['exam_mix']) if scenario['exam_mix'] else None
+            )
+            if site['pool'] is not None:
+                clinic.radiologist_same_day = self.pools[site['pool']]
+            self._resources.extend(r for r in vars(clinic).values()
+                                   if isinstance(r, simpy.Resource) and r not in self._resources)
+            self.clinics.append(clinic)
+            self.rgs.append(rg)
+            self.ai_on.append(dict.fromkeys(CLINIC_HOURS, False))
+            self.rates.append(arrival_rates(scenario))
+
+    def reset(self, seed):
+        """Prepares a fresh replication of every site on `seed`."""
+        env = self.env
+        env.rewind(self._resources)
+
+        self._arrivals = []
+        for site, clinic, rg, ai_on, rates in zip(self.sites, self.clinics, self.rgs, self.ai_on, self.rates):
+            scenario = site['scenario']
+            stream, pct_stream = SeedSequence(seed, spawn_key=(site['index'],)).spawn(2)
+            rg.bit_generator.state = default_rng(stream).bit_generator.state
+            clinic.timestamps_list = []
+            schedule = scenario['ai_schedules'][scenario['ai_time']]
+            mean_sd = schedule['pct_dx_after_ai']
+            day_pct = default_rng(pct_stream).normal(*mean_sd) if mean_sd is not None else 0
+            for hour in CLINIC_HOURS:
+                ai_on[hour] = scenario['wf_1ss'] and hour in schedule['hours']
+            self._arrivals.append(env.process(run_clinic(
+                env, clinic, rg, rates, list(itertools.accumulate(rates)), day_pct, ai_on,
+                scenario['rad_change'], scenario['rad_change_2'], scenario['wf_1ss'], stoptime=scenario['stoptime'])))
+
+    def run(self):
+        """
+        Runs the replication prepared by reset().
+
+        Returns:
+            list: (timestamps_list, num_arrivals) per site.
+        """
+        self.env.run()
+        return [(clinic.timestamps_list, arrivals.value) for clinic, arrivals in zip(self.clinics, self._arrivals)]
+
+
+def _group_key(sites, pools):
+    content = [[site['index'], scenario_hash(site['scenario']), site['pool'],
+                pools.get(site['pool']) if site['pool'] else None] for site in sites]
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()[:16]
+
+
+_contexts = ContextCache()
+
+
+def _run_group(sites, pools, seeds):
+    """
+    Simulates a group of sites on `seeds` in this process (one NetworkContext per group).
+
+    Returns:
+        tuple: (KPIs with shape (len(seeds), len(sites), len(DAY_KPI_NAMES)), simulated patients, seconds).
+    """
+    context = _contexts.get(_group_key(sites, pools), lambda: NetworkContext(sites, pools))
+    start = time.perf_counter()
+    kpis = np.empty((len(seeds), len(sites), len(DAY_KPI_NAMES)))
+    patients = 0
+    for row, seed in enumerate(seeds):
+        context.reset(seed)
+        for column, (timestamps_list, num_arrivals) in enumerate(context.run()):
+            day = day_kpis(timestamps_list, num_arrivals=num_arrivals)
+            kpis[row, column] = [day[name] for name in DAY_KPI_NAMES]
+            patients += len(timestamps_list)
+    return kpis, patients, time.perf_counter() - start
+
+
+def simulate_network(sites, pools, seeds, workers=1):
+    """
+    Simulates every site of a network on `seeds`; groups of sites that share no pool are
+    independent tasks, spread over worker processes.
+
+    Returns:
+        tuple: (KPIs with shape (len(seeds), len(sites), len(DAY_KPI_NAMES)) in site order,
+                simulated patients, seconds spent simulating).
+    """
+    seeds = list(seeds)
+    groups = components(sites)
+    kpis = np.empty((len(seeds), len(sites), len(DAY_KPI_NAMES)))
+    if workers == 1:
+        results = [_run_group(group, pools, seeds) for group in groups]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            results = list(pool.map(_run_group, groups, [pools] * len(groups), [seeds] * len(groups)))
+    patients = seconds = 0
+    for group, (group_kpis, group_patients, group_seconds) in zip(groups, results):
+        kpis[:, [site['index'] for site in group]] = group_kpis
+        patients += group_patients
+        seconds += group_seconds
+    return kpis, patients, seconds
+
+
+def run_network():
+    """
+    Command line entry point: simulates a network of clinic sites with shared radiologist
+    pools, or measures how the cost per patient scales with the number of sites.
+    """
+    parser = argparse.ArgumentParser(description="Multi-site clinic network with shared same-day radiologist pools.")
+    parser.add_argument('--network', type=str, default=None,
+                        help='JSON/YAML/TOML network file (default: a synthetic network, see --num_sites)')
+    parser.add_argument('--num_sites', type=int, default=20, help='Sites of the synthetic network')
+    parser.add_argument('--pool_size', type=int, default=5, help='Sites per radiologist pool of the synthetic network')
+    parser.add_argument('--pool_radiologists', type=int, default=2, help='Radiologists per synthetic pool')
+    parser.add_argument('--num_replications', type=int, default=10, help='Days per site')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes (one task per group of sites)')
+    parser.add_argument('--scaling', nargs='+', type=int, default=None,
+                        help='Instead: time synthetic networks with these numbers of sites, all in one pool '
+                             'and in pools of --pool_size')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file with the mean KPIs per site')
+    args = parser.parse_args()
+    seeds = range(args.first_seed, args.first_seed + args.num_replications)
+
+    if args.scaling:
+        print(f"{'sites':>6}{'pooling':>14}{'patients/day':>14}{'us/patient':>12}")
+        for num_sites in args.scaling:
+            for pool_size, label in [(num_sites, 'one pool'), (args.pool_size, f'pools of {args.pool_size}')]:
+                sites, pools = load_network(synthetic_network(num_sites, pool_size, args.pool_radiologists))
+                _, patients, seconds = simulate_network(sites, pools, seeds, 1)
+                print(f"{num_sites:6d}{label:>14}{patients / len(seeds):14.0f}{seconds / patients * 1e6:12.1f}",
+                      flush=True)
+        return
+
+    if args.network:
+        sites, pools = load_network(read_file(args.network))
+    else:
+        sites, pools = load_network(synthetic_network(args.num_sites, args.pool_size, args.pool_radiologists))
+    start = time.perf_counter()
+    kpis, patients, _ = simulate_network(sites, pools, seeds, args.workers)
+    print(f"{len(sites)} sites, {len(pools)} pools, {len(components(sites))} independent groups: "
+          f"{len(seeds)} days, {patients} patients in {time.perf_counter() - start:.1f} s")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        means = np.nanmean(kpis, axis=0)
+    columns = [DAY_KPI_NAMES.index(name) for name in REPORT_KPIS]
+    print(f"\n{'site':<16}{'pool':<12}" + ''.join(f"{name:>26}" for name in REPORT_KPIS))
+    for site, row in zip(sites, means):
+        print(f"{site['name']:<16}{site['pool'] or '-':<12}" + ''.join(f"{row[c]:26.4f}" for c in columns))
+    if pools:
+        print(f"\n{'pool':<12}{'sites':>6}{'radiologists':>14}{'patients/day':>14}{'mean AI wait (h)':>18}")
+        wait = DAY_KPI_NAMES.index('mean_wait_for_ai_assess')
+        for name, capacity in pools.items():
+            members = [site['index'] for site in sites if site['pool'] == name]
+            print(f"{name:<12}{len(members):6d}{capacity:14d}"
+                  f"{np.sum(means[members, DAY_KPI_NAMES.index('n_patients')]):14.1f}"
+                  f"{np.nanmean(means[members, wait]):18.4f}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'seeds': list(seeds), 'pools': pools,
+                       'sites': [{'name': site['name'], 'pool': site['pool'],
+                                  'kpis': dict(zip(DAY_KPI_NAMES, map(float, row)))}
+                                 for site, row in zip(sites, means)]}, f, indent=2)
+        print(f"\nWrote the site KPIs to {args.out}")
+
+
+if __name__ == "__main__":
+    run_network()
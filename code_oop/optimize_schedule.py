@@ -0,0 +1,214 @@
+import argparse
+import json
+
+import numpy as np
+
+from batch import BatchRunner, kpi_column
+from params import load_params
+from scenarios import CLINIC_HOURS, EXAM_TYPES, load_scenario, resolve_scenario, scenario_hash
+
+# Volumes are rounded so that templates reached by different move sequences hash alike.
+VOLUME_DECIMALS = 6
+
+
+def template_volumes(scenario, params=None):
+    """
+    Booking template of a scenario as expected patients per clinic hour and exam type.
+
+    Returns:
+        numpy.ndarray: Shape (len(CLINIC_HOURS), len(EXAM_TYPES)); row sums are the arrival means.
+    """
+    params = params or load_params()
+    if scenario['arrivals_per_hour'] is None:
+        arrivals = np.array(params.pt_num_per_hour, dtype=float)
+        arrivals[-1] *= 2
+    else:
+        arrivals = np.array(scenario['arrivals_per_hour'], dtype=float)
+    mix = np.array(params.exam_percent if scenario['exam_mix'] is None else scenario['exam_mix'], dtype=float)
+    # the workflow assigns the last exam type to whatever share the others leave
+    mix[:, -1] = np.clip(1 - mix[:, :-1].sum(axis=1), 0, None)
+    return np.round(arrivals[:, None] * mix, VOLUME_DECIMALS)
+
+
+def template_scenario(base, volumes):
+    """The base scenario with the arrival means and exam mix of a volume template."""
+    arrivals = volumes.sum(axis=1)
+    mix = volumes / arrivals[:, None]
+    scenario = dict(base, name=None,
+                    arrivals_per_hour=[round(float(num), VOLUME_DECIMALS) for num in arrivals],
+                    exam_mix=[[round(float(share), VOLUME_DECIMALS) for share in row] for row in mix])
+    return resolve_scenario(scenario)
+
+
+def template_moves(volumes, movable, step, min_hourly):
+    """
+    All templates one move away: shift `step` patients of a movable exam type to the
+    previous or next hour, or add or remove `step` of them in one hour.
+
+    Returns:
+        list: (description, volumes) pairs.
+    """
+    moves = []
+
+    def keep(description, candidate):
+        if candidate.sum(axis=1).min() >= min_hourly and candidate.min() >= 0:
+            moves.append((description, np.round(candidate, VOLUME_DECIMALS)))
+
+    for exam in movable:
+        e = EXAM_TYPES.index(exam)
+        for h, hour in enumerate(CLINIC_HOURS):
+            for target in (h - 1, h + 1):
+                if 0 <= target < len(CLINIC_HOURS) and volumes[h, e] >= step:
+                    candidate = volumes.copy()
+                    candidate[h, e] -= step
+                    candidate[target, e] += step
+                    keep(f"move {step:g} '{exam}' {hour}:00 -> {CLINIC_HOURS[target]}:00", candidate)
+            candidate = volumes.copy()
+            candidate[h, e] += step
+            keep(f"add {step:g} '{exam}' at {hour}:00", candidate)
+            if volumes[h, e] >= step:
+                candidate = volumes.copy()
+                candidate[h, e] -= step
+                keep(f"remove {step:g} '{exam}' at {hour}:00", candidate)
+    return moves
+
+
+class ScheduleOptimizer(object):
+    """
+    Local search over booking templates: maximize the booked daily volume subject to
+    the mean daily p90 total_system_time staying at or below a target.
+
+    A template is the expected number of patients of each exam type in each clinic
+    hour; it becomes a scenario's arrivals_per_hour and exam_mix. Each step
+    evaluates every template one move away as one parallel batch on the same seeds
+    and moves to the best one: the largest feasible volume (ties go to the lower p90
+    LOS, which is how pure shifts out of peak hours get chosen), or while nothing is
+    feasible, the one closest to the target. Evaluated templates are memoized by
+    scenario hash.
+
+    Args:
+        base (dict): Scenario whose template the search starts from.
+        target_p90 (float): Upper bound on the mean daily p90 length of stay, in hours.
+        seeds (list): Seeds every template is simulated on.
+        runner (BatchRunner): Executes and memoizes the simulations.
+        movable (list, optional): Exam types whose volume may be moved, added or removed.
+                                  Defaults to ['screen'].
+        step (float, optional): Patients per move. Defaults to 0.5.
+        min_hourly (float, optional): Smallest arrival mean allowed in any hour. Defaults to 1.0.
+    """
+    def __init__(self, base, target_p90, seeds, runner, movable=None, step=0.5, min_hourly=1.0):
+        self.base = resolve_scenario(base)
+        self.target_p90 = target_p90
+        self.seeds = list(seeds)
+        self.runner = runner
+        self.movable = movable or ['screen']
+        self.step = step
+        self.min_hourly = min_hourly
+        self.evaluations = {}
+
+    def evaluate(self, templates):
+        """
+        Simulates a batch of volume templates and returns one evaluation dict per template.
+        """
+        scenarios = [template_scenario(self.base, volumes) for volumes in templates]
+        kpis = self.runner.run(scenarios, self.seeds)
+        results = []
+        for volumes, scenario, days in zip(templates, scenarios, kpis):
+            key = scenario_hash(scenario)
+            if key not in self.evaluations:
+                p90_days = days[:, kpi_column('p90_total_system_time')]
+                unfinished_days = days[:, kpi_column('n_unfinished')]
+                self.evaluations[key] = {
+                    'volumes': volumes,
+                    'booked_volume': float(volumes.sum()),
+                    'throughput': float(np.mean(days[:, kpi_column('n_patients')])),
+                    'p90_los': float(np.mean(p90_days)),
+                    'mean_los': float(np.mean(days[:, kpi_column('mean_total_system_time')])),
+                    'mean_unfinished': float(np.mean(unfinished_days)),
+                    'feasible': bool(np.mean(p90_days) <= self.target_p90 and not unfinished_days.any()),
+                    'hash': key,
+                }
+            results.append(self.evaluations[key])
+        return results
+
+    def _rank(self, evaluation):
+        if evaluation['feasible']:
+            return (0, -evaluation['booked_volume'], evaluation['p90_los'])
+        return (1, evaluation['mean_unfinished'], evaluation['p90_los'] - self.target_p90,
+                -evaluation['booked_volume'])
+
+    def search(self, max_steps=100, verbose=True):
+        """
+        Runs the local search from the base template.
+
+        Returns:
+            dict: The best evaluation found (check its 'feasible' flag).
+        """
+        current = self.evaluate([template_volumes(self.base)])[0]
+        for step in range(max_steps):
+            moves = template_moves(current['volumes'], self.movable, self.step, self.min_hourly)
+            if not moves:
+                break
+            batch = self.evaluate([volumes for _, volumes in moves])
+            index = min(range(len(batch)), key=lambda i: self._rank(batch[i]))
+            if self._rank(batch[index]) >= self._rank(current):
+                break
+            current = batch[index]
+            if verbose:
+                print(f"step {step}: {moves[index][0]}; booked {current['booked_volume']:.1f}/day, "
+                      f"p90 LOS {current['p90_los']:.3f} h ({self.runner.num_simulated} days simulated so far)")
+        return current
+
+
+def run_optimize_schedule():
+    """
+    Command line entry point: searches for a booking template with more throughput at a bounded p90 LOS.
+    """
+    parser = argparse.ArgumentParser(description="Optimize the hourly booking template against a p90 LOS target.")
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='Scenario file with the starting template and clinic (default: the baseline scenario)')
+    parser.add_argument('--target_p90', type=float, default=2.0, help='Target mean daily p90 length of stay, hours')
+    parser.add_argument('--movable', nargs='+', default=['screen'], choices=EXAM_TYPES,
+                        help='Exam types whose bookings may be moved, added or removed')
+    parser.add_argument('--step', type=float, default=0.5, help='Patients per hour moved by one search move')
+    parser.add_argument('--min_hourly', type=float, default=1.0, help='Smallest arrival mean allowed in any hour')
+    parser.add_argument('--num_replications', type=int, default=20, help='Days (common seeds) per template')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--max_steps', type=int, default=100, help='Maximum local search steps')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--out', type=str, default=None,
+                        help='Optional JSON file with the best template as a ready-to-use scenario')
+    args = parser.parse_args()
+
+    base = {}
+    if args.scenario:
+        base = load_scenario(args.scenario)
+    seeds = list(range(args.first_seed, args.first_seed + args.num_replications))
+
+    with BatchRunner(workers=args.workers) as runner:
+        optimizer = ScheduleOptimizer(base, args.target_p90, seeds, runner, movable=args.movable,
+                                      step=args.step, min_hourly=args.min_hourly)
+        start = optimizer.evaluate([template_volumes(optimizer.base)])[0]
+        best = optimizer.search(max_steps=args.max_steps)
+
+    status = 'meets' if best['feasible'] else 'does NOT meet'
+    print(f"\n{len(optimizer.evaluations)} templates evaluated. Best {status} target {args.target_p90}:")
+    print(f"{'':<12}{'booked/day':>12}{'patients/day':>14}{'p90 LOS':>10}{'mean LOS':>10}")
+    for label, evaluation in [('start', start), ('best', best)]:
+        print(f"{label:<12}{evaluation['booked_volume']:12.1f}{evaluation['throughput']:14.1f}"
+              f"{evaluation['p90_los']:10.3f}{evaluation['mean_los']:10.3f}")
+    columns = [EXAM_TYPES.index(exam) for exam in args.movable]
+    print(f"\n{'hour':<8}{'arrivals start':>16}{'arrivals best':>15}{'movable start':>15}{'movable best':>14}")
+    for h, hour in enumerate(CLINIC_HOURS):
+        print(f"{f'{hour}:00':<8}{start['volumes'][h].sum():16.2f}{best['volumes'][h].sum():15.2f}"
+              f"{start['volumes'][h, columns].sum():15.2f}{best['volumes'][h, columns].sum():14.2f}")
+
+    if args.out:
+        scenario = template_scenario(optimizer.base, best['volumes'])
+        with open(args.out, 'w') as f:
+            json.dump(scenario, f, indent=2)
+        print(f"\nWrote the best template as a scenario to {args.out}")
+
+
+if __name__ == "__main__":
+    run_optimize_schedule()
@@ -0,0 +1,203 @@
+import argparse
+import copy
+import json
+
+import numpy as np
+
+from batch import BatchRunner, kpi_column
+from scenarios import load_scenario, resolve_scenario, scenario_hash
+
+# Resource counts the optimizer may change and their relative cost per unit.
+DEFAULT_COSTS = {
+    'num_scanner': 5.0,
+    'num_us_machine': 2.0,
+    'num_radiologist': 4.0,
+    'num_radiologist_same_day': 4.0,
+}
+
+
+def staffing_cost(levels, costs):
+    return float(sum(costs[name] * count for name, count in levels.items()))
+
+
+def with_levels(base, levels):
+    """Returns a copy of the base scenario with the given resource counts."""
+    scenario = copy.deepcopy(base)
+    scenario['resources'].update(levels)
+    scenario['name'] = None
+    return resolve_scenario(scenario)
+
+
+def neighbors(levels, bounds):
+    """All resource vectors one unit up or down in a single resource, within bounds."""
+    result = []
+    for name in levels:
+        for step in (-1, 1):
+            count = levels[name] + step
+            if bounds[name][0] <= count <= bounds[name][1]:
+                result.append(dict(levels, **{name: count}))
+    return result
+
+
+def pareto_front(evaluations):
+    """
+    Non-dominated evaluations when minimizing both cost and p90 LOS, sorted by cost.
+    """
+    front = []
+    for candidate in sorted(evaluations, key=lambda e: (e['cost'], e['p90_los'])):
+        if not front or candidate['p90_los'] < front[-1]['p90_los']:
+            front.append(candidate)
+    return front
+
+
+class StaffingOptimizer(object):
+    """
+    Local search over integer resource vectors: minimize cost subject to the mean
+    daily p90 total_system_time staying at or below a target.
+
+    Each step evaluates all one-unit neighbors of the current vector as one parallel
+    batch on the same seeds (common random numbers), and moves to the best one:
+    the cheapest feasible neighbor, or while nothing is feasible, the one closest to
+    the target. Configurations already evaluated are served from the BatchRunner cache.
+
+    Args:
+        base (dict): Scenario to start from; its resource counts are the initial vector.
+        target_p90 (float): Upper bound on the mean daily p90 length of stay, in hours.
+        seeds (list): Seeds every configuration is simulated on.
+        runner (BatchRunner): Executes and memoizes the simulations.
+        costs (dict, optional): Cost per unit of each optimized resource. Defaults to DEFAULT_COSTS.
+        bounds (dict, optional): name -> (min, max) count. Defaults to 1 (0 for
+                                 num_radiologist_same_day) up to the initial count + 3.
+    """
+    def __init__(self, base, target_p90, seeds, runner, costs=None, bounds=None):
+        self.base = resolve_scenario(base)
+        self.target_p90 = target_p90
+        self.seeds = list(seeds)
+        self.runner = runner
+        self.costs = dict(costs or DEFAULT_COSTS)
+        if not self.base['rad_change']:
+            # a same-day radiologist only exists when rad_change is set
+            self.costs.pop('num_radiologist_same_day', None)
+        resources = self.base['resources']
+        self.bounds = {name: (1 if name != 'num_radiologist_same_day' or self.base['rad_change'] else 0,
+                              resources[name] + 3) for name in self.costs}
+        self.bounds.update(bounds or {})
+        self.evaluations = {}
+
+    def evaluate(self, candidates):
+        """
+        Simulates a batch of resource vectors and returns one evaluation dict per vector.
+        """
+        scenarios = [with_levels(self.base, levels) for levels in candidates]
+        kpis = self.runner.run(scenarios, self.seeds)
+        p90 = kpis[:, :, kpi_column('p90_total_system_time')]
+        mean_los = kpis[:, :, kpi_column('mean_total_system_time')]
+        unfinished = kpis[:, :, kpi_column('n_unfinished')]
+        results = []
+        for levels, scenario, p90_days, los_days, unfinished_days in zip(candidates, scenarios, p90, mean_los,
+                                                                          unfinished):
+            key = scenario_hash(scenario)
+            if key not in self.evaluations:
+                self.evaluations[key] = {
+                    'levels': levels,
+                    'cost': staffing_cost(levels, self.costs),
+                    'p90_los': float(np.mean(p90_days)),
+                    'p90_los_se': float(np.std(p90_days, ddof=1) / np.sqrt(len(p90_days))) if len(p90_days) > 1
+                    else float('nan'),
+                    'mean_los': float(np.mean(los_days)),
+                    'mean_unfinished': float(np.mean(unfinished_days)),
+                    # patients that never leave are missing from the LOS, so any makes a configuration infeasible
+                    'feasible': bool(np.mean(p90_days) <= self.target_p90 and not unfinished_days.any()),
+                    'hash': key,
+                }
+            results.append(self.evaluations[key])
+        return results
+
+    def _rank(self, evaluation):
+        if evaluation['feasible']:
+            return (0, evaluation['cost'], evaluation['p90_los'])
+        return (1, evaluation['mean_unfinished'], evaluation['p90_los'] - self.target_p90, evaluation['cost'])
+
+    def search(self, max_steps=50, verbose=True):
+        """
+        Runs the local search from the base resource counts.
+
+        Returns:
+            dict: The best evaluation found (check its 'feasible' flag).
+        """
+        current = self.evaluate([{name: self.base['resources'][name] for name in self.costs}])[0]
+        for step in range(max_steps):
+            batch = self.evaluate(neighbors(current['levels'], self.bounds))
+            best = min(batch, key=self._rank)
+            if verbose:
+                print(f"step {step}: {len(batch)} neighbors, {self.runner.num_simulated} days simulated so far; "
+                      f"current cost {current['cost']:.1f}, p90 LOS {current['p90_los']:.3f} h")
+            if self._rank(best) >= self._rank(current):
+                break
+            current = best
+        return current
+
+    def pareto_front(self):
+        return pareto_front([e for e in self.evaluations.values() if e['mean_unfinished'] == 0])
+
+
+def _parse_assignments(specs, convert):
+    values = {}
+    for spec in specs:
+        name, value = spec.split('=', 1)
+        if name not in DEFAULT_COSTS:
+            raise ValueError(f"Unknown resource '{name}', expected one of {list(DEFAULT_COSTS)}.")
+        values[name] = convert(value)
+    return values
+
+
+def _format_levels(levels):
+    return ' '.join(f"{name.replace('num_', '')}={count}" for name, count in levels.items())
+
+
+def run_optimize_staffing():
+    """
+    Command line entry point: searches for the cheapest staffing that meets a p90 LOS target.
+    """
+    parser = argparse.ArgumentParser(description="Optimize staffing and equipment levels against a p90 LOS target.")
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='Scenario file with the starting configuration (default: the baseline scenario)')
+    parser.add_argument('--target_p90', type=float, default=2.0, help='Target mean daily p90 length of stay, hours')
+    parser.add_argument('--num_replications', type=int, default=20, help='Days (common seeds) per configuration')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--cost', action='append', default=[], help='Unit cost, e.g. num_scanner=6 (repeatable)')
+    parser.add_argument('--bounds', action='append', default=[], help='Count range, e.g. num_scanner=2:5 (repeatable)')
+    parser.add_argument('--max_steps', type=int, default=50, help='Maximum local search steps')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file for all evaluations and the front')
+    args = parser.parse_args()
+
+    base = {}
+    if args.scenario:
+        base = load_scenario(args.scenario)
+    costs = dict(DEFAULT_COSTS, **_parse_assignments(args.cost, float))
+    bounds = _parse_assignments(args.bounds, lambda v: tuple(int(x) for x in v.split(':')))
+    seeds = list(range(args.first_seed, args.first_seed + args.num_replications))
+
+    with BatchRunner(workers=args.workers) as runner:
+        optimizer = StaffingOptimizer(base, args.target_p90, seeds, runner, costs=costs, bounds=bounds)
+        best = optimizer.search(max_steps=args.max_steps)
+
+    status = 'meets' if best['feasible'] else 'does NOT meet'
+    print(f"\nBest: {_format_levels(best['levels'])}  cost {best['cost']:.1f}  "
+          f"p90 LOS {best['p90_los']:.3f} +/- {best['p90_los_se']:.3f} h ({status} target {args.target_p90})")
+    front = optimizer.pareto_front()
+    print(f"\nCost vs p90 LOS Pareto front ({len(optimizer.evaluations)} configurations evaluated):")
+    for evaluation in front:
+        print(f"  cost {evaluation['cost']:7.1f}  p90 LOS {evaluation['p90_los']:7.3f} h  "
+              f"{_format_levels(evaluation['levels'])}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'target_p90': args.target_p90, 'seeds': seeds, 'costs': optimizer.costs, 'best': best,
+                       'pareto_front': front, 'evaluations': list(optimizer.evaluations.values())}, f, indent=2)
+        print(f"\nWrote results to {args.out}")
+
+
+if __name__ == "__main__":
+    run_optimize_staffing()
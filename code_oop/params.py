@@ -1,71 +1,130 @@
-import pandas as pd
+import csv
+import hashlib
+import math
+import os
 
-def exam_percent_dict(dict, exam_type_list, value_list):
-    for exam_type, value in zip(exam_type_list, value_list):
-        dict[exam_type] = value
-    return dict
+import numpy as np
 
-def exam_type_prob(time):
-    if time <= 1.0: #7-8
-        return dict_7_8
-    elif time <= 2.0 and time > 1.0: #8-9
-        return dict_8_9
-    elif time <=3.0 and time > 2.0: #9-10
-        return dict_9_10
-    elif time <=4.0 and time > 3.0: # 10-11
-        return dict_10_11
-    elif time <=5.0 and time > 4.0: # 11-12
-        return dict_11_12
-    elif time <=6.0 and time > 5.0: # 12-13
-        return dict_12_13
-    elif time <=7.0 and time > 6.0: # 13-14
-        return dict_13_14
-    elif time <=8.0 and time > 7.0: # 14-15
-        return dict_14_15
-    elif time <=9.0 and time > 8.0: # 15-16
-        return dict_15_16
-    elif time <=10.0 and time > 9.0: #16-17
-        return dict_16_17
-
-#  dicts specifying % of exam at each hour
-exam_percent_df = pd.read_csv('./data/exam_percent_BK_22_12.csv')
+# Input files live next to this module, so imports work from any working directory.
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+EXAM_PERCENT_CSV = 'exam_percent_BK_22_12.csv'
+NUM_PT_PER_HOUR_CSV = 'num_pt_per_hour_BK_22_12.csv'
+CACHE_DIR_NAME = '.cache'
+
+CLINIC_HOURS = list(range(7, 17))
 
 # rearrange columns
 # seq: screen mammo, dx mammo us, dx mammo, dx us, bx us, bx mammo, screen us, bx mri, mri
 new_list = ['Screen Mammo', 'Dx Mammo + Dx US', 'Dx Mammo', 'Dx US', 'Bx US', 'Bx Mammo', 'Screen US', 'Bx MRI', 'MRI']
-exam_percent_df['new_order'] = exam_percent_df['exam_type_new'].apply(lambda x: new_list.index(x))
-exam_percent_df = exam_percent_df.sort_values(by='new_order').reset_index(drop=True)
-exam_percent_df = exam_percent_df.drop(columns='new_order')
-
 exam_type_list = ['screen', 'dx mammo us', 'dx mammo',  'dx us',
                    'us bx', 'mammo bx', 'screen us', 'mri-guided bx', 'mri']
-dict_7_8 = {}
-dict_7_8 = exam_percent_dict(dict_7_8, exam_type_list, list(exam_percent_df.h_7))
 
-dict_8_9 = {}
-dict_8_9 = exam_percent_dict(dict_8_9, exam_type_list, list(exam_percent_df.h_8))
+_loaded = {}
+
+
+def exam_percent_dict(dict, exam_type_list, value_list):
+    for exam_type, value in zip(exam_type_list, value_list):
+        dict[exam_type] = value
+    return dict
+
+
+def exam_dicts_from_rows(rows):
+    """One {exam type: share} dict per clinic hour from rows of shares in exam_type_list order."""
+    return [exam_percent_dict({}, exam_type_list, [float(v) for v in row]) for row in rows]
+
+
+class ClinicParams(object):
+    """
+    Compiled model inputs.
+
+    Attributes:
+        exam_percent (numpy.ndarray): Exam mix per clinic hour, shape (10, 9); row h is
+                                      7+h o'clock, columns follow exam_type_list.
+        pt_num_per_hour (list): Average number of arriving patients per clinic hour.
+        exam_dicts (list): One {exam type: share} dict per clinic hour.
+    """
+    def __init__(self, exam_percent, pt_num_per_hour):
+        self.exam_percent = exam_percent
+        self.pt_num_per_hour = [float(num) for num in pt_num_per_hour]
+        self.exam_dicts = exam_dicts_from_rows(exam_percent)
+
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def _parse_exam_percent(path):
+    with open(path, newline='') as f:
+        rows = {row['exam_type_new']: row for row in csv.DictReader(f)}
+    return np.array([[float(rows[exam][f'h_{hour}']) for exam in new_list] for hour in CLINIC_HOURS])
+
+
+def _parse_num_pt_per_hour(path):
+    with open(path, newline='') as f:
+        return np.array([float(row['avg']) for row in csv.DictReader(f)])
+
+
+def _load_compiled(path, parse, cache_dir):
+    """
+    Returns the array parsed from a CSV, via a .npy cache keyed by the CSV's hash.
 
-dict_9_10 = {}
-dict_9_10 = exam_percent_dict(dict_9_10, exam_type_list, list(exam_percent_df.h_9))
+    The cache is opened memory-mapped, so processes loading the same inputs share
+    the pages instead of each parsing the CSV. A read-only data folder just means
+    the CSV is parsed every time.
+    """
+    if cache_dir is None:
+        return parse(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(cache_dir, f'{stem}-{_file_hash(path)}.npy')
+    if os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode='r')
+    array = parse(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return array
 
-dict_10_11 = {}
-dict_10_11 = exam_percent_dict(dict_10_11, exam_type_list, list(exam_percent_df.h_10))
 
-dict_11_12 = {}
-dict_11_12 = exam_percent_dict(dict_11_12, exam_type_list, list(exam_percent_df.h_11))
+def load_params(data_dir=None, use_cache=True):
+    """
+    Loads the model inputs once per process and data folder.
 
-dict_12_13 = {}
-dict_12_13 = exam_percent_dict(dict_12_13, exam_type_list, list(exam_percent_df.h_12))
+    Args:
+        data_dir (str, optional): Folder with the input CSVs. Defaults to ./data next to this module.
+        use_cache (bool, optional): Read/write the compiled .npy cache in data_dir/.cache. Defaults to True.
 
-dict_13_14 = {}
-dict_13_14 = exam_percent_dict(dict_13_14, exam_type_list, list(exam_percent_df.h_13))
+    Returns:
+        ClinicParams: The compiled inputs.
+    """
+    data_dir = os.path.abspath(data_dir or DATA_DIR)
+    if data_dir not in _loaded:
+        cache_dir = os.path.join(data_dir, CACHE_DIR_NAME) if use_cache else None
+        exam_percent = _load_compiled(os.path.join(data_dir, EXAM_PERCENT_CSV), _parse_exam_percent, cache_dir)
+        pt_num_per_hour = _load_compiled(os.path.join(data_dir, NUM_PT_PER_HOUR_CSV), _parse_num_pt_per_hour,
+                                         cache_dir)
+        _loaded[data_dir] = ClinicParams(exam_percent, pt_num_per_hour)
+    return _loaded[data_dir]
 
-dict_14_15 = {}
-dict_14_15 = exam_percent_dict(dict_14_15, exam_type_list, list(exam_percent_df.h_14))
 
-dict_15_16 = {}
-dict_15_16 = exam_percent_dict(dict_15_16, exam_type_list, list(exam_percent_df.h_15))
+def exam_type_prob(time, exam_dicts=None):
+    # hour 7-8 covers time <= 1.0, hour 8-9 covers (1.0, 2.0], ...
+    hour_index = max(math.ceil(time) - 1, 0)
+    if hour_index >= len(CLINIC_HOURS):
+        raise ValueError(f"Arrival time {time} is after the last clinic hour.")
+    if exam_dicts is None:
+        exam_dicts = load_params().exam_dicts
+    return exam_dicts[hour_index]
 
-dict_16_17 = {}
-dict_16_17 = exam_percent_dict(dict_16_17, exam_type_list, list(exam_percent_df.h_16))
 
+def __getattr__(name):
+    # dicts specifying % of exam at each hour, e.g. dict_7_8, kept for existing callers
+    for hour_index, hour in enumerate(CLINIC_HOURS):
+        if name == f'dict_{hour}_{hour + 1}':
+            return load_params().exam_dicts[hour_index]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
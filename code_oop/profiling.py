@@ -0,0 +1,216 @@
+import cProfile
+import contextlib
+import inspect
+import os
+import pstats
+import signal
+import time
+from collections import Counter, defaultdict
+
+PROFILE_MODES = ['cprofile', 'sample']
+
+
+def code_owners(modules):
+    """
+    Maps each method's code location to 'ClassName.method' for the classes in modules.
+
+    cProfile keys functions by (filename, first line, name), which loses the class;
+    this lets the report attribute time to e.g. DxMammoUSWorkflow.run.
+
+    Args:
+        modules (list): Imported modules to scan for classes.
+
+    Returns:
+        dict: (co_filename, co_firstlineno, co_name) -> 'ClassName.method'.
+    """
+    owners = {}
+    for module in modules:
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            for attr_name, attr in vars(cls).items():
+                code = getattr(attr, '__code__', None)
+                if code is not None:
+                    owners[(code.co_filename, code.co_firstlineno, code.co_name)] = f'{class_name}.{attr_name}'
+    return owners
+
+
+def categorize(func_key):
+    """Buckets a pstats function key into a coarse cost category."""
+    filename, _, name = func_key
+    if 'simpy' in filename:
+        return 'simpy scheduling'
+    if 'pandas' in filename:
+        return 'pandas'
+    if 'numpy' in filename or 'numpy.random' in name or 'Generator' in name:
+        return 'numpy draws'
+    if filename == '~':
+        return 'builtins'
+    if os.path.dirname(os.path.abspath(filename)) == os.path.dirname(os.path.abspath(__file__)):
+        return 'model code'
+    return 'other'
+
+
+class PhaseProfiler:
+    """
+    Collects wall-clock time and a profile per simulation phase.
+
+    Phases are entered with `with profiler.phase('event loop'):` and may be
+    entered many times (once per replication); their profiles accumulate.
+
+    Args:
+        mode (str): 'cprofile' for deterministic profiling or 'sample' for a
+                    SIGPROF stack sampler (POSIX only, lower overhead).
+        interval (float): Sampling period in seconds for mode='sample'.
+        owner_modules (list, optional): Modules whose classes are reported
+                                        individually (workflow handlers, clinic).
+    """
+    def __init__(self, mode='cprofile', interval=0.001, owner_modules=None):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'. Choose from {PROFILE_MODES}.")
+        if mode == 'sample' and not hasattr(signal, 'setitimer'):
+            raise ValueError("Sampling profiles need signal.setitimer, which this platform lacks. Use 'cprofile'.")
+        self.mode = mode
+        self.interval = interval
+        self.owners = code_owners(owner_modules or [])
+        self.wall_time = defaultdict(float)
+        self.entries = Counter()
+        self.profiles = {}
+        self.samples = defaultdict(Counter)
+        self.current_phase = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.entries[name] += 1
+        outer_phase = self.current_phase
+        self.current_phase = name
+        if self.mode == 'cprofile':
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                self.wall_time[name] += time.perf_counter() - start
+                self.current_phase = outer_phase
+        else:
+            previous = signal.signal(signal.SIGPROF, self._on_sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                signal.setitimer(signal.ITIMER_PROF, 0, 0)
+                signal.signal(signal.SIGPROF, previous)
+                self.wall_time[name] += time.perf_counter() - start
+                self.current_phase = outer_phase
+
+    def _on_sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            stack.append(self.owners.get(key) or f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        stack.append(self.current_phase)
+        self.samples[self.current_phase][';'.join(reversed(stack))] += 1
+
+    def _phase_stats(self, name):
+        profile = self.profiles.get(name)
+        if profile is None:
+            return None
+        return pstats.Stats(profile)
+
+    def _by_owner(self):
+        """Aggregates self time (and calls) per owning class across all phases."""
+        totals = defaultdict(lambda: [0, 0.0])
+        if self.mode == 'cprofile':
+            for name in self.profiles:
+                for func_key, (_, num_calls, tottime, _, _) in self._phase_stats(name).stats.items():
+                    owner = self.owners.get(func_key)
+                    if owner is not None:
+                        cls = owner.split('.')[0]
+                        totals[cls][0] += num_calls
+                        totals[cls][1] += tottime
+        else:
+            for counter in self.samples.values():
+                for stack, count in counter.items():
+                    for frame_name in reversed(stack.split(';')):
+                        if frame_name in self.owners.values():
+                            totals[frame_name.split('.')[0]][1] += count * self.interval
+                            break
+        return totals
+
+    def _by_category(self):
+        totals = defaultdict(float)
+        if self.mode == 'cprofile':
+            for name in self.profiles:
+                for func_key, (_, _, tottime, _, _) in self._phase_stats(name).stats.items():
+                    totals[categorize(func_key)] += tottime
+        return totals
+
+    def report(self, top=10):
+        """
+        Returns a ranked text breakdown of phases, cost categories and handler classes.
+        """
+        lines = []
+        total = sum(self.wall_time.values()) or 1.0
+        lines.append(f'Profile ({self.mode}) - wall time by phase')
+        for name, seconds in sorted(self.wall_time.items(), key=lambda item: -item[1]):
+            lines.append(f'  {name:<22}{seconds:10.3f} s {100 * seconds / total:6.1f}%   x{self.entries[name]}')
+
+        categories = self._by_category()
+        if categories:
+            cat_total = sum(categories.values()) or 1.0
+            lines.append('Self time by category')
+            for name, seconds in sorted(categories.items(), key=lambda item: -item[1]):
+                lines.append(f'  {name:<22}{seconds:10.3f} s {100 * seconds / cat_total:6.1f}%')
+
+        owners = self._by_owner()
+        if owners:
+            lines.append('Self time by class (workflow handlers, clinic)')
+            for cls, (num_calls, seconds) in sorted(owners.items(), key=lambda item: -item[1][1]):
+                calls = f'{num_calls:>9} calls' if self.mode == 'cprofile' else ''
+                lines.append(f'  {cls:<32}{seconds:10.3f} s {calls}')
+
+        if self.mode == 'cprofile':
+            for name in sorted(self.wall_time, key=lambda item: -self.wall_time[item]):
+                stats = self._phase_stats(name)
+                ranked = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:top]
+                lines.append(f'Top {top} functions by self time in {name}')
+                for (filename, lineno, func_name), (_, num_calls, tottime, cumtime, _) in ranked:
+                    owner = self.owners.get((filename, lineno, func_name))
+                    label = owner or f'{os.path.basename(filename)}:{lineno}({func_name})'
+                    lines.append(f'  {tottime:8.3f} s self {cumtime:8.3f} s cum {num_calls:>9}  {label}')
+        return '\n'.join(lines)
+
+    def save(self, out_dir):
+        """
+        Writes one file per phase: '.pstats' (cprofile; open with pstats or snakeviz)
+        or '.folded' collapsed stacks (sample; feed to flamegraph.pl or speedscope).
+
+        Returns:
+            list: Paths written.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        for name in self.wall_time:
+            stem = os.path.join(out_dir, name.replace(' ', '_'))
+            if self.mode == 'cprofile':
+                path = stem + '.pstats'
+                self.profiles[name].dump_stats(path)
+            else:
+                path = stem + '.folded'
+                with open(path, 'w') as f:
+                    for stack, count in self.samples[name].most_common():
+                        f.write(f'{stack} {count}\n')
+            paths.append(path)
+        return paths
+
+
+def profile_phase(profiler, name):
+    """Returns profiler.phase(name), or a no-op context when profiling is off."""
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.phase(name)
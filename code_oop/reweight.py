@@ -0,0 +1,242 @@
+import argparse
+import concurrent.futures
+import copy
+import json
+import math
+import warnings
+
+import numpy as np
+
+from control_variates import covariate_recorder
+from kpis import DAY_KPI_NAMES, day_kpis
+from params import exam_type_prob
+from scenarios import AI_TIMES, load_scenario, resolve_scenario, scenario_name
+
+REPORT_KPIS = ['mean_total_system_time', 'p90_total_system_time', 'mean_wait_for_ai_assess',
+               'n_screen_dx_mammo_us']
+# Gauss-Hermite nodes for targets whose day values are drawn from a normal distribution
+QUADRATURE_NODES = 24
+
+
+def routing_counts(recorder):
+    """
+    Counts the patients of the last day routed by pct_dx_after_ai: arrivals while AI was
+    on whose exam-type draw fell in the screening share, split into those who stayed plain
+    screens and those sent to a same-day workup (any of the three after-AI paths).
+
+    Returns:
+        tuple: (plain screens, same-day workups).
+    """
+    context = recorder.context
+    plain = same_day = 0
+    for arrival_ts, number in recorder.exam_draws:
+        hour = math.floor(arrival_ts) + 7
+        if not (context.wf_1ss and context.ai_on_dict[hour]):
+            continue
+        screen = next(iter(exam_type_prob(arrival_ts, context.clinic.exam_dicts).values()))
+        if number <= screen * (1 - context.pct_dx_after_ai):
+            plain += 1
+        elif number <= screen:
+            same_day += 1
+    return plain, same_day
+
+
+def anchor_scenario(base, pct):
+    """The base scenario with every day's pct_dx_after_ai fixed at `pct`."""
+    scenario = copy.deepcopy(base)
+    scenario['name'] = None
+    scenario['ai_schedules'][scenario['ai_time']]['pct_dx_after_ai'] = [float(pct), 0.0]
+    return resolve_scenario(scenario)
+
+
+def _anchor_chunk(scenario, seeds):
+    recorder = covariate_recorder(scenario)
+    context = recorder.context
+    rows = []
+    for seed in seeds:
+        context.reset(seed)
+        recorder.clear()
+        timestamps_list, _ = context.run()
+        kpis = day_kpis(timestamps_list, num_arrivals=context.num_arrivals)
+        rows.append(([kpis[name] for name in DAY_KPI_NAMES], routing_counts(recorder)))
+    return rows
+
+
+def sample_anchors(base, anchors, num_days, first_seed=1, workers=1):
+    """
+    Simulates `num_days` days at each anchor value of pct_dx_after_ai (fixed per day).
+    Each anchor gets its own seeds (the j-th anchor first_seed + j * num_days onwards), so
+    that the days are independent and the mixture of the anchors is what was sampled.
+
+    Returns:
+        tuple: (kpis with shape (len(anchors) * num_days, len(DAY_KPI_NAMES)),
+                routing counts with shape (len(anchors) * num_days, 2)).
+    """
+    tasks = []
+    for j, pct in enumerate(anchors):
+        scenario = anchor_scenario(base, pct)
+        seeds = list(range(first_seed + j * num_days, first_seed + (j + 1) * num_days))
+        tasks.extend((scenario, seeds[i:i + 25]) for i in range(0, num_days, 25))
+    if workers == 1:
+        results = [_anchor_chunk(*task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_anchor_chunk, *zip(*tasks)))
+    rows = [row for chunk_rows in results for row in chunk_rows]
+    return np.array([row[0] for row in rows], dtype=float), np.array([row[1] for row in rows], dtype=float)
+
+
+def routing_log_likelihood(counts, pct):
+    """Log probability of each day's routing outcomes if pct_dx_after_ai were `pct` (counts from routing_counts)."""
+    pct = min(max(pct, 0.0), 1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_plain, log_same_day = np.log(1 - pct), np.log(pct)
+        # 0 * log(0) is 0: days without patients on that path do not rule the value out
+        return np.where(counts[:, 0] > 0, counts[:, 0] * log_plain, 0.0) + \
+            np.where(counts[:, 1] > 0, counts[:, 1] * log_same_day, 0.0)
+
+
+def _logsumexp(values, axis=0):
+    top = np.max(values, axis=axis, keepdims=True)
+    top = np.where(np.isfinite(top), top, 0.0)
+    with np.errstate(divide='ignore'):
+        return np.squeeze(top, axis=axis) + np.log(np.sum(np.exp(values - top), axis=axis))
+
+
+def sweep_weights(counts, anchors, mean, sd=0.0):
+    """
+    Likelihood ratios of days sampled evenly at the anchors (the mixture of them) to a
+    target where each day's pct_dx_after_ai is `mean`, or normal(mean, sd) when sd > 0
+    (integrated by Gauss-Hermite quadrature; draws above 1 route like 1, and draws below 0
+    are counted as 0, which is close as long as they are rare).
+    """
+    sampled = _logsumexp(np.array([routing_log_likelihood(counts, pct) for pct in anchors])) - math.log(len(anchors))
+    if sd > 0:
+        nodes, node_weights = np.polynomial.hermite_e.hermegauss(QUADRATURE_NODES)
+        log_node_weights = np.log(node_weights / node_weights.sum())
+        target = _logsumexp(np.array([log_w + routing_log_likelihood(counts, mean + sd * node)
+                                      for node, log_w in zip(nodes, log_node_weights)]))
+    else:
+        target = routing_log_likelihood(counts, mean)
+    return np.exp(target - sampled)
+
+
+def reweighted_estimates(kpis, weights, names=None, confidence=0.95):
+    """
+    Self-normalized likelihood-ratio estimates of day KPI means, with delta-method intervals.
+
+    Returns:
+        dict: 'ess' and, per KPI name, (mean, half_width).
+    """
+    from statistics import NormalDist
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    result = {'ess': float(weights.sum() ** 2 / np.sum(weights ** 2))}
+    for name in names or DAY_KPI_NAMES:
+        y = kpis[:, DAY_KPI_NAMES.index(name)]
+        keep = ~np.isnan(y)
+        w, y = weights[keep], y[keep]
+        if w.sum() <= 0:
+            result[name] = (math.nan, math.nan)
+            continue
+        mean = float(w @ y / w.sum())
+        half_width = z * math.sqrt(np.sum(w ** 2 * (y - mean) ** 2)) / w.sum()
+        result[name] = (mean, float(half_width))
+    return result
+
+
+def pct_sweep(kpis, counts, anchors, values, sd=0.0, names=None, min_ess=0.1):
+    """
+    Reweighted KPI estimates for every target value, warning where the effective
+    sample size falls below min_ess times the number of days.
+
+    Returns:
+        list: reweighted_estimates() per value, with its 'pct_dx_after_ai'.
+    """
+    results = []
+    for value in values:
+        estimate = reweighted_estimates(kpis, sweep_weights(counts, anchors, value, sd), names)
+        estimate['pct_dx_after_ai'] = float(value)
+        if estimate['ess'] < min_ess * len(kpis):
+            warnings.warn(f"pct_dx_after_ai {value:g}: effective sample size {estimate['ess']:.0f} of {len(kpis)} "
+                          f"days; add an anchor near it or more replications.")
+        results.append(estimate)
+    return results
+
+
+def run_reweight():
+    """
+    Command line entry point: KPIs over a range of pct_dx_after_ai from one set of simulations.
+    """
+    parser = argparse.ArgumentParser(description="Sweep pct_dx_after_ai by likelihood-ratio reweighting.")
+    parser.add_argument('--scenario', type=str, default=None, help='Scenario file with the 1SS scenario to sweep')
+    parser.add_argument('--ai_time', type=str, default='afternoon', choices=[t for t in AI_TIMES if t != 'none'],
+                        help='AI time of the 1SS scenario when no scenario file is given')
+    parser.add_argument('--values', nargs='+', type=float, default=None,
+                        help='pct_dx_after_ai values to estimate (default: 0.05 to 0.6 in steps of 0.05)')
+    parser.add_argument('--anchors', nargs='+', type=float, default=None,
+                        help='Values to simulate at (default: 3 spread over --values)')
+    parser.add_argument('--sd', type=float, default=None,
+                        help="Day-to-day SD of pct_dx_after_ai at every value (default: the scenario's; 0 fixes it)")
+    parser.add_argument('--kpis', nargs='+', default=REPORT_KPIS, choices=DAY_KPI_NAMES, help='Day KPIs to report')
+    parser.add_argument('--num_replications', type=int, default=100, help='Days per anchor')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ... over the anchors')
+    parser.add_argument('--min_ess', type=float, default=0.1,
+                        help='Warn below this effective sample size, as a fraction of the simulated days')
+    parser.add_argument('--validate', nargs='*', type=float, default=None,
+                        help='Also simulate these values directly and show both estimates')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file with the sweep')
+    args = parser.parse_args()
+
+    if args.scenario:
+        base = load_scenario(args.scenario)
+    else:
+        base = resolve_scenario({'wf_1ss': True, 'ai_time': args.ai_time})
+    schedule = base['ai_schedules'][base['ai_time']]
+    if not base['wf_1ss'] or schedule['pct_dx_after_ai'] is None:
+        raise ValueError("The sweep needs a 1SS scenario with AI on in some hours.")
+    values = args.values or [round(0.05 * i, 2) for i in range(1, 13)]
+    anchors = args.anchors or list(np.quantile(values, [1 / 6, 1 / 2, 5 / 6]))
+    sd = schedule['pct_dx_after_ai'][1] if args.sd is None else args.sd
+    num_days = len(anchors) * args.num_replications
+
+    print(f"{scenario_name(base)}: {len(anchors)} anchors x {args.num_replications} days "
+          f"(anchors {', '.join(f'{a:.3g}' for a in anchors)}); day SD {sd:g}")
+    kpis, counts = sample_anchors(base, anchors, args.num_replications, args.first_seed, args.workers)
+    results = pct_sweep(kpis, counts, anchors, values, sd, args.kpis, args.min_ess)
+
+    print(f"\n{'pct':>6}{'ESS':>7}" + ''.join(f"{name:>30}" for name in args.kpis))
+    for estimate in results:
+        cells = ''.join(f"{f'{estimate[name][0]:.4f} +/- {estimate[name][1]:.4f}':>30}" for name in args.kpis)
+        print(f"{estimate['pct_dx_after_ai']:6.3f}{estimate['ess']:7.0f}{cells}")
+
+    if args.validate is not None:
+        from batch import BatchRunner, kpi_column
+
+        checks = args.validate or [values[0], values[-1]]
+        print(f"\nDirect simulation ({num_days} days each, the seeds after the anchors'):")
+        direct_seeds = range(args.first_seed + num_days, args.first_seed + 2 * num_days)
+        targets = []
+        for value in checks:
+            scenario = copy.deepcopy(base)
+            scenario['ai_schedules'][scenario['ai_time']]['pct_dx_after_ai'] = [value, sd]
+            targets.append(resolve_scenario(scenario))
+        with BatchRunner(workers=args.workers) as runner:
+            direct = runner.run(targets, direct_seeds)
+        for value, days in zip(checks, direct):
+            estimate = reweighted_estimates(kpis, sweep_weights(counts, anchors, value, sd), args.kpis)
+            for name in args.kpis:
+                column = days[:, kpi_column(name)]
+                print(f"{value:6.3f} {name:<26} reweighted {estimate[name][0]:.4f} +/- {estimate[name][1]:.4f}   "
+                      f"direct {np.nanmean(column):.4f} +/- {1.96 * np.nanstd(column, ddof=1) / math.sqrt(len(column)):.4f}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'anchors': [float(a) for a in anchors], 'sd': sd, 'days_per_anchor': args.num_replications,
+                       'first_seed': args.first_seed, 'sweep': results}, f, indent=2)
+        print(f"\nWrote the sweep to {args.out}")
+
+
+if __name__ == "__main__":
+    run_reweight()
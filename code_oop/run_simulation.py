@@ -1,16 +1,23 @@
 import argparse
-import pandas as pd
+import collections
+import itertools
 import random
 import simpy
 import math
+from numpy.random import SeedSequence
 from numpy.random._generator import default_rng
 
+from antithetic import REPORT_KPIS, AntitheticGenerator, antithetic_summary
 from clinic_wf_1ss import MammographyClinicWorkflow
-from utils import MammoClinic, compute_durations
+from kpis import day_kpis
+from params import CLINIC_HOURS, exam_dicts_from_rows, load_params
+from profiling import PROFILE_MODES, PhaseProfiler, profile_phase
+from scenarios import load_scenario, resolve_scenario, scenario_hash
+from utils import MammoClinic, compute_durations, write_patient_log
 
 
 def run_clinic(env, clinic, rg, pt_num_list, acc_pt_num_list, pct_dx_after_ai, ai_on_dict,
-               rad_change, rad_change_2, wf_1ss, stoptime=None, max_arrivals=simpy.core.Infinity):
+               rad_change, rad_change_2, wf_1ss, stoptime=None, max_arrivals=simpy.core.Infinity, first_patient=0):
     """
     Simulates the patient flow through the mammography clinic.
 
@@ -28,8 +35,13 @@ def run_clinic(env, clinic, rg, pt_num_list, acc_pt_num_list, pct_dx_after_ai, a
         stoptime (float, optional): Simulation stop time. Defaults to None.
         max_arrivals (int, optional): Maximum number of patients to generate.
                                       Defaults to simpy.core.Infinity.
+        first_patient (int, optional): Patients that arrived before env.now, when continuing a
+                                       day that is under way. Defaults to 0.
+
+    Returns:
+        int: The number of patients that arrived (the value of the SimPy process).
     """
-    patient = 0  # Counter for patients, serves as unique patient ID
+    patient = first_patient  # Counter for patients, serves as unique patient ID
     cur_hour = math.floor(env.now)
 
     # Ensure this function always acts as a generator for SimPy
@@ -67,10 +79,287 @@ def run_clinic(env, clinic, rg, pt_num_list, acc_pt_num_list, pct_dx_after_ai, a
         elif math.floor(env.now) > cur_hour and patient >= acc_pt_num_list[cur_hour]:
             cur_hour = math.floor(env.now)
 
+    return patient
+
 
-def main(wf_1ss, rad_change, rad_change_2, seed=42, ai_time='none'):
+def draw_pct_dx_after_ai(mean_sd, seed):
     """
-    Main function to set up and run the mammography clinic simulation.
+    Draws a day's pct_dx_after_ai from its own random stream, spawned from the seed, so
+    that scenarios with and without AI share every arrival and service time draw. Only
+    contexts made for branching use it; the others draw from their main generator.
+
+    Args:
+        mean_sd (list): (mean, sd) of the normal draw, or None when the day has no AI.
+        seed (int): Seed of the replication.
+
+    Returns:
+        float: The percentage, 0 without AI.
+    """
+    if mean_sd is None:  # no 1ss
+        return 0
+    return default_rng(SeedSequence(seed).spawn(1)[0]).normal(*mean_sd)
+
+
+# simpy releases whose Environment and Process internals ReplayEnvironment.rewind() is written for
+REWIND_SIMPY_VERSIONS = ('4.',)
+
+
+class ReplayEnvironment(simpy.Environment):
+    """
+    SimPy environment that can be rewound to start another replication, so that the
+    resources and processes built on it are reused instead of rebuilt.
+
+    simpy has no public API for this: rewind() resets the clock, the event queue and the
+    event ids, and closes the generators of processes still waiting. It is the one place
+    that touches simpy internals, and it refuses to run on simpy releases other than
+    REWIND_SIMPY_VERSIONS.
+
+    Args:
+        initial_time (float, optional): Clock at the start. Defaults to 0.
+    """
+    can_rewind = getattr(simpy, '__version__', '').startswith(REWIND_SIMPY_VERSIONS)
+
+    def __init__(self, initial_time=0):
+        super().__init__(initial_time)
+        # the processes started since the last rewind, so rewind() can close those left waiting
+        self._started = []
+
+    def process(self, generator):
+        started = super().process(generator)
+        self._started.append(started)
+        return started
+
+    def rewind(self, resources, start_time=0):
+        """
+        Drops every pending event and resource claim and sets the clock to start_time.
+
+        Args:
+            resources (list): The simpy.Resource objects built on this environment.
+            start_time (float, optional): Clock to restart from. Defaults to 0.
+        """
+        if not self.can_rewind:
+            raise RuntimeError(f"ReplayEnvironment.rewind() supports simpy {', '.join(REWIND_SIMPY_VERSIONS)}x, "
+                               f"found {getattr(simpy, '__version__', 'unknown')}; install the simpy pinned "
+                               f"in requirements.txt.")
+        # Patients blocked for good (possible at very high load) still hold resource
+        # requests; closing them now runs their cleanup before the clock is rewound
+        # instead of whenever they are garbage collected.
+        for process in self._started:
+            if process.is_alive:
+                process._generator.close()
+        self._started.clear()
+
+        self._now = start_time
+        self._queue.clear()
+        self._eid = itertools.count()
+        self._active_proc = None
+        for resource in resources:
+            resource.users.clear()
+            resource.put_queue.clear()
+            resource.get_queue.clear()
+
+
+class SimulationContext(object):
+    """
+    Long-lived setup for running many replications of one scenario.
+
+    Holds the compiled inputs (arrival rates, AI schedule, resource counts, service
+    times) together with one SimPy environment and one MammoClinic. reset() rewinds
+    the environment, empties the resources and reseeds the random stream instead of
+    rebuilding them, and a replication gives the same result as a fresh setup with
+    the same seed.
+
+    Args:
+        scenario (dict): Scenario fields (see scenarios.DEFAULT_SCENARIO); missing fields take their defaults.
+        params (ClinicParams, optional): Compiled model inputs. Defaults to load_params().
+        antithetic (bool, optional): Draw through an AntitheticGenerator, so that reset() can replay
+                                     a seed with mirrored uniforms. Defaults to False.
+        pct_stream (bool, optional): Draw pct_dx_after_ai with draw_pct_dx_after_ai() instead of the
+                                     main generator, so that AI variants of a day can branch from
+                                     a shared prefix (see branching.py). Defaults to False.
+    """
+    def __init__(self, scenario, params=None, antithetic=False, pct_stream=False):
+        self.scenario = resolve_scenario(scenario)
+        self.antithetic = antithetic
+        self.pct_stream = pct_stream
+        self.wf_1ss = self.scenario['wf_1ss']
+        self.rad_change = self.scenario['rad_change']
+        self.rad_change_2 = self.scenario['rad_change_2']
+        self.ai_time = self.scenario['ai_time']
+        self.stoptime = self.scenario['stoptime']
+        resources = self.scenario['resources']
+
+        # AI time configuration; ai_on_dict is filled in by switch_ai() and read at each arrival,
+        # so switch_ai() can change the AI hours for the rest of a day, and pct_dx_after_ai is
+        # drawn per replication in reset()
+        self.pct_dx_after_ai_dist = self.scenario['ai_schedules'][self.ai_time]['pct_dx_after_ai']
+        self.ai_on_dict = dict.fromkeys(CLINIC_HOURS, False)
+        self.pct_dx_after_ai = 0
+
+        ### num pts per hour
+        if self.scenario['arrivals_per_hour'] is None:
+            self.pt_num_list = list((params or load_params()).pt_num_per_hour)
+            self.pt_num_list[-1] *= 2
+        else:
+            self.pt_num_list = [float(num) for num in self.scenario['arrivals_per_hour']]
+        self.acc_pt_num_list = list(itertools.accumulate(self.pt_num_list))
+
+        self.env = ReplayEnvironment()
+        self.rg = AntitheticGenerator() if antithetic else default_rng()
+        self._arrivals = None
+        self.clinic = MammoClinic(
+            self.env,
+            resources['num_checkin_staff'],
+            resources['num_public_wait_room'],
+            resources['num_consent_staff'],
+            resources['num_change_room'],
+            resources['num_gowned_wait_room'],
+            resources['num_scanner'],
+            resources['num_us_machine'],
+            resources['num_radiologist'],
+            resources['num_radiologist_same_day'],
+            self.rad_change,
+            self.rad_change_2,
+            self.rg,
+            service_times=self.scenario['service_times'],
+            exam_dicts=exam_dicts_from_rows(self.scenario['exam_mix']) if self.scenario['exam_mix'] else None
+        )
+        self._resources = [r for r in vars(self.clinic).values() if isinstance(r, simpy.Resource)]
+
+    def reset(self, seed, start_time=0, first_patient=0, mirror=False, pct_dx_after_ai=None):
+        """
+        Prepares a fresh replication: rewinds the clock, drops pending events and
+        resource claims, reseeds the random stream and schedules patient arrivals.
+
+        Args:
+            seed (int): Seed for the random number generator.
+            start_time (float, optional): Clock to start from, in hours since opening; a day under way
+                                          is continued from there (see twin.py). Defaults to 0.
+            first_patient (int, optional): Patients that arrived before start_time. Defaults to 0.
+            mirror (bool, optional): Replay the seed with mirrored uniforms, as the second day of an
+                                     antithetic pair; needs a context created with antithetic=True.
+                                     Defaults to False.
+            pct_dx_after_ai (float, optional): Use this percentage instead of drawing the day's
+                                               (see nested.py). Defaults to None.
+        """
+        if mirror and not self.antithetic:
+            raise ValueError("mirror=True needs a SimulationContext created with antithetic=True.")
+
+        env = self.env
+        env.rewind(self._resources, start_time)
+
+        if self.antithetic:
+            self.rg.reseed(seed, mirror)
+        else:
+            self.rg.bit_generator.state = default_rng(seed=seed).bit_generator.state
+        # a new list, so results handed out by earlier replications stay intact
+        self.clinic.timestamps_list = []
+        self.switch_ai(self.scenario)
+
+        if pct_dx_after_ai is not None:
+            self.pct_dx_after_ai = pct_dx_after_ai
+        elif self.pct_stream:
+            self.pct_dx_after_ai = draw_pct_dx_after_ai(self.pct_dx_after_ai_dist, seed)
+        elif self.pct_dx_after_ai_dist is None:  # no 1ss
+            self.pct_dx_after_ai = 0
+        else:
+            self.pct_dx_after_ai = self.rg.normal(*self.pct_dx_after_ai_dist)
+
+        self._arrivals = env.process(run_clinic(env, self.clinic, self.rg, self.pt_num_list, self.acc_pt_num_list,
+                                                self.pct_dx_after_ai, self.ai_on_dict,
+                                                self.rad_change, self.rad_change_2, self.wf_1ss,
+                                                stoptime=self.stoptime, first_patient=first_patient))
+
+    def switch_ai(self, scenario):
+        """
+        Applies the AI settings (wf_1ss, ai_time, ai_schedules) of a scenario to the
+        patients arriving from now on; patients already in the clinic keep theirs.
+
+        The rest of the context is left as is, including the day's pct_dx_after_ai, so
+        mid-replication this is only meaningful for scenarios that differ from the context's
+        own in the AI hours (see branching.py). Passing a scenario with wf_1ss false turns
+        AI off, even in a 1SS context.
+
+        Args:
+            scenario (dict): Resolved scenario (see scenarios.resolve_scenario) whose AI settings to use.
+        """
+        ai_schedule = scenario['ai_schedules'][scenario['ai_time']]
+        for hour in CLINIC_HOURS:
+            self.ai_on_dict[hour] = scenario['wf_1ss'] and hour in ai_schedule['hours']
+
+    def advance(self, until):
+        """
+        Runs the replication prepared by reset() up to (not including the events at) time `until`.
+        """
+        self.env.run(until=until)
+
+    def run(self):
+        """
+        Runs the replication prepared by reset() (or advanced by advance()) to completion.
+
+        Returns:
+            tuple: (timestamps_list, end_time) - one timestamps dict per patient and the simulation end time.
+        """
+        self.env.run()
+        return self.clinic.timestamps_list, self.env.now
+
+    @property
+    def num_arrivals(self):
+        """Patients that arrived in the last replication; more than len(timestamps_list) if some never left."""
+        return self._arrivals.value
+
+
+# Contexts kept per process and cache. Each holds a SimPy environment and a clinic, and
+# design sweeps send every point as a new scenario, so the least recently used are dropped.
+MAX_CONTEXTS = 32
+
+
+class ContextCache(object):
+    """
+    Per-process cache of simulation contexts that keeps the `maxsize` most recently used.
+    """
+    def __init__(self, maxsize=MAX_CONTEXTS):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, create):
+        """
+        Returns the context cached under `key`, calling create() on a miss.
+
+        Args:
+            key (hashable): Cache key, e.g. built from scenario_hash().
+            create (callable): Builds the context when it is not cached.
+        """
+        if key in self._items:
+            self._items.move_to_end(key)
+        else:
+            self._items[key] = create()
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return self._items[key]
+
+
+_contexts = ContextCache()
+
+
+def get_context(scenario, antithetic=False, pct_stream=False):
+    """
+    Returns this process's SimulationContext for a scenario, creating it on first use.
+    Only the MAX_CONTEXTS most recently used are kept.
+    """
+    key = (scenario_hash(scenario), antithetic, pct_stream)
+    return _contexts.get(key, lambda: SimulationContext(scenario, antithetic=antithetic, pct_stream=pct_stream))
+
+
+def simulate_day(wf_1ss, rad_change, rad_change_2, seed=42, ai_time='none', profiler=None, scenario=None,
+                 mirror=None):
+    """
+    Sets up and runs one simulated clinic day without writing any output.
+
+    Repeated calls for the same scenario reuse one SimulationContext.
 
     Args:
         wf_1ss (bool): True if 1SS (AI-driven workflow) is enabled, False otherwise.
@@ -79,101 +368,63 @@ def main(wf_1ss, rad_change, rad_change_2, seed=42, ai_time='none'):
         seed (int, optional): Seed for the random number generator. Defaults to 42.
         ai_time (str, optional): Time of day for AI assessment ('morning', 'afternoon', 'any', 'none').
                                  Defaults to 'none'.
+        profiler (PhaseProfiler, optional): Collects per-phase profiles when given. Defaults to None.
+        scenario (dict, optional): Full scenario to simulate; its workflow fields take precedence over
+                                   wf_1ss, rad_change, rad_change_2 and ai_time. Defaults to None.
+        mirror (bool, optional): Simulate one day of an antithetic pair: False for the first day, True
+                                 for the mirrored one (see antithetic.AntitheticGenerator). Defaults to
+                                 None, a plain day.
+
+    Returns:
+        tuple: (timestamps_list, end_time) - one timestamps dict per patient and the simulation end time.
     """
-    rg = default_rng(seed=seed)
+    if scenario is None:
+        scenario = {'wf_1ss': wf_1ss, 'ai_time': ai_time, 'rad_change': rad_change, 'rad_change_2': rad_change_2}
 
-    stoptime = 9.5
+    with profile_phase(profiler, 'setup'):
+        context = get_context(scenario, antithetic=mirror is not None)
+        context.reset(seed, mirror=bool(mirror))
 
-    num_checkin_staff = 3
-    num_public_wait_room = 20
-    num_consent_staff = 1
-    num_change_room = 3
-    num_gowned_wait_room = 5
-    num_scanner = 3
-    num_us_machine = 2
+    with profile_phase(profiler, 'event loop'):
+        return context.run()
 
-    # Determine radiologist numbers based on wf_1ss and rad_change
-    if wf_1ss:
-        num_radiologist = 3  # Number of general radiologists when 1SS is enabled
-        if rad_change:
-            num_radiologist_same_day = 1  # Dedicated radiologist for same-day
-        else:
-            num_radiologist_same_day = 0  # No dedicated same-day rad if rad_change is False
-    else:  # Baseline scenario (no 1SS)
-        num_radiologist = 4  # Number of general radiologists in baseline
-        num_radiologist_same_day = 0  # No dedicated rad in baseline
-
-    # AI time configuration
-    if ai_time == 'any':
-        pct_dx_after_ai = rg.normal(0.12, 0.05)
-        ai_on_dict = {7: True, 8: True, 9: True, 10: True, 11: True, 12: True,
-                      13: True, 14: True, 15: True, 16: True}
-    elif ai_time == "morning":
-        pct_dx_after_ai = rg.normal(0.36, 0.15)
-        ai_on_dict = {7: False, 8: False, 9: True, 10: True, 11: True, 12: False,
-                      13: False, 14: False, 15: False, 16: False}
-    elif ai_time == "afternoon":
-        pct_dx_after_ai = rg.normal(0.33, 0.12)
-        ai_on_dict = {7: False, 8: False, 9: False, 10: False, 11: False, 12: False,
-                      13: True, 14: True, 15: True, 16: False}
-    elif ai_time == "none":  # no 1ss
-        pct_dx_after_ai = 0
-        ai_on_dict = {7: False, 8: False, 9: False, 10: False, 11: False, 12: False,
-                      13: False, 14: False, 15: False, 16: False}
-
-    ### num pts per hour
-    num_pt_per_hour = pd.read_csv('./data/num_pt_per_hour_BK_22_12.csv')
-    pt_num_list = list(num_pt_per_hour.avg)
-    pt_num_list[-1] *= 2
-
-    acc_pt_num_list = []
-
-    curSum = 0
-    for num in pt_num_list:
-        curSum += num
-        acc_pt_num_list.append(curSum)
-
-    env = simpy.Environment()
-
-    # Instantiate MammoClinic with updated parameters
-    clinic = MammoClinic(
-        env,
-        num_checkin_staff,
-        num_public_wait_room,
-        num_consent_staff,
-        num_change_room,
-        num_gowned_wait_room,
-        num_scanner,
-        num_us_machine,
-        num_radiologist,
-        num_radiologist_same_day,
-        rad_change,
-        rad_change_2,
-        rg
-    )
-
-    # Run the simulation process
-    env.process(run_clinic(env, clinic,
-                           rg, pt_num_list, acc_pt_num_list, pct_dx_after_ai, ai_on_dict,
-                           rad_change, rad_change_2, wf_1ss,
-                           stoptime=stoptime))
-
-    env.run()
-
-    # create output files
-    clinic_patient_log_df = pd.DataFrame(clinic.timestamps_list)
 
+def _log_path(wf_1ss, seed, mirror=None):
     if wf_1ss:
-        clinic_patient_log_df.to_csv(
-            './output/log_1ss/clinic_patient_log_df_seed_' + str(seed) + '.csv', index=False)
+        path = './output/log_1ss/clinic_patient_log_df_seed_' + str(seed)
     else:
-        clinic_patient_log_df.to_csv(
-            './output/log_baseline/clinic_patient_log_df_baseline_seed_' + str(
-                seed) + '.csv', index=False)
+        path = './output/log_baseline/clinic_patient_log_df_baseline_seed_' + str(seed)
+    if mirror is not None:
+        path += '_antithetic_mirrored' if mirror else '_antithetic_first'
+    return path + '.csv'
 
-    # Note simulation end time
-    end_time = env.now
 
+def main(wf_1ss, rad_change, rad_change_2, seed=42, ai_time='none', profiler=None, scenario=None, mirror=None):
+    """
+    Main function to set up and run the mammography clinic simulation.
+
+    Args:
+        wf_1ss (bool): True if 1SS (AI-driven workflow) is enabled, False otherwise.
+        rad_change (bool): If True, a dedicated radiologist for screen + same day is present.
+        rad_change_2 (bool): When rad_change is True, this means dedicate one rad to screen + same day and regular dx.
+        seed (int, optional): Seed for the random number generator. Defaults to 42.
+        ai_time (str, optional): Time of day for AI assessment ('morning', 'afternoon', 'any', 'none').
+                                 Defaults to 'none'.
+        profiler (PhaseProfiler, optional): Collects per-phase profiles when given. Defaults to None.
+        scenario (dict, optional): Full scenario to simulate instead of the four workflow arguments.
+                                   Defaults to None.
+        mirror (bool, optional): Day of an antithetic pair to simulate (see simulate_day). Defaults to None.
+    """
+    if scenario is not None:
+        wf_1ss = resolve_scenario(scenario)['wf_1ss']
+    timestamps_list, end_time = simulate_day(wf_1ss, rad_change, rad_change_2, seed=seed, ai_time=ai_time,
+                                             profiler=profiler, scenario=scenario, mirror=mirror)
+
+    # create output files
+    with profile_phase(profiler, 'io'):
+        write_patient_log(timestamps_list, _log_path(wf_1ss, seed, mirror))
+
+    # Note simulation end time
     print(f"Simulation ended at time {end_time}")
 
     return (end_time)
@@ -183,6 +434,9 @@ def run_simulation():
     """
     Sets up the argument parser and runs the simulation based on command line arguments.
     """
+    # pandas is only needed for the post-processing below, not by simulate_day
+    import pandas as pd
+
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Command line argument parser for various parameters.")
 
@@ -195,6 +449,14 @@ def run_simulation():
                         help='Dedicate one rad to screen + same day: True or False')
     parser.add_argument('--rad_change_2', type=bool, default=False,
                         help='When rad_change is True, rad_change_2 means dedicate one rad to screen + same day and regular dx: True or False')
+    parser.add_argument('--profile', type=str, nargs='?', const='cprofile', default=None, choices=PROFILE_MODES,
+                        help='Profile each phase and workflow handler class: cprofile (default) or sample')
+    parser.add_argument('--profile_dir', type=str, default=None,
+                        help='Folder to save .pstats (cprofile) or .folded flamegraph stacks (sample) per phase')
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='JSON/YAML/TOML scenario file; replaces --wf_1ss, --ai_time, --rad_change and --rad_change_2')
+    parser.add_argument('--antithetic', action='store_true',
+                        help='Run each seed as an antithetic pair (a day and its mirror) and report the variance reduction')
 
     # Parse arguments
     args = parser.parse_args()
@@ -206,6 +468,19 @@ def run_simulation():
     ai_time = args.ai_time
     rad_change = args.rad_change
     rad_change_2 = args.rad_change_2
+    scenario = None
+    if args.scenario:
+        scenario = load_scenario(args.scenario)
+        wf_1ss = scenario['wf_1ss']
+        ai_time = scenario['ai_time']
+        rad_change = scenario['rad_change']
+        rad_change_2 = scenario['rad_change_2']
+        print(f'scenario: {args.scenario} ({scenario_hash(scenario)})')
+    profiler = None
+    if args.profile:
+        import clinic_wf_1ss
+        import utils
+        profiler = PhaseProfiler(args.profile, owner_modules=[utils, clinic_wf_1ss])
 
     print(f'num_iteration: {num_iteration}')
     print(f'wf_1ss: {wf_1ss}')
@@ -225,36 +500,51 @@ def run_simulation():
     if not wf_1ss and ai_time != "none":
         raise ValueError("If wf_1ss==False, ai_time can only be 'none.' Please change the argument for ai_time.")
 
+    # with --antithetic every seed is simulated twice, as the two days of a pair
+    members = [False, True] if args.antithetic else [None]
+    pair_kpis = {name: ([], []) for name in REPORT_KPIS}
     count = 0
     seed_list = []
     while count < num_iteration:
         seed = random.randint(1, 1000)
         if seed not in seed_list:
-            # Pass all relevant arguments to main, including rad_change_2
-            clinic_end_time = main(wf_1ss, rad_change, rad_change_2, seed=seed, ai_time=ai_time)
-
-            # clinical logs
-            if wf_1ss:
-                clinic_patient_log_df = pd.read_csv(
-                    './output/log_1ss/clinic_patient_log_df_seed_' + str(
-                        seed) + '.csv')
-                clinic_patient_log_df = compute_durations(clinic_patient_log_df)
-                clinic_patient_log_df.to_csv(
-                    './output/log_1ss/clinic_patient_log_df_seed_' + str(
-                        seed) + '.csv', index=False)
-            else:
-                clinic_patient_log_df_baseline = pd.read_csv(
-                    './output/log_baseline/clinic_patient_log_df_baseline_seed_' + str(
-                        seed) + '.csv')
-                clinic_patient_log_df_baseline = compute_durations(clinic_patient_log_df_baseline)
-                clinic_patient_log_df_baseline.to_csv(
-                    './output/log_baseline/clinic_patient_log_df_baseline_seed_' + str(
-                        seed) + '.csv', index=False)
+            for mirror in members:
+                # Pass all relevant arguments to main, including rad_change_2
+                clinic_end_time = main(wf_1ss, rad_change, rad_change_2, seed=seed, ai_time=ai_time,
+                                       profiler=profiler, scenario=scenario, mirror=mirror)
+
+                # clinical logs
+                log_path = _log_path(wf_1ss, seed, mirror)
+                with profile_phase(profiler, 'io'):
+                    clinic_patient_log_df = pd.read_csv(log_path)
+                with profile_phase(profiler, 'compute_durations'):
+                    clinic_patient_log_df = compute_durations(clinic_patient_log_df)
+                with profile_phase(profiler, 'io'):
+                    clinic_patient_log_df.to_csv(log_path, index=False)
+                if mirror is not None:
+                    kpis = day_kpis(clinic_patient_log_df.to_dict('records'))
+                    for name in REPORT_KPIS:
+                        pair_kpis[name][mirror].append(kpis[name])
 
             count += 1
             seed_list.append(seed)
             print('Simulation', count, 'completed in', clinic_end_time, 'hours.')
 
+    if args.antithetic and num_iteration > 1:
+        print(f"\nAntithetic pairs: {num_iteration} ({2 * num_iteration} days)")
+        print(f"{'KPI':<26}{'mean':>10}{'95% CI +/-':>12}{'pair corr':>11}{'var. reduction':>16}"
+              f"{'indep. days for same CI':>25}")
+        for name in REPORT_KPIS:
+            summary = antithetic_summary(*pair_kpis[name])
+            print(f"{name:<26}{summary['mean']:10.4f}{summary['half_width']:12.4f}{summary['correlation']:11.3f}"
+                  f"{summary['variance_reduction']:15.2f}x{summary['independent_days']:25.0f}")
+
+    if profiler is not None:
+        print(profiler.report())
+        if args.profile_dir:
+            for path in profiler.save(args.profile_dir):
+                print(f'Saved {path}')
+
 
 if __name__ == "__main__":
     run_simulation()
@@ -0,0 +1,301 @@
+import copy
+import hashlib
+import itertools
+import json
+import os
+
+AI_TIMES = ['morning', 'afternoon', 'any', 'none']
+CLINIC_HOURS = list(range(7, 17))
+# exam types in the order of params.exam_type_list
+EXAM_TYPES = ['screen', 'dx mammo us', 'dx mammo', 'dx us', 'us bx', 'mammo bx', 'screen us', 'mri-guided bx', 'mri']
+
+# Valid combinations of the run_simulation arguments: the baseline workflow, and
+# the AI-aided workflow at each time of day with each radiologist allocation.
+SCENARIO_GRID = [{'wf_1ss': False, 'ai_time': 'none', 'rad_change': False, 'rad_change_2': False}] + [
+    {'wf_1ss': True, 'ai_time': ai_time, 'rad_change': rad_change, 'rad_change_2': rad_change_2}
+    for ai_time in ['morning', 'afternoon', 'any']
+    for rad_change, rad_change_2 in [(False, False), (True, False), (True, True)]
+]
+
+# (mean, sd) in hours of the normal service time drawn by each MammoClinic method
+SERVICE_TIMES = {
+    'pt_checkin': (0.05, 0.01),
+    'use_public_wait_room': (0.01, 0.001),
+    'consent_patient': (0.05, 0.01),
+    'use_change_room': (0.05, 0.01),
+    'use_gowned_wait_room': (0.01, 0.001),
+    'get_screen_mammo': (0.1, 0.01),
+    'get_dx_mammo': (0.1, 0.01),
+    'get_dx_us': (0.2, 0.05),
+    'get_ai_assess': (0.01, 0.001),
+    'rad_review': (0.05, 0.01),
+    'get_us_guided_bx': (0.5, 0.1),
+    'get_mammo_guided_bx': (0.5, 0.1),
+    'get_screen_us': (0.2, 0.05),
+    'get_mri_guided_bx': (1.0, 0.2),
+}
+
+# Everything a simulated day depends on besides the input CSVs and the seed.
+# num_radiologist and num_radiologist_same_day default (None) to the staffing
+# of the chosen workflow: 4 + 0 for baseline, 3 + 1 with rad_change, else 3 + 0.
+# arrivals_per_hour (mean arrivals in each clinic hour) and exam_mix (one row of
+# EXAM_TYPES shares per clinic hour) default (None) to the CSVs in ./data, with
+# the last hour's arrivals doubled.
+DEFAULT_SCENARIO = {
+    'name': None,
+    'wf_1ss': False,
+    'ai_time': 'none',
+    'rad_change': False,
+    'rad_change_2': False,
+    'stoptime': 9.5,
+    'arrivals_per_hour': None,
+    'exam_mix': None,
+    'resources': {
+        'num_checkin_staff': 3,
+        'num_public_wait_room': 20,
+        'num_consent_staff': 1,
+        'num_change_room': 3,
+        'num_gowned_wait_room': 5,
+        'num_scanner': 3,
+        'num_us_machine': 2,
+        'num_radiologist': None,
+        'num_radiologist_same_day': None,
+    },
+    'service_times': {name: list(mean_sd) for name, mean_sd in SERVICE_TIMES.items()},
+    # pct_dx_after_ai is (mean, sd) of the day's normal draw, or None for no AI
+    'ai_schedules': {
+        'any': {'pct_dx_after_ai': [0.12, 0.05], 'hours': [7, 8, 9, 10, 11, 12, 13, 14, 15, 16]},
+        'morning': {'pct_dx_after_ai': [0.36, 0.15], 'hours': [9, 10, 11]},
+        'afternoon': {'pct_dx_after_ai': [0.33, 0.12], 'hours': [13, 14, 15]},
+        'none': {'pct_dx_after_ai': None, 'hours': []},
+    },
+}
+
+
+def scenario_name(scenario):
+    """
+    Short, stable label for a scenario, e.g. '1ss-morning-rad1' or 'baseline'.
+    An explicit 'name' field takes precedence.
+    """
+    if scenario.get('name'):
+        return scenario['name']
+    if not scenario['wf_1ss']:
+        return 'baseline'
+    name = f"1ss-{scenario['ai_time']}"
+    if scenario['rad_change_2']:
+        name += '-rad2'
+    elif scenario['rad_change']:
+        name += '-rad1'
+    return name
+
+
+def scenario_labels(scenarios):
+    """scenario_name() of each scenario, with '#index' appended to names that occur more than once."""
+    names = [scenario_name(scenario) for scenario in scenarios]
+    return [name if names.count(name) == 1 else f'{name}#{index}' for index, name in enumerate(names)]
+
+
+def _merge(defaults, overrides, path):
+    merged = copy.deepcopy(defaults)
+    for key, value in overrides.items():
+        if key not in defaults:
+            raise ValueError(f"Unknown scenario field '{path}{key}'.")
+        if isinstance(defaults[key], dict):
+            if not isinstance(value, dict):
+                raise ValueError(f"Scenario field '{path}{key}' must be a mapping.")
+            merged[key] = _merge(defaults[key], value, f'{path}{key}.')
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_mean_sd(value, field):
+    if not (isinstance(value, (list, tuple)) and len(value) == 2 and all(_is_number(v) for v in value)):
+        raise ValueError(f"Scenario field '{field}' must be [mean, sd], got {value!r}.")
+    if value[0] <= 0 or value[1] < 0:
+        raise ValueError(f"Scenario field '{field}' needs mean > 0 and sd >= 0, got {value!r}.")
+
+
+def validate_scenario(scenario):
+    """
+    Checks a fully resolved scenario and raises ValueError on the first problem.
+    """
+    for field in ['wf_1ss', 'rad_change', 'rad_change_2']:
+        if not isinstance(scenario[field], bool):
+            raise ValueError(f"Scenario field '{field}' must be true or false.")
+    if scenario['ai_time'] not in AI_TIMES:
+        raise ValueError(f"Scenario field 'ai_time' must be one of {AI_TIMES}, got {scenario['ai_time']!r}.")
+    if scenario['name'] is not None and not isinstance(scenario['name'], str):
+        raise ValueError("Scenario field 'name' must be a string.")
+    if not scenario['rad_change'] and scenario['rad_change_2']:
+        raise ValueError("If rad_change is false, then rad_change_2 must be false.")
+    if not scenario['wf_1ss'] and scenario['rad_change']:
+        raise ValueError("If wf_1ss is false, then rad_change must be false.")
+    if not scenario['wf_1ss'] and scenario['ai_time'] != 'none':
+        raise ValueError("If wf_1ss is false, ai_time can only be 'none'.")
+
+    # arrivals are generated for the ten clinic hours only
+    if not _is_number(scenario['stoptime']) or not 0 < scenario['stoptime'] <= len(CLINIC_HOURS):
+        raise ValueError(f"Scenario field 'stoptime' must be in (0, {len(CLINIC_HOURS)}].")
+
+    arrivals = scenario['arrivals_per_hour']
+    if arrivals is not None:
+        if not (isinstance(arrivals, list) and len(arrivals) == len(CLINIC_HOURS)
+                and all(_is_number(num) and num > 0 for num in arrivals)):
+            raise ValueError(f"Scenario field 'arrivals_per_hour' must list {len(CLINIC_HOURS)} positive means.")
+    exam_mix = scenario['exam_mix']
+    if exam_mix is not None:
+        if not (isinstance(exam_mix, list) and len(exam_mix) == len(CLINIC_HOURS)):
+            raise ValueError(f"Scenario field 'exam_mix' must have one row per clinic hour ({len(CLINIC_HOURS)}).")
+        for hour, row in zip(CLINIC_HOURS, exam_mix):
+            # the source data rounds to rows summing to 0.99-1.01
+            if not (isinstance(row, list) and len(row) == len(EXAM_TYPES)
+                    and all(_is_number(share) and share >= 0 for share in row) and abs(sum(row) - 1) <= 0.05):
+                raise ValueError(f"Scenario field 'exam_mix' row for hour {hour} must hold {len(EXAM_TYPES)} "
+                                 f"non-negative shares summing to 1.")
+
+    for name, count in scenario['resources'].items():
+        if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+            raise ValueError(f"Scenario field 'resources.{name}' must be a non-negative integer.")
+        if count == 0 and name != 'num_radiologist_same_day':
+            raise ValueError(f"Scenario field 'resources.{name}' must be at least 1.")
+    if scenario['rad_change'] and scenario['resources']['num_radiologist_same_day'] < 1:
+        raise ValueError("With rad_change, 'resources.num_radiologist_same_day' must be at least 1.")
+
+    for name, mean_sd in scenario['service_times'].items():
+        _check_mean_sd(mean_sd, f'service_times.{name}')
+
+    for ai_time, schedule in scenario['ai_schedules'].items():
+        if schedule['pct_dx_after_ai'] is not None:
+            _check_mean_sd(schedule['pct_dx_after_ai'], f'ai_schedules.{ai_time}.pct_dx_after_ai')
+        hours = schedule['hours']
+        if not isinstance(hours, list) or any(hour not in CLINIC_HOURS for hour in hours):
+            raise ValueError(f"Scenario field 'ai_schedules.{ai_time}.hours' must list clinic hours "
+                             f"{CLINIC_HOURS[0]}-{CLINIC_HOURS[-1]}.")
+
+
+def resolve_scenario(spec):
+    """
+    Completes a (partial) scenario with DEFAULT_SCENARIO and validates it.
+
+    Args:
+        spec (dict): Scenario fields to override, e.g. an entry of SCENARIO_GRID or
+                     {'wf_1ss': True, 'ai_time': 'any', 'resources': {'num_scanner': 4}}.
+
+    Returns:
+        dict: The full scenario.
+    """
+    scenario = _merge(DEFAULT_SCENARIO, spec, '')
+    resources = scenario['resources']
+    if resources['num_radiologist'] is None:
+        resources['num_radiologist'] = 3 if scenario['wf_1ss'] else 4
+    if resources['num_radiologist_same_day'] is None:
+        resources['num_radiologist_same_day'] = 1 if scenario['wf_1ss'] and scenario['rad_change'] else 0
+    validate_scenario(scenario)
+    return scenario
+
+
+def scenario_hash(scenario):
+    """
+    Content hash of a scenario: equal for scenarios that simulate the same day,
+    whatever their name or the order and spelling of their fields in the file.
+    """
+    resolved = resolve_scenario(scenario)
+    resolved.pop('name')
+    canonical = json.dumps(resolved, sort_keys=True, separators=(',', ':'), default=float)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def _set_path(scenario, dotted_key, value):
+    *parents, leaf = dotted_key.split('.')
+    for key in parents:
+        scenario = scenario.setdefault(key, {})
+    scenario[leaf] = value
+
+
+def expand_grid(base, grid):
+    """
+    Cartesian product of parameter values on top of a base scenario.
+
+    Args:
+        base (dict): Partial scenario shared by all grid points.
+        grid (dict): Dotted field path -> list of values, e.g.
+                     {'resources.num_scanner': [2, 3, 4], 'ai_time': ['morning', 'any']}.
+
+    Returns:
+        list: One resolved scenario per combination, in row-major order of `grid`.
+    """
+    keys = list(grid)
+    scenarios = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        spec = copy.deepcopy(base)
+        for key, value in zip(keys, values):
+            _set_path(spec, key, value)
+        scenarios.append(resolve_scenario(spec))
+    return scenarios
+
+
+def read_file(path):
+    """Parses a JSON, YAML or TOML file by its extension and returns its content."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        with open(path) as f:
+            return json.load(f)
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("Reading YAML scenarios requires PyYAML (pip install pyyaml).")
+        with open(path) as f:
+            return yaml.safe_load(f)
+    if extension == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError("Reading TOML scenarios requires Python 3.11+ or tomli (pip install tomli).")
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    raise ValueError(f"Unsupported scenario file type '{extension}', use .json, .yaml/.yml or .toml.")
+
+
+def load_scenarios(path):
+    """
+    Loads and validates the scenarios in a JSON, YAML or TOML file.
+
+    The file holds one scenario, a list of scenarios, {'scenarios': [...]}, or
+    {'base': {...}, 'grid': {dotted field: [values]}} which is expanded with
+    expand_grid(). Fields left out take their DEFAULT_SCENARIO values.
+
+    Returns:
+        list: Resolved scenarios.
+    """
+    content = read_file(path)
+    if isinstance(content, dict) and 'grid' in content:
+        return expand_grid(content.get('base', {}), content['grid'])
+    if isinstance(content, dict) and 'scenarios' in content:
+        content = content['scenarios']
+    if isinstance(content, dict):
+        content = [content]
+    if not isinstance(content, list):
+        raise ValueError(f"{path} must contain a scenario, a list of scenarios or a grid.")
+    return [resolve_scenario(spec) for spec in content]
+
+
+def load_scenario(path):
+    """
+    Loads the one scenario of a file, for tools that run on a single scenario.
+
+    Returns:
+        dict: The resolved scenario.
+    """
+    scenarios = load_scenarios(path)
+    if len(scenarios) != 1:
+        raise ValueError(f"{path} holds {len(scenarios)} scenarios, expected one.")
+    return scenarios[0]
@@ -0,0 +1,289 @@
+import argparse
+import copy
+import json
+import warnings
+
+import numpy as np
+
+from batch import BatchRunner, kpi_column
+from kpis import DAY_KPI_NAMES
+from scenarios import load_scenario, resolve_scenario
+
+METHODS = ['morris', 'sobol']
+# resources whose count is varied by default; the public wait room is never the bottleneck
+RESOURCE_FACTORS = ['num_checkin_staff', 'num_consent_staff', 'num_change_room', 'num_gowned_wait_room',
+                    'num_scanner', 'num_us_machine', 'num_radiologist']
+
+
+def default_factors(base, spread=0.25, include_sd=False, resources=True):
+    """
+    Uncertain inputs around a scenario: every service-time mean (and optionally SD)
+    within +/- spread of its value, and resource counts within one unit.
+
+    Returns:
+        list: Factor dicts with 'name' (dotted scenario path), 'low', 'high' and 'integer'.
+    """
+    factors = []
+    for service, (mean, sd) in base['service_times'].items():
+        factors.append({'name': f'service_times.{service}.mean', 'low': mean * (1 - spread),
+                        'high': mean * (1 + spread), 'integer': False})
+        if include_sd:
+            factors.append({'name': f'service_times.{service}.sd', 'low': sd * (1 - spread),
+                            'high': sd * (1 + spread), 'integer': False})
+    if resources:
+        for name in RESOURCE_FACTORS:
+            count = base['resources'][name]
+            factors.append({'name': f'resources.{name}', 'low': max(1, count - 1), 'high': count + 1,
+                            'integer': True})
+    return factors
+
+
+def factor_values(factors, unit_points):
+    """Maps points of the unit hypercube to factor values; integer factors take evenly sized bins."""
+    values = []
+    for j, factor in enumerate(factors):
+        u = unit_points[:, j]
+        if factor['integer']:
+            width = factor['high'] - factor['low'] + 1
+            values.append(factor['low'] + np.minimum(np.floor(u * width), width - 1))
+        else:
+            values.append(factor['low'] + u * (factor['high'] - factor['low']))
+    return np.column_stack(values)
+
+
+def apply_factors(base, factors, values):
+    """A copy of the base scenario with one design point's factor values filled in."""
+    scenario = copy.deepcopy(base)
+    scenario['name'] = None
+    for factor, value in zip(factors, values):
+        section, *rest = factor['name'].split('.')
+        if section == 'service_times':
+            service, part = rest
+            scenario['service_times'][service][0 if part == 'mean' else 1] = float(value)
+        else:
+            scenario['resources'][rest[0]] = int(value)
+    return resolve_scenario(scenario)
+
+
+def morris_design(num_factors, num_trajectories, rng, levels=4):
+    """
+    Morris one-at-a-time trajectories on a `levels`-level grid of the unit hypercube.
+
+    Returns:
+        tuple: (points with shape (num_trajectories * (num_factors + 1), num_factors),
+                signed step of the factor changed between consecutive points, per trajectory,
+                with shape (num_trajectories, num_factors), factor order with the same shape).
+    """
+    delta = levels / (2 * (levels - 1))
+    grid = np.arange(levels) / (levels - 1)
+    points = np.empty((num_trajectories, num_factors + 1, num_factors))
+    steps = np.empty((num_trajectories, num_factors))
+    orders = np.empty((num_trajectories, num_factors), dtype=int)
+    for t in range(num_trajectories):
+        x = rng.choice(grid, size=num_factors)
+        # step up from the lower half of the grid and down from the upper half
+        direction = np.where(x + delta <= 1 + 1e-12, delta, -delta)
+        order = rng.permutation(num_factors)
+        points[t, 0] = x
+        for i, j in enumerate(order):
+            x = x.copy()
+            x[j] += direction[j]
+            points[t, i + 1] = x
+        steps[t] = direction[order]
+        orders[t] = order
+    return points.reshape(-1, num_factors), steps, orders
+
+
+def morris_steps(factors, unit_points, orders):
+    """
+    Signed change of the factor varied at each step of the Morris trajectories, as a
+    fraction of its range, from the factor values that are actually simulated.
+
+    For continuous factors this is the grid step. Integer factors move by whole units:
+    one grid step can cross one bin from some points and two from others, so the grid
+    step would put their elementary effects on two different scales.
+
+    Returns:
+        numpy.ndarray: Shape (num_trajectories, num_factors), in trajectory step order like orders.
+    """
+    num_trajectories, num_factors = orders.shape
+    values = factor_values(factors, unit_points).reshape(num_trajectories, num_factors + 1, num_factors)
+    ranges = np.array([factor['high'] - factor['low'] for factor in factors], dtype=float)
+    change = np.diff(values, axis=1)
+    rows = np.arange(num_trajectories)[:, None]
+    return change[rows, np.arange(num_factors)[None, :], orders] / ranges[orders]
+
+
+def morris_effects(y, steps, orders):
+    """
+    Elementary effects from Morris trajectory outputs: the change in output per full
+    range of the factor (see morris_steps). A step that leaves an integer factor in the
+    same bin has no effect to measure and gives NaN.
+
+    Returns:
+        numpy.ndarray: Shape (num_trajectories, num_factors), in factor order.
+    """
+    num_trajectories, num_factors = steps.shape
+    y = y.reshape(num_trajectories, num_factors + 1)
+    effects = np.empty((num_trajectories, num_factors))
+    rows = np.arange(num_trajectories)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        effects[rows, orders] = np.where(steps != 0, np.diff(y, axis=1) / steps, np.nan)
+    return effects
+
+
+def morris_indices(effects, num_bootstrap, rng, confidence=0.95):
+    """
+    mu* (mean absolute elementary effect) and sigma per factor, with percentile
+    bootstrap intervals over trajectories. NaN effects (see morris_effects) are left out.
+    """
+    num_trajectories = effects.shape[0]
+    resamples = rng.integers(0, num_trajectories, size=(num_bootstrap, num_trajectories))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        boot_mu_star = np.nanmean(np.abs(effects)[resamples], axis=1)
+        tail = (1 - confidence) / 2 * 100
+        return {
+            'mu': np.nanmean(effects, axis=0),
+            'mu_star': np.nanmean(np.abs(effects), axis=0),
+            'sigma': np.nanstd(effects, axis=0, ddof=1) if num_trajectories > 1
+            else np.full(effects.shape[1], np.nan),
+            'mu_star_low': np.nanpercentile(boot_mu_star, tail, axis=0),
+            'mu_star_high': np.nanpercentile(boot_mu_star, 100 - tail, axis=0),
+        }
+
+
+def saltelli_design(num_factors, n, rng):
+    """
+    Saltelli sampling: base matrices A and B and the k matrices AB_i (A with column i from B).
+
+    Returns:
+        numpy.ndarray: Points with shape (n * (num_factors + 2), num_factors), ordered A, B, AB_1, ..., AB_k.
+    """
+    a = rng.random((n, num_factors))
+    b = rng.random((n, num_factors))
+    ab = np.repeat(a[None], num_factors, axis=0)
+    ab[np.arange(num_factors), :, np.arange(num_factors)] = b.T
+    return np.concatenate([a, b, ab.reshape(-1, num_factors)])
+
+
+def _sobol_estimates(f_a, f_b, f_ab):
+    """
+    First-order (Saltelli 2010) and total-effect (Jansen) estimators.
+
+    f_a and f_b have shape (..., n); f_ab has shape (..., k, n).
+    """
+    variance = np.var(np.concatenate([f_a, f_b], axis=-1), axis=-1)[..., None]
+    first = np.mean(f_b[..., None, :] * (f_ab - f_a[..., None, :]), axis=-1) / variance
+    total = 0.5 * np.mean((f_a[..., None, :] - f_ab) ** 2, axis=-1) / variance
+    return first, total
+
+
+def sobol_indices(y, num_factors, num_bootstrap, rng, confidence=0.95):
+    """
+    First-order and total-effect Sobol indices from Saltelli-design outputs, with
+    percentile bootstrap intervals over the n base rows (all resamples at once).
+    """
+    n = len(y) // (num_factors + 2)
+    f_a, f_b, f_ab = y[:n], y[n:2 * n], y[2 * n:].reshape(num_factors, n)
+    first, total = _sobol_estimates(f_a, f_b, f_ab)
+
+    resamples = rng.integers(0, n, size=(num_bootstrap, n))
+    boot_first, boot_total = _sobol_estimates(f_a[resamples], f_b[resamples], f_ab[:, resamples].transpose(1, 0, 2))
+    tail = (1 - confidence) / 2 * 100
+    return {
+        'S1': first,
+        'S1_low': np.percentile(boot_first, tail, axis=0),
+        'S1_high': np.percentile(boot_first, 100 - tail, axis=0),
+        'ST': total,
+        'ST_low': np.percentile(boot_total, tail, axis=0),
+        'ST_high': np.percentile(boot_total, 100 - tail, axis=0),
+    }
+
+
+def evaluate_design(base, factors, unit_points, seeds, runner, kpi):
+    """
+    Runs every design point on the same seeds and returns the mean of `kpi` per point
+    and the number of points with days that ended with patients still waiting.
+    """
+    values = factor_values(factors, unit_points)
+    scenarios = [apply_factors(base, factors, row) for row in values]
+    kpis = runner.run(scenarios, seeds)
+    unfinished_points = int((kpis[:, :, kpi_column('n_unfinished')] > 0).any(axis=1).sum())
+    return np.nanmean(kpis[:, :, kpi_column(kpi)], axis=1), unfinished_points
+
+
+def _interval(low, high, digits):
+    return f"[{low:.{digits}f}, {high:.{digits}f}]"
+
+
+def run_sensitivity():
+    """
+    Command line entry point: Morris screening or Sobol indices of a day-level KPI.
+    """
+    parser = argparse.ArgumentParser(description="Global sensitivity analysis over service times and resources.")
+    parser.add_argument('method', choices=METHODS)
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='Scenario file with the nominal values (default: the baseline scenario)')
+    parser.add_argument('--kpi', type=str, default='mean_total_system_time', choices=DAY_KPI_NAMES,
+                        help='Day-level KPI to analyse, averaged over the replications of each point')
+    parser.add_argument('--spread', type=float, default=0.25, help='Relative range of service-time parameters')
+    parser.add_argument('--include_sd', action='store_true', help='Also vary service-time SDs')
+    parser.add_argument('--no_resources', action='store_true', help='Keep resource counts fixed')
+    parser.add_argument('--trajectories', type=int, default=20, help='Morris trajectories')
+    parser.add_argument('--levels', type=int, default=4, help='Morris grid levels')
+    parser.add_argument('--n', type=int, default=128, help='Sobol base sample size (points = n * (factors + 2))')
+    parser.add_argument('--num_replications', type=int, default=5, help='Days (common seeds) per design point')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--bootstrap', type=int, default=1000, help='Bootstrap resamples for the intervals')
+    parser.add_argument('--seed', type=int, default=12345, help='Seed of the design and the bootstrap')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file for the indices')
+    args = parser.parse_args()
+
+    base = resolve_scenario({})
+    if args.scenario:
+        base = load_scenario(args.scenario)
+    factors = default_factors(base, args.spread, args.include_sd, not args.no_resources)
+    seeds = list(range(args.first_seed, args.first_seed + args.num_replications))
+    rng = np.random.default_rng(args.seed)
+
+    if args.method == 'morris':
+        unit_points, _, orders = morris_design(len(factors), args.trajectories, rng, args.levels)
+        steps = morris_steps(factors, unit_points, orders)
+    else:
+        unit_points = saltelli_design(len(factors), args.n, rng)
+    print(f"{len(factors)} factors, {len(unit_points)} design points x {len(seeds)} days")
+
+    with BatchRunner(workers=args.workers) as runner:
+        y, unfinished_points = evaluate_design(base, factors, unit_points, seeds, runner, args.kpi)
+    if unfinished_points:
+        print(f"Warning: {unfinished_points} design points had days with patients who never left the clinic.")
+
+    if args.method == 'morris':
+        indices = morris_indices(morris_effects(y, steps, orders), args.bootstrap, rng)
+        ranking = np.argsort(-indices['mu_star'])
+        print(f"\n{'factor':<44}{'mu*':>9}{'95% CI':>20}{'mu':>9}{'sigma':>9}")
+        for j in ranking:
+            interval = _interval(indices['mu_star_low'][j], indices['mu_star_high'][j], 4)
+            print(f"{factors[j]['name']:<44}{indices['mu_star'][j]:9.4f}{interval:>20}"
+                  f"{indices['mu'][j]:9.4f}{indices['sigma'][j]:9.4f}")
+    else:
+        indices = sobol_indices(y, len(factors), args.bootstrap, rng)
+        ranking = np.argsort(-indices['ST'])
+        print(f"\n{'factor':<44}{'S1':>8}{'95% CI':>18}{'ST':>8}{'95% CI':>18}")
+        for j in ranking:
+            first_interval = _interval(indices['S1_low'][j], indices['S1_high'][j], 3)
+            total_interval = _interval(indices['ST_low'][j], indices['ST_high'][j], 3)
+            print(f"{factors[j]['name']:<44}{indices['S1'][j]:8.3f}{first_interval:>18}"
+                  f"{indices['ST'][j]:8.3f}{total_interval:>18}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'method': args.method, 'kpi': args.kpi, 'seeds': seeds, 'factors': factors,
+                       'indices': {name: values.tolist() for name, values in indices.items()}}, f, indent=2)
+        print(f"\nWrote indices to {args.out}")
+
+
+if __name__ == "__main__":
+    run_sensitivity()
@@ -0,0 +1,267 @@
+import argparse
+import concurrent.futures
+import math
+import os
+import pickle
+import time
+import warnings
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from batch import chunk_seeds, init_worker
+from clinic_wf_1ss import LOG_COLUMNS
+from kpis import PATIENT_TYPES, normalize_patient_type
+from scenarios import load_scenario, resolve_scenario, scenario_name
+
+# patient_type is stored as its index in kpis.PATIENT_TYPES.
+_TYPE_CODES = {patient_type: float(code) for code, patient_type in enumerate(PATIENT_TYPES)}
+
+
+class SharedResults(object):
+    """
+    Preallocated block for the patient logs of many days, which worker processes
+    fill in place and the parent reads as numpy views, without pickling or copying.
+
+    The block holds, per day slot: the number of patients logged, the number that
+    arrived, and a (max_patients, len(LOG_COLUMNS)) float64 table of their
+    timestamps, NaN past the last patient. It lives in a multiprocessing.shared_memory
+    segment, or in a memory-mapped file when `path` is given (which also keeps it
+    after the run and works across unrelated processes).
+
+    Use as a context manager, or call close(); the creator also frees the segment
+    (or keeps the file).
+
+    Args:
+        num_days (int): Day slots.
+        max_patients (int): Rows per day; a day with more patients is an error.
+        path (str, optional): File to memory-map instead of a shared memory segment.
+    """
+    def __init__(self, num_days, max_patients, path=None, _attach=None):
+        self.num_days = num_days
+        self.max_patients = max_patients
+        self.path = path
+        self._shm = None
+        header = 2 * num_days * 8
+        size = header + num_days * max_patients * len(LOG_COLUMNS) * 8
+        self._owner = _attach is None
+        if path is not None:
+            buffer = np.memmap(path, dtype=np.uint8, mode='w+' if self._owner else 'r+', shape=(size,))
+        elif self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            buffer = self._shm.buf
+        else:
+            # pool workers share the creator's resource tracker, which frees the segment
+            # only if the creator never does
+            self._shm = shared_memory.SharedMemory(name=_attach)
+            buffer = self._shm.buf
+        self._buffer = buffer
+        self.counts = np.ndarray((num_days,), dtype=np.int64, buffer=buffer)
+        self.arrivals = np.ndarray((num_days,), dtype=np.int64, buffer=buffer, offset=num_days * 8)
+        self.data = np.ndarray((num_days, max_patients, len(LOG_COLUMNS)), dtype=np.float64, buffer=buffer,
+                               offset=header)
+        if self._owner:
+            self.counts[:] = 0
+            self.arrivals[:] = 0
+            self.data[:] = np.nan
+
+    @property
+    def spec(self):
+        """Picklable description a worker attaches with (see attach)."""
+        return (self.num_days, self.max_patients, self.path, None if self._shm is None else self._shm.name)
+
+    @classmethod
+    def attach(cls, spec):
+        num_days, max_patients, path, name = spec
+        return cls(num_days, max_patients, path, _attach=name or path)
+
+    def store(self, slot, timestamps_list, num_arrivals):
+        """Writes one day's timestamps dicts into a slot."""
+        if len(timestamps_list) > self.max_patients:
+            raise ValueError(f"A day with {len(timestamps_list)} patients does not fit in {self.max_patients} rows; "
+                             f"raise max_patients.")
+        # every dict starts from LOG_COLUMNS, so comparing the names of the day's first patient
+        # catches logs of another engine; the others check that no handler added a column
+        if timestamps_list and list(timestamps_list[0]) != LOG_COLUMNS:
+            raise ValueError(f"Patient log columns {list(timestamps_list[0])} differ from LOG_COLUMNS.")
+        rows = []
+        for timestamps in timestamps_list:
+            values = list(timestamps.values())
+            if len(values) != len(LOG_COLUMNS):
+                raise ValueError(f"Patient log columns {list(timestamps)} differ from LOG_COLUMNS.")
+            values[1] = _TYPE_CODES.get(normalize_patient_type(values[1]), math.nan)
+            rows.append(values)
+        if rows:
+            self.data[slot, :len(rows)] = rows
+        self.data[slot, len(rows):] = np.nan
+        self.counts[slot] = len(rows)
+        self.arrivals[slot] = num_arrivals
+
+    def column(self, name):
+        """View of one column for every day and row, shape (num_days, max_patients)."""
+        return self.data[:, :, LOG_COLUMNS.index(name)]
+
+    def length_of_stay(self):
+        """total_system_time per day and row, NaN past each day's last patient."""
+        return self.column('exit_system_ts') - self.column('arrival_ts')
+
+    def day_summary(self):
+        """
+        Day-level LOS KPIs computed on the whole block at once, matching kpis.day_kpis.
+
+        Returns:
+            dict: n_patients, n_unfinished, mean_, p50_, p90_ and max_total_system_time arrays (one entry per day).
+        """
+        los = self.length_of_stay()
+        with warnings.catch_warnings():
+            # days without patients are all-NaN rows
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return {
+                'n_patients': self.counts.astype(float),
+                'n_unfinished': (self.arrivals - self.counts).astype(float),
+                'mean_total_system_time': np.nanmean(los, axis=1),
+                'p50_total_system_time': np.nanpercentile(los, 50, axis=1),
+                'p90_total_system_time': np.nanpercentile(los, 90, axis=1),
+                'max_total_system_time': np.nanmax(los, axis=1),
+            }
+
+    def close(self):
+        # drop the views first: a segment cannot be closed while arrays export its buffer
+        self.counts = self.arrivals = self.data = None
+        if self._shm is not None:
+            self._buffer = None
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+            self._shm = None
+        elif isinstance(self._buffer, np.memmap):
+            self._buffer.flush()
+            self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_attached = {}
+
+
+def _fill_chunk(spec, scenario, slots, seeds):
+    """Simulates `seeds` into `slots` of the block described by `spec`; returns nothing."""
+    if spec not in _attached:
+        # one attachment per worker process, reused by later chunks
+        _attached[spec] = SharedResults.attach(spec)
+    store_days(_attached[spec], scenario, slots, seeds)
+
+
+def _pickled_chunk(scenario, seeds):
+    """The same days returned the usual way, one list of timestamps dicts per day (for comparison)."""
+    from run_simulation import get_context
+
+    context = get_context(scenario)
+    days = []
+    for seed in seeds:
+        context.reset(seed)
+        timestamps_list, _ = context.run()
+        days.append((timestamps_list, context.num_arrivals))
+    return days
+
+
+def default_max_patients(scenario):
+    """Rows per day: the booked patients of the day (run_clinic caps arrivals at them) plus a margin."""
+    from run_simulation import get_context
+
+    return int(math.ceil(get_context(scenario).acc_pt_num_list[-1] * 1.25)) + 5
+
+
+def simulate_into(scenario, seeds, workers=1, max_patients=None, path=None, chunk_size=None):
+    """
+    Simulates a scenario on `seeds`, with the patient logs written by the workers
+    straight into a SharedResults block (slot i holds seeds[i]).
+
+    Returns:
+        SharedResults: The filled block; close it when done.
+    """
+    scenario = resolve_scenario(scenario)
+    seeds = list(seeds)
+    results = SharedResults(len(seeds), max_patients or default_max_patients(scenario), path)
+    chunks = [(slots, [seeds[slot] for slot in slots])
+              for slots in chunk_seeds(list(range(len(seeds))), workers, chunk_size)]
+    try:
+        if workers == 1:
+            for slots, day_seeds in chunks:
+                store_days(results, scenario, slots, day_seeds)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                futures = [pool.submit(_fill_chunk, results.spec, scenario, slots, day_seeds)
+                           for slots, day_seeds in chunks]
+                for future in futures:
+                    future.result()
+    except BaseException:
+        results.close()
+        raise
+    return results
+
+
+def store_days(results, scenario, slots, seeds):
+    """Simulates `seeds` into `slots` of a block in this process."""
+    from run_simulation import get_context
+
+    context = get_context(scenario)
+    for slot, seed in zip(slots, seeds):
+        context.reset(seed)
+        timestamps_list, _ = context.run()
+        results.store(slot, timestamps_list, context.num_arrivals)
+
+
+def run_shm_results():
+    """
+    Command line entry point: simulates days into shared memory and compares with returning pickled logs.
+    """
+    parser = argparse.ArgumentParser(description="Patient logs from worker processes via shared memory.")
+    parser.add_argument('--scenario', type=str, default=None, help='Scenario file with one scenario (default: baseline)')
+    parser.add_argument('--num_replications', type=int, default=1000, help='Days to simulate')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--path', type=str, default=None, help='Memory-map this file instead of shared memory')
+    parser.add_argument('--compare', action='store_true',
+                        help='Also return the logs pickled through the pool, check they match and compare times')
+    args = parser.parse_args()
+
+    if args.scenario:
+        scenario = load_scenario(args.scenario)
+    else:
+        scenario = resolve_scenario({})
+    seeds = list(range(args.first_seed, args.first_seed + args.num_replications))
+
+    start = time.perf_counter()
+    with simulate_into(scenario, seeds, args.workers, path=args.path) as results:
+        shm_seconds = time.perf_counter() - start
+        summary = results.day_summary()
+        print(f"{scenario_name(scenario)}: {len(seeds)} days into a {results.data.nbytes / 2 ** 20:.1f} MiB block "
+              f"({results.max_patients} rows x {len(LOG_COLUMNS)} columns per day) in {shm_seconds:.1f} s "
+              f"on {args.workers} workers")
+        print(f"mean LOS {np.nanmean(summary['mean_total_system_time']):.4f} h, "
+              f"mean p90 LOS {np.nanmean(summary['p90_total_system_time']):.4f} h, "
+              f"{results.counts.sum()} patients")
+
+        if args.compare:
+            chunks = chunk_seeds(seeds, args.workers)
+            start = time.perf_counter()
+            with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+                days = [day for chunk in pool.map(_pickled_chunk, [scenario] * len(chunks), chunks) for day in chunk]
+            with SharedResults(len(seeds), results.max_patients) as copy:
+                for slot, (timestamps_list, num_arrivals) in enumerate(days):
+                    copy.store(slot, timestamps_list, num_arrivals)
+                pickled_seconds = time.perf_counter() - start
+                same = np.array_equal(copy.data, results.data, equal_nan=True) and \
+                    np.array_equal(copy.counts, results.counts)
+            payload = len(pickle.dumps(days, protocol=pickle.HIGHEST_PROTOCOL))
+            print(f"pickled through the pool: {pickled_seconds:.1f} s ({payload / 2 ** 20:.1f} MiB of pickles); "
+                  f"logs {'identical' if same else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    run_shm_results()
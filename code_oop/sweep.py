@@ -0,0 +1,317 @@
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from batch import BatchRunner
+from kpis import DAY_KPI_NAMES
+from scenarios import SCENARIO_GRID, load_scenarios, resolve_scenario, scenario_hash, scenario_name
+
+SHARD_FORMAT = 1
+
+
+def sweep_id(scenarios, seeds):
+    """Identifies a sweep by its scenarios, seeds and KPI columns, so shards of different sweeps are not merged."""
+    canonical = json.dumps([[scenario_hash(scenario) for scenario in scenarios], list(seeds), DAY_KPI_NAMES])
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def parse_shard(text):
+    """'i/N' -> (i, N), with shards numbered 0 to N - 1."""
+    try:
+        shard, num_shards = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"--shard must look like i/N, got {text!r}.")
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"Shard {shard} does not exist in {num_shards} shards, use 0 to {num_shards - 1}.")
+    return shard, num_shards
+
+
+def shard_units(num_scenarios, seeds, shard, num_shards):
+    """
+    The (scenario index, seed) pairs of one shard: the k-th pair of the sweep, in scenario
+    then seed order, goes to shard k mod num_shards, so shards get near-equal shares of
+    every scenario and the partition depends only on the sweep.
+    """
+    units = [(index, seed) for index in range(num_scenarios) for seed in seeds]
+    return units[shard::num_shards]
+
+
+def moments(values):
+    """Mergeable summary of KPI values (NaN left out): count, mean, sum of squared deviations, min and max."""
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {'n': 0, 'mean': 0.0, 'm2': 0.0, 'min': math.inf, 'max': -math.inf}
+    return {'n': len(values), 'mean': float(values.mean()), 'm2': float(np.sum((values - values.mean()) ** 2)),
+            'min': float(values.min()), 'max': float(values.max())}
+
+
+def combine_moments(first, second):
+    """moments() of the union of two sets of values (Chan et al.'s parallel update)."""
+    n = first['n'] + second['n']
+    if first['n'] == 0 or second['n'] == 0:
+        return dict(first if second['n'] == 0 else second)
+    delta = second['mean'] - first['mean']
+    return {'n': n, 'mean': first['mean'] + delta * second['n'] / n,
+            'm2': first['m2'] + second['m2'] + delta ** 2 * first['n'] * second['n'] / n,
+            'min': min(first['min'], second['min']), 'max': max(first['max'], second['max'])}
+
+
+def describe(summary, confidence=0.95):
+    """Mean, SD, CI half width, min and max of a KPI from its moments()."""
+    from scipy import stats
+
+    n = summary['n']
+    sd = math.sqrt(summary['m2'] / (n - 1)) if n > 1 else math.nan
+    half_width = stats.t.ppf(0.5 + confidence / 2, n - 1) * sd / math.sqrt(n) if n > 1 else math.nan
+    return {'n': n, 'mean': summary['mean'] if n else math.nan, 'sd': sd, 'half_width': float(half_width),
+            'min': summary['min'] if n else math.nan, 'max': summary['max'] if n else math.nan}
+
+
+def run_shard(scenarios, seeds, shard=0, num_shards=1, workers=1, keep_rows=True):
+    """
+    Simulates one shard of a sweep.
+
+    Returns:
+        dict: Self-describing partial result: the sweep id, shard and number of shards, the
+              scenarios and seeds of the whole sweep, the shard's units, its rows (scenario index,
+              seed, KPIs; left out with keep_rows False) and the moments() of every KPI per scenario.
+    """
+    scenarios = [resolve_scenario(scenario) for scenario in scenarios]
+    seeds = list(seeds)
+    units = shard_units(len(scenarios), seeds, shard, num_shards)
+    start = time.perf_counter()
+    rows = []
+    with BatchRunner(workers=workers) as runner:
+        for index, scenario in enumerate(scenarios):
+            shard_seeds = [seed for unit_index, seed in units if unit_index == index]
+            if shard_seeds:
+                kpis = runner.run([scenario], shard_seeds)[0]
+                rows.extend([index, seed] + row.tolist() for seed, row in zip(shard_seeds, kpis))
+    summaries = {}
+    for index in range(len(scenarios)):
+        kpis = np.array([row[2:] for row in rows if row[0] == index], dtype=float).reshape(-1, len(DAY_KPI_NAMES))
+        summaries[str(index)] = {name: moments(kpis[:, column]) for column, name in enumerate(DAY_KPI_NAMES)}
+    return {
+        'format': SHARD_FORMAT,
+        'sweep': sweep_id(scenarios, seeds),
+        'shard': shard,
+        'num_shards': num_shards,
+        'kpi_names': DAY_KPI_NAMES,
+        'scenarios': scenarios,
+        'seeds': seeds,
+        'units': [list(unit) for unit in units],
+        'rows': rows if keep_rows else None,
+        'summaries': summaries,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def shard_path(out_dir, shard, num_shards):
+    return os.path.join(out_dir, f'shard_{shard:04d}_of_{num_shards:04d}.json')
+
+
+def write_shard(document, out_dir):
+    """Writes a shard atomically (a job killed mid-write leaves no partial file) and returns its path."""
+    os.makedirs(out_dir, exist_ok=True)
+    path = shard_path(out_dir, document['shard'], document['num_shards'])
+    with tempfile.NamedTemporaryFile('w', dir=out_dir, suffix='.tmp', delete=False) as f:
+        json.dump(document, f)
+    os.replace(f.name, path)
+    return path
+
+
+def read_shards(paths):
+    """Shard documents from files and directories (every shard_*.json in them)."""
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, 'shard_*.json'))) if os.path.isdir(path) else [path])
+    documents = []
+    for file in files:
+        with open(file) as f:
+            documents.append(json.load(f))
+    return documents
+
+
+def merge_shards(documents, confidence=0.95):
+    """
+    Combines the shards of a sweep into the result of running it on one node.
+
+    Checks that the shards come from one sweep and cover each of its (scenario, seed)
+    units exactly once. With rows in every shard, the dataset is sorted into scenario
+    then seed order and the statistics are computed from it, exactly as for a single
+    node; the shards' moments are combined as well and must agree with them. Without
+    rows the statistics come from the combined moments alone.
+
+    Returns:
+        dict: sweep, scenarios, seeds, rows (None without rows) and statistics
+              (scenario name -> KPI -> describe()).
+    """
+    if not documents:
+        raise ValueError("No shards to merge.")
+    first = documents[0]
+    for document in documents:
+        if document.get('format') != SHARD_FORMAT:
+            raise ValueError(f"Shard {document.get('shard')} has format {document.get('format')}, "
+                             f"expected {SHARD_FORMAT}.")
+        if document['sweep'] != first['sweep'] or document['num_shards'] != first['num_shards']:
+            raise ValueError(f"Shard {document['shard']}/{document['num_shards']} of sweep {document['sweep']} "
+                             f"does not belong with shard {first['shard']}/{first['num_shards']} of sweep {first['sweep']}.")
+    shards = sorted(document['shard'] for document in documents)
+    if shards != list(range(first['num_shards'])):
+        missing = sorted(set(range(first['num_shards'])) - set(shards))
+        duplicated = sorted({shard for shard in shards if shards.count(shard) > 1})
+        raise ValueError(f"Sweep {first['sweep']} needs shards 0 to {first['num_shards'] - 1}: "
+                         f"missing {missing}, duplicated {duplicated}.")
+    scenarios, seeds = first['scenarios'], first['seeds']
+    units = sorted(tuple(unit) for document in documents for unit in document['units'])
+    if units != [(index, seed) for index in range(len(scenarios)) for seed in seeds]:
+        raise ValueError(f"The shards of sweep {first['sweep']} do not cover its scenarios and seeds exactly once.")
+
+    combined = {}
+    for index in range(len(scenarios)):
+        combined[index] = {}
+        for name in DAY_KPI_NAMES:
+            summary = moments([])
+            for document in documents:
+                summary = combine_moments(summary, document['summaries'][str(index)][name])
+            combined[index][name] = summary
+
+    rows = None
+    if all(document['rows'] is not None for document in documents):
+        rows = sorted((row for document in documents for row in document['rows']), key=lambda row: (row[0], row[1]))
+        kpis = np.array([row[2:] for row in rows], dtype=float)
+        for index in range(len(scenarios)):
+            for column, name in enumerate(DAY_KPI_NAMES):
+                summary = moments(kpis[len(seeds) * index:len(seeds) * (index + 1), column])
+                if summary['n'] != combined[index][name]['n'] or \
+                        not np.isclose(summary['mean'], combined[index][name]['mean'], rtol=1e-9, atol=1e-12):
+                    raise ValueError(f"The rows and moments of {name} in scenario {index} disagree.")
+                combined[index][name] = summary
+
+    statistics = {}
+    for index, scenario in enumerate(scenarios):
+        label = scenario_name(scenario) if scenario_name(scenario) not in statistics else f'{scenario_name(scenario)}#{index}'
+        statistics[label] = {name: describe(combined[index][name], confidence) for name in DAY_KPI_NAMES}
+    return {'sweep': first['sweep'], 'scenarios': scenarios, 'seeds': seeds, 'rows': rows, 'statistics': statistics}
+
+
+def write_merged(merged, out_dir):
+    """Writes days.csv (one row per scenario and seed; with rows only) and statistics.json; returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    if merged['rows'] is not None:
+        path = os.path.join(out_dir, 'days.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['scenario', 'scenario_hash', 'seed'] + DAY_KPI_NAMES)
+            hashes = [scenario_hash(scenario) for scenario in merged['scenarios']]
+            names = [scenario_name(scenario) for scenario in merged['scenarios']]
+            for row in merged['rows']:
+                writer.writerow([names[row[0]], hashes[row[0]], row[1]] + [repr(float(value)) for value in row[2:]])
+        paths.append(path)
+    path = os.path.join(out_dir, 'statistics.json')
+    with open(path, 'w') as f:
+        json.dump({'sweep': merged['sweep'], 'seeds': merged['seeds'],
+                   'scenarios': [scenario_hash(scenario) for scenario in merged['scenarios']],
+                   'statistics': merged['statistics']}, f, indent=2)
+    paths.append(path)
+    return paths
+
+
+def _print_statistics(merged, kpi):
+    print(f"{'scenario':<28}{'days':>6}{'mean':>10}{'+/-':>9}{'sd':>9}")
+    for label, statistics in merged['statistics'].items():
+        s = statistics[kpi]
+        print(f"{label:<28}{s['n']:6d}{s['mean']:10.4f}{s['half_width']:9.4f}{s['sd']:9.4f}")
+
+
+def _check(args, scenario_args):
+    """Runs the sweep as separate shard processes and on one node, and compares the merged results."""
+    with tempfile.TemporaryDirectory() as workdir:
+        shard_dir = os.path.join(workdir, 'shards')
+        start = time.perf_counter()
+        processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), 'run', '--shard', f'{i}/{args.shards}',
+                                       '--out_dir', shard_dir, '--quiet'] + scenario_args)
+                     for i in range(args.shards)]
+        if any(process.wait() != 0 for process in processes):
+            raise RuntimeError("A shard process failed.")
+        sharded = merge_shards(read_shards([shard_dir]), args.confidence)
+        print(f"{args.shards} shard processes and merge: {time.perf_counter() - start:.1f} s")
+        start = time.perf_counter()
+        single = merge_shards([run_shard(args.scenarios, args.seeds, workers=args.workers)], args.confidence)
+        print(f"single node: {time.perf_counter() - start:.1f} s")
+        sharded_files = write_merged(sharded, os.path.join(workdir, 'sharded'))
+        single_files = write_merged(single, os.path.join(workdir, 'single'))
+        identical = True
+        for sharded_file, single_file in zip(sharded_files, single_files):
+            with open(sharded_file) as f, open(single_file) as g:
+                same = f.read() == g.read()
+            print(f"{os.path.basename(single_file)}: {'identical' if same else 'DIFFERENT'}")
+            identical = identical and same
+    return identical
+
+
+def run_sweep():
+    """
+    Command line entry point: runs a sweep or one shard of it, merges shards, or checks
+    locally that sharded and single-node runs give the same results.
+    """
+    parser = argparse.ArgumentParser(description="Sharded scenario x replication sweeps.")
+    parser.add_argument('command', choices=['run', 'merge', 'check'])
+    parser.add_argument('paths', nargs='*', help='merge: shard files or folders holding them')
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='Scenario file, e.g. a grid (default: every valid workflow, scenarios.SCENARIO_GRID)')
+    parser.add_argument('--num_replications', type=int, default=20, help='Days per scenario')
+    parser.add_argument('--first_seed', type=int, default=1, help='Seeds are first_seed, first_seed+1, ...')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='run: simulate shard i/N only (0 <= i < N) and write it to --out_dir')
+    parser.add_argument('--shards', type=int, default=3, help='check: number of shard processes')
+    parser.add_argument('--summary_only', action='store_true',
+                        help='run --shard: write only the mergeable summaries, not the day rows')
+    parser.add_argument('--out_dir', type=str, default='./output/sweep', help='Folder for shards or merged results')
+    parser.add_argument('--kpi', type=str, default='mean_total_system_time', choices=DAY_KPI_NAMES,
+                        help='KPI to print after a merge')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the intervals')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes per shard')
+    parser.add_argument('--quiet', action='store_true', help='Print nothing but errors')
+    args = parser.parse_args()
+
+    scenario_args = ['--num_replications', str(args.num_replications), '--first_seed', str(args.first_seed),
+                     '--workers', str(args.workers)] + (['--scenario', args.scenario] if args.scenario else [])
+    args.scenarios = load_scenarios(args.scenario) if args.scenario else [resolve_scenario(s) for s in SCENARIO_GRID]
+    args.seeds = list(range(args.first_seed, args.first_seed + args.num_replications))
+
+    if args.command == 'check':
+        sys.exit(0 if _check(args, scenario_args) else 1)
+    if args.command == 'merge':
+        merged = merge_shards(read_shards(args.paths or [args.out_dir]), args.confidence)
+    elif args.shard:
+        shard, num_shards = parse_shard(args.shard)
+        document = run_shard(args.scenarios, args.seeds, shard, num_shards, args.workers, not args.summary_only)
+        path = write_shard(document, args.out_dir)
+        if not args.quiet:
+            print(f"Shard {shard}/{num_shards} of sweep {document['sweep']}: {len(document['units'])} days "
+                  f"in {document['seconds']:.1f} s -> {path}")
+        return
+    else:
+        merged = merge_shards([run_shard(args.scenarios, args.seeds, workers=args.workers)], args.confidence)
+    for path in write_merged(merged, args.out_dir):
+        if not args.quiet:
+            print(f"Wrote {path}")
+    if not args.quiet:
+        _print_statistics(merged, args.kpi)
+
+
+if __name__ == "__main__":
+    run_sweep()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from bootstrap import _jackknife_acceleration, bootstrap_intervals, paired_difference_intervals
+
+NUM_RESAMPLES = 20000
+
+
+@pytest.fixture(scope='module')
+def skewed():
+    # a skewed sample, like LOS KPIs, where BCa and percentile intervals differ
+    return np.random.default_rng(7).lognormal(0.0, 1.0, size=60)
+
+
+@pytest.mark.parametrize('method, scipy_method', [('percentile', 'percentile'), ('bca', 'BCa')])
+def test_intervals_match_scipy(skewed, method, scipy_method):
+    interval = bootstrap_intervals(skewed[:, None], ['x'], method=method, num_resamples=NUM_RESAMPLES, seed=1)['x']
+    reference = stats.bootstrap((skewed,), np.mean, n_resamples=NUM_RESAMPLES, method=scipy_method,
+                                rng=np.random.default_rng(2)).confidence_interval
+
+    assert interval['n'] == len(skewed)
+    assert interval['mean'] == pytest.approx(skewed.mean())
+    # both are Monte Carlo estimates; at this many resamples they differ by well under 3% of the width
+    width = reference.high - reference.low
+    assert interval['low'] == pytest.approx(reference.low, abs=0.03 * width)
+    assert interval['high'] == pytest.approx(reference.high, abs=0.03 * width)
+
+
+def test_bca_moves_the_interval_towards_the_skew(skewed):
+    percentile = bootstrap_intervals(skewed[:, None], ['x'], method='percentile', num_resamples=4000)['x']
+    bca = bootstrap_intervals(skewed[:, None], ['x'], method='bca', num_resamples=4000)['x']
+    assert bca['low'] > percentile['low'] and bca['high'] > percentile['high']
+
+
+def test_jackknife_acceleration_matches_leave_one_out():
+    table = np.random.default_rng(3).gamma(2.0, size=(25, 2))
+    table[[2, 9, 20], 1] = np.nan
+    for column in range(2):
+        values = table[:, column][~np.isnan(table[:, column])]
+        means = np.array([np.delete(values, i).mean() for i in range(len(values))])
+        deviation = means.mean() - means
+        expected = np.sum(deviation ** 3) / (6 * np.sum(deviation ** 2) ** 1.5)
+        assert _jackknife_acceleration(table)[column] == pytest.approx(expected)
+
+
+def test_undefined_kpis_get_nan_bounds():
+    table = np.column_stack([np.arange(10.0), np.full(10, np.nan), [1.0] + [np.nan] * 9])
+    intervals = bootstrap_intervals(table, ['a', 'b', 'c'], num_resamples=500)
+    assert intervals['a']['low'] < intervals['a']['mean'] < intervals['a']['high']
+    for name in ['b', 'c']:
+        assert np.isnan(intervals[name]['low']) and np.isnan(intervals[name]['high'])
+
+
+def test_paired_differences_resample_seeds_together():
+    rng = np.random.default_rng(4)
+    common = rng.normal(size=(40, 1))
+    first, second = common + 0.5 + 0.05 * rng.normal(size=(40, 1)), common
+    paired = paired_difference_intervals(first, second, ['x'], method='percentile', num_resamples=2000)['x']
+    unpaired = bootstrap_intervals(first, ['x'], method='percentile', num_resamples=2000)['x']
+    # the shared noise cancels in the differences, so their interval is far narrower
+    assert paired['low'] < 0.5 < paired['high']
+    assert paired['high'] - paired['low'] < 0.2 * (unpaired['high'] - unpaired['low'])
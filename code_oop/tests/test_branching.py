@@ -0,0 +1,20 @@
+import os
+
+import numpy as np
+import pytest
+
+from branching import _branch_chunk, shared_prefix_time
+from scenarios import resolve_scenario
+
+VARIANTS = [resolve_scenario({'wf_1ss': True, 'ai_time': ai_time}) for ai_time in ['none', 'afternoon']]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_batches_match_days_from_the_start():
+    branch_time = shared_prefix_time(VARIANTS)
+    assert branch_time > 0
+    seeds = list(range(1, 8))
+    # 7 seeds in batches of 3, so the last batch uses only some of the contexts
+    branched = np.array(_branch_chunk(VARIANTS, seeds, branch_time, True, seeds_per_fork=3))
+    full = np.array(_branch_chunk(VARIANTS, seeds, 0, False))
+    np.testing.assert_array_equal(branched, full)
@@ -0,0 +1,33 @@
+from run_simulation import ContextCache, get_context
+
+
+def test_context_cache_keeps_the_most_recently_used():
+    cache = ContextCache(maxsize=2)
+    created = []
+
+    def create(key):
+        created.append(key)
+        return object()
+
+    first = cache.get('a', lambda: create('a'))
+    cache.get('b', lambda: create('b'))
+    assert cache.get('a', lambda: create('a')) is first
+    cache.get('c', lambda: create('c'))
+    assert len(cache) == 2
+    # 'b' was the least recently used, so only it is built again
+    cache.get('a', lambda: create('a'))
+    cache.get('b', lambda: create('b'))
+    assert created == ['a', 'b', 'c', 'b']
+
+
+def test_evicted_contexts_are_rebuilt_to_the_same_days():
+    scenario = {'stoptime': 4.0}
+    context = get_context(scenario)
+    context.reset(5)
+    expected, _ = context.run()
+    for index in range(40):
+        get_context({'stoptime': 3.0 + index * 0.01})
+    rebuilt = get_context(scenario)
+    assert rebuilt is not context
+    rebuilt.reset(5)
+    assert rebuilt.run()[0] == expected
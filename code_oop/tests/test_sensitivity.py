@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from sensitivity import (factor_values, morris_design, morris_effects, morris_indices, morris_steps,
+                         saltelli_design, sobol_indices)
+
+
+def _factor(name, low, high, integer=False):
+    return {'name': name, 'low': low, 'high': high, 'integer': integer}
+
+
+def test_morris_effects_of_a_linear_function_are_its_slopes_times_the_ranges():
+    factors = [_factor('a', 0.0, 2.0), _factor('b', 10.0, 11.0), _factor('c', -1.0, 1.0)]
+    slopes = np.array([3.0, -5.0, 0.0])
+    rng = np.random.default_rng(1)
+    unit_points, _, orders = morris_design(len(factors), 30, rng)
+    y = factor_values(factors, unit_points) @ slopes
+
+    effects = morris_effects(y, morris_steps(factors, unit_points, orders), orders)
+    indices = morris_indices(effects, 200, rng)
+
+    ranges = np.array([2.0, 1.0, 2.0])
+    np.testing.assert_allclose(effects, np.broadcast_to(slopes * ranges, effects.shape), atol=1e-9)
+    np.testing.assert_allclose(indices['mu_star'], np.abs(slopes) * ranges, atol=1e-9)
+    np.testing.assert_allclose(indices['sigma'], 0.0, atol=1e-9)
+
+
+@pytest.mark.parametrize('levels', [4, 6])
+def test_morris_effects_of_integer_factors_are_on_one_scale(levels):
+    # a resource count within one unit of 3: a grid step moves it by one unit or by two
+    factors = [_factor('resources.num_scanner', 2, 4, integer=True), _factor('x', 0.0, 1.0)]
+    rng = np.random.default_rng(2)
+    unit_points, _, orders = morris_design(len(factors), 40, rng, levels)
+    values = factor_values(factors, unit_points)
+    y = 7.0 * values[:, 0] + values[:, 1]
+
+    steps = morris_steps(factors, unit_points, orders)
+    effects = morris_effects(y, steps, orders)
+
+    assert set(np.round(np.abs(steps[orders == 0]) * 2).astype(int)) <= {1, 2}
+    np.testing.assert_allclose(effects[:, 0], 7.0 * 2, atol=1e-9)
+    np.testing.assert_allclose(effects[:, 1], 1.0, atol=1e-9)
+
+
+def test_sobol_indices_of_the_ishigami_function():
+    a, b = 7.0, 0.1
+    factors = [_factor(name, -np.pi, np.pi) for name in ['x1', 'x2', 'x3']]
+    rng = np.random.default_rng(3)
+    x = factor_values(factors, saltelli_design(3, 20000, rng))
+    y = np.sin(x[:, 0]) + a * np.sin(x[:, 1]) ** 2 + b * x[:, 2] ** 4 * np.sin(x[:, 0])
+
+    indices = sobol_indices(y, 3, 100, rng)
+
+    variance = a ** 2 / 8 + b * np.pi ** 4 / 5 + b ** 2 * np.pi ** 8 / 18 + 0.5
+    first = np.array([0.5 * (1 + b * np.pi ** 4 / 5) ** 2, a ** 2 / 8, 0.0]) / variance
+    total = first + np.array([1.0, 0.0, 1.0]) * (8 * b ** 2 * np.pi ** 8 / 225) / variance
+    np.testing.assert_allclose(indices['S1'], first, atol=0.03)
+    np.testing.assert_allclose(indices['ST'], total, atol=0.03)
+    assert np.all(indices['S1_low'] <= indices['S1_high'])
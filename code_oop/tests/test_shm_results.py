@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from shm_results import LOG_COLUMNS, SharedResults, store_days
+
+
+def test_log_columns_match_the_workflow():
+    with SharedResults(1, 200) as results:
+        store_days(results, {'wf_1ss': True, 'ai_time': 'any'}, [0], [3])
+        assert results.counts[0] > 0
+        assert not np.isnan(results.column('exit_system_ts')[0, :results.counts[0]]).all()
+
+
+def test_store_rejects_renamed_columns():
+    timestamps = dict.fromkeys(LOG_COLUMNS, np.nan)
+    timestamps['patient_type'] = 'screen'
+    renamed = {('got_scanner_ts' if name == 'got_screen_scanner_ts' else name): value
+               for name, value in timestamps.items()}
+    with SharedResults(1, 10) as results:
+        results.store(0, [timestamps], 1)
+        with pytest.raises(ValueError, match='differ from LOG_COLUMNS'):
+            results.store(0, [renamed], 1)
@@ -0,0 +1,68 @@
+import math
+
+import numpy as np
+import pytest
+
+from sweep import combine_moments, merge_shards, moments, run_shard
+
+SCENARIOS = [{}, {'wf_1ss': True, 'ai_time': 'afternoon'}]
+SEEDS = [1, 2, 3, 4, 5]
+
+
+def _assert_moments_close(combined, direct):
+    assert combined['n'] == direct['n']
+    assert combined['mean'] == pytest.approx(direct['mean'], rel=1e-12, abs=1e-12)
+    assert combined['m2'] == pytest.approx(direct['m2'], rel=1e-9, abs=1e-12)
+    assert combined['min'] == direct['min']
+    assert combined['max'] == direct['max']
+
+
+@pytest.mark.parametrize('num_parts', [1, 2, 7])
+def test_combine_moments_matches_one_pass(num_parts):
+    rng = np.random.default_rng(num_parts)
+    values = rng.lognormal(0.0, 1.0, 500) + 1e3
+    values[rng.random(500) < 0.1] = np.nan
+    cuts = np.sort(rng.integers(0, len(values), num_parts - 1))
+    # parts may be empty, e.g. a shard whose days of a KPI are all undefined
+    parts = np.split(values, cuts) + [np.array([np.nan])]
+
+    combined = moments([])
+    for part in parts:
+        combined = combine_moments(combined, moments(part))
+    _assert_moments_close(combined, moments(values))
+
+
+def test_combine_moments_of_empty_sets():
+    empty = combine_moments(moments([]), moments([]))
+    assert empty['n'] == 0 and empty['min'] == math.inf and empty['max'] == -math.inf
+
+
+@pytest.fixture(scope='module')
+def single():
+    return merge_shards([run_shard(SCENARIOS, SEEDS)])
+
+
+@pytest.mark.parametrize('keep_rows', [True, False])
+def test_merge_shards_matches_one_node(single, keep_rows):
+    documents = [run_shard(SCENARIOS, SEEDS, shard, 3, keep_rows=keep_rows) for shard in (2, 0, 1)]
+    merged = merge_shards(documents)
+
+    assert merged['sweep'] == single['sweep']
+    if keep_rows:
+        # statistics from the sorted dataset, exactly as on one node
+        np.testing.assert_array_equal(np.array(merged['rows']), np.array(single['rows']))
+        tolerance = {'rel': 0, 'abs': 0}
+    else:
+        assert merged['rows'] is None
+        tolerance = {'rel': 1e-9, 'abs': 1e-12}
+    assert list(merged['statistics']) == list(single['statistics'])
+    for label, statistics in single['statistics'].items():
+        for name, expected in statistics.items():
+            for field, value in merged['statistics'][label][name].items():
+                assert value == pytest.approx(expected[field], nan_ok=True, **tolerance), (label, name, field)
+
+
+def test_merge_shards_needs_every_shard():
+    documents = [run_shard(SCENARIOS, SEEDS, shard, 3, keep_rows=False) for shard in (0, 2)]
+    with pytest.raises(ValueError, match='missing \\[1\\]'):
+        merge_shards(documents)
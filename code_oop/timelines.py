@@ -0,0 +1,329 @@
+import numpy as np
+
+from scenarios import load_scenario, resolve_scenario
+
+# Reads of the AI workflow: the AI assessment and the diagnostic reads that follow it.
+# With rad_change they are served by radiologist_same_day, otherwise by the radiologist
+# pool (see resource_intervals). Regular diagnostic reads that rad_change_2 sends to a
+# busy same-day radiologist cannot be told apart in the log and stay on 'radiologist'.
+SAME_DAY_READS = [
+    ('begin_ai_assess_ts', 'end_ai_assess_ts'),
+    ('get_rad_dx_mammo_us_mammo_after_ai_ts', 'release_rad_dx_mammo_us_mammo_after_ai_ts'),
+    ('get_rad_dx_mammo_us_us_after_ai_ts', 'release_rad_dx_mammo_us_us_after_ai_ts'),
+    ('get_rad_dx_mammo_after_ai_ts', 'release_rad_dx_mammo_after_ai_ts'),
+    ('get_rad_dx_us_after_ai_ts', 'release_rad_dx_us_after_ai_ts'),
+]
+
+# Each resource is a list of (got, release) column pairs from the patient log.
+# A pair contributes one busy interval per patient row where both are present.
+# Several 'got' columns share the same 'release' column (e.g. the three biopsy
+# paths all end on release_scanner_after_post_bx_mammo_ts); only one of them is
+# ever set for a given patient, so the unused pairs drop out as missing.
+RESOURCE_INTERVALS = {
+    'checkin_staff': [
+        ('got_checkin_staff_ts', 'release_checkin_staff_ts'),
+    ],
+    'public_wait_room': [
+        ('got_public_wait_room_ts', 'release_public_wait_room_ts'),
+    ],
+    'consent_staff': [
+        ('got_consent_staff_ts', 'release_consent_staff_ts'),
+    ],
+    'change_room': [
+        ('got_change_room_ts', 'release_change_room_ts'),
+        ('got_checkout_change_room_ts', 'release_checkout_change_room_ts'),
+    ],
+    'gowned_wait_room': [
+        ('got_gowned_wait_room_ts', 'release_gowned_wait_room_ts'),
+    ],
+    'scanner': [
+        ('got_screen_scanner_ts', 'release_screen_scanner_ts'),
+        ('got_dx_scanner_ts', 'release_dx_scanner_ts'),
+        ('got_dx_scanner_before_us_ts', 'release_dx_scanner_before_us_ts'),
+        ('got_dx_scanner_after_ai_ts', 'release_dx_scanner_after_ai_ts'),
+        ('got_dx_scanner_before_us_after_ai_ts', 'release_dx_scanner_before_us_after_ai_ts'),
+        ('got_scanner_bx_ts', 'release_scanner_after_post_bx_mammo_ts'),
+        ('got_scanner_after_us_bx_ts', 'release_scanner_after_post_bx_mammo_ts'),
+        ('got_scanner_after_mri_bx_ts', 'release_scanner_after_post_bx_mammo_ts'),
+    ],
+    'us_machine': [
+        ('got_us_machine_ts', 'release_us_machine_ts'),
+        ('got_us_machine_after_dx_scanner_ts', 'release_dx_scanner_us_machine_ts'),
+        ('got_us_machine_after_ai_ts', 'release_us_machine_after_ai_ts'),
+        ('got_us_machine_after_dx_scanner_after_ai_ts', 'release_dx_scanner_us_machine_after_ai_ts'),
+        ('got_us_machine_bx_ts', 'release_us_machine_after_bx_ts'),
+        ('got_screen_us_machine_ts', 'release_screen_us_machine_ts'),
+    ],
+    'radiologist': [
+        ('got_us_machine_bx_ts', 'release_us_machine_after_bx_ts'),
+        ('got_scanner_bx_ts', 'release_scanner_after_post_bx_mammo_ts'),
+        ('got_mri_machine_ts', 'release_mri_machine_ts'),
+        ('get_rad_dx_mammo_ts', 'release_rad_dx_mammo_ts'),
+        ('get_rad_dx_us_ts', 'release_rad_dx_us_ts'),
+        ('get_rad_dx_mammo_us_mammo_ts', 'release_rad_dx_mammo_us_mammo_ts'),
+        ('get_rad_dx_mammo_us_us_ts', 'release_rad_dx_mammo_us_us_ts'),
+        ('get_rad_us_bx_ts', 'release_rad_us_bx_ts'),
+        ('get_rad_ux_bx_ts', 'release_rad_us_bx_ts'),  # column name used by ./code
+        ('get_rad_mri_bx_ts', 'release_rad_mri_bx_ts'),
+        *SAME_DAY_READS,
+    ],
+}
+
+CENSUS_INTERVAL = ('arrival_ts', 'exit_system_ts')
+
+
+def resource_intervals(scenario=None):
+    """
+    Column pairs per resource for the logs of a scenario: RESOURCE_INTERVALS, with the
+    SAME_DAY_READS moved to 'radiologist_same_day' when the scenario has rad_change.
+
+    Args:
+        scenario (dict, optional): (Partial) scenario the logs were simulated with. Defaults to the baseline.
+    """
+    intervals = dict(RESOURCE_INTERVALS)
+    if resolve_scenario(scenario or {})['rad_change']:
+        intervals['radiologist'] = [pair for pair in intervals['radiologist'] if pair not in SAME_DAY_READS]
+        intervals['radiologist_same_day'] = list(SAME_DAY_READS)
+    return intervals
+
+
+def scenario_capacity(scenario=None):
+    """
+    Servers of each resource in a scenario, as MammoClinic builds them from its 'resources'.
+
+    Args:
+        scenario (dict, optional): (Partial) scenario. Defaults to the baseline.
+
+    Returns:
+        dict: Resource name (as in resource_intervals) -> number of servers.
+    """
+    resources = resolve_scenario(scenario or {})['resources']
+    return {name: resources['num_' + name] for name in resource_intervals(scenario)}
+
+
+def load_patient_logs(paths):
+    """
+    Reads per-seed patient log CSVs into one DataFrame with a 'replication' column.
+
+    Args:
+        paths (list): Paths of clinic_patient_log_df_*.csv files, one simulated day each.
+
+    Returns:
+        pandas.DataFrame: All rows, with 'replication' set to the index of the file in paths.
+    """
+    import pandas as pd
+
+    frames = [pd.read_csv(path) for path in paths]
+    log_df = pd.concat(frames, ignore_index=True)
+    log_df['replication'] = np.repeat(np.arange(len(frames)), [len(df) for df in frames])
+    return log_df
+
+
+def _column(columns, name, n_rows):
+    if name not in columns:
+        return np.full(n_rows, np.nan)
+    return np.asarray(columns[name], dtype=float)
+
+
+def collect_intervals(columns, pairs, replication):
+    """
+    Stacks the (start, end) intervals of one resource across all column pairs.
+
+    Args:
+        columns (Mapping): Column name -> array-like, e.g. a DataFrame.
+        pairs (list): (got, release) column name pairs for the resource.
+        replication (numpy.ndarray): Replication index of each row.
+
+    Returns:
+        tuple: (rep, start, end) arrays with rows where either end is missing dropped.
+    """
+    n_rows = len(replication)
+    reps, starts, ends = [], [], []
+    for got_col, release_col in pairs:
+        start = _column(columns, got_col, n_rows)
+        end = _column(columns, release_col, n_rows)
+        keep = ~(np.isnan(start) | np.isnan(end))
+        reps.append(replication[keep])
+        starts.append(start[keep])
+        ends.append(end[keep])
+    return np.concatenate(reps), np.concatenate(starts), np.concatenate(ends)
+
+
+def step_function(rep, start, end, grid, n_reps):
+    """
+    Evaluates the number of open intervals at every grid time for every replication.
+
+    This is a sweep line done with sorted arrays instead of a Python loop. Times
+    are shifted by rep * span so that all replications live on one sorted axis;
+    the count at (r, t) is then #starts <= t minus #ends <= t inside block r.
+
+    Args:
+        rep (numpy.ndarray): Replication index of each interval.
+        start (numpy.ndarray): Interval start times.
+        end (numpy.ndarray): Interval end times.
+        grid (numpy.ndarray): Sorted evaluation times.
+        n_reps (int): Number of replications.
+
+    Returns:
+        numpy.ndarray: Integer counts with shape (n_reps, len(grid)).
+    """
+    grid = np.asarray(grid, dtype=float)
+    if len(start) == 0:
+        return np.zeros((n_reps, len(grid)), dtype=np.int64)
+
+    lo = min(start.min(), grid[0])
+    span = max(end.max(), grid[-1]) - lo + 1.0
+    offset = rep.astype(float) * span - lo
+
+    start_keys = np.sort(start + offset)
+    end_keys = np.sort(end + offset)
+
+    block = np.arange(n_reps, dtype=float)[:, None] * span - lo
+    probes = (block + grid[None, :]).ravel()
+    block_start = np.arange(n_reps, dtype=float) * span
+
+    n_started = np.searchsorted(start_keys, probes, side='right').reshape(n_reps, -1)
+    n_ended = np.searchsorted(end_keys, probes, side='right').reshape(n_reps, -1)
+    n_started -= np.searchsorted(start_keys, block_start, side='left')[:, None]
+    n_ended -= np.searchsorted(end_keys, block_start, side='left')[:, None]
+    return n_started - n_ended
+
+
+def busy_time(rep, start, end, edges, n_reps):
+    """
+    Integrates occupancy over each [edges[k], edges[k+1]) bin for every replication.
+
+    Args:
+        rep (numpy.ndarray): Replication index of each interval.
+        start (numpy.ndarray): Interval start times.
+        end (numpy.ndarray): Interval end times.
+        edges (numpy.ndarray): Sorted bin edges.
+        n_reps (int): Number of replications.
+
+    Returns:
+        numpy.ndarray: Server-hours spent busy, shape (n_reps, len(edges) - 1).
+    """
+    edges = np.asarray(edges, dtype=float)
+    n_bins = len(edges) - 1
+    overlap = np.minimum(end[:, None], edges[None, 1:]) - np.maximum(start[:, None], edges[None, :-1])
+    np.clip(overlap, 0.0, None, out=overlap)
+    flat_index = (rep[:, None] * n_bins + np.arange(n_bins)[None, :]).ravel()
+    totals = np.bincount(flat_index, weights=overlap.ravel(), minlength=n_reps * n_bins)
+    return totals.reshape(n_reps, n_bins)
+
+
+def _replication_index(log_df):
+    if 'replication' in log_df:
+        rep_values = np.asarray(log_df['replication'])
+        _, replication = np.unique(rep_values, return_inverse=True)
+        return replication, int(replication.max()) + 1 if len(replication) else 0
+    return np.zeros(len(log_df), dtype=np.int64), 1
+
+
+def occupancy_timelines(log_df, grid, resources=None, scenario=None):
+    """
+    Builds resource occupancy and clinic census step functions on a fixed time grid.
+
+    Args:
+        log_df (pandas.DataFrame): Patient log rows, optionally with a 'replication' column.
+        grid (array-like): Times (hours since 7 am) to evaluate the step functions at.
+        resources (list, optional): Resource names from resource_intervals(scenario). Defaults to all.
+        scenario (dict, optional): Scenario the logs were simulated with. Defaults to the baseline.
+
+    Returns:
+        dict: Name -> int array of shape (n_reps, len(grid)). Includes 'census',
+              the number of patients in the clinic.
+    """
+    replication, n_reps = _replication_index(log_df)
+    intervals = resource_intervals(scenario)
+    resources = list(intervals) if resources is None else resources
+
+    timelines = {}
+    for name in resources:
+        rep, start, end = collect_intervals(log_df, intervals[name], replication)
+        timelines[name] = step_function(rep, start, end, grid, n_reps)
+
+    rep, start, end = collect_intervals(log_df, [CENSUS_INTERVAL], replication)
+    timelines['census'] = step_function(rep, start, end, grid, n_reps)
+    return timelines
+
+
+def utilization_by_bin(log_df, edges, capacity=None, resources=None, scenario=None):
+    """
+    Computes each resource's busy fraction per time bin, e.g. per clinic hour.
+
+    Args:
+        log_df (pandas.DataFrame): Patient log rows, optionally with a 'replication' column.
+        edges (array-like): Bin edges in hours since 7 am, e.g. range(0, 11).
+        capacity (dict, optional): Resource name -> number of servers. Defaults to scenario_capacity(scenario).
+        resources (list, optional): Resource names from resource_intervals(scenario). Defaults to all.
+        scenario (dict, optional): Scenario the logs were simulated with. Defaults to the baseline.
+
+    Returns:
+        dict: Name -> float array of shape (n_reps, len(edges) - 1) in [0, 1].
+    """
+    replication, n_reps = _replication_index(log_df)
+    intervals = resource_intervals(scenario)
+    capacity = scenario_capacity(scenario) if capacity is None else capacity
+    resources = list(intervals) if resources is None else resources
+    widths = np.diff(np.asarray(edges, dtype=float))
+
+    utilization = {}
+    for name in resources:
+        rep, start, end = collect_intervals(log_df, intervals[name], replication)
+        utilization[name] = busy_time(rep, start, end, edges, n_reps) / (widths * capacity[name])
+    return utilization
+
+
+def timelines_to_frame(timelines, grid):
+    """
+    Flattens the output of occupancy_timelines into a long DataFrame.
+
+    Returns:
+        pandas.DataFrame: Columns 'replication', 'time' and one column per timeline.
+    """
+    import pandas as pd
+
+    n_reps = next(iter(timelines.values())).shape[0]
+    grid = np.asarray(grid, dtype=float)
+    frame = {'replication': np.repeat(np.arange(n_reps), len(grid)),
+             'time': np.tile(grid, n_reps)}
+    for name, values in timelines.items():
+        frame[name] = values.ravel()
+    return pd.DataFrame(frame)
+
+
+def run_timelines():
+    """
+    Command line entry point: writes occupancy/census timelines for a folder of patient logs.
+    """
+    import argparse
+    import glob
+    import os
+
+    parser = argparse.ArgumentParser(description="Resource occupancy and census timelines from patient logs.")
+    parser.add_argument('--log_dir', type=str, default='./output/log_1ss', help='Folder of per-seed patient log CSVs')
+    parser.add_argument('--step', type=float, default=0.25, help='Grid step in hours')
+    parser.add_argument('--end', type=float, default=11.0, help='Last grid time in hours since 7 am')
+    parser.add_argument('--out', type=str, default='./output/timelines.csv', help='Output CSV path')
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='JSON/YAML/TOML file with the scenario the logs were simulated with (default: baseline)')
+    args = parser.parse_args()
+
+    scenario = None
+    if args.scenario:
+        scenario = load_scenario(args.scenario)
+
+    paths = sorted(glob.glob(os.path.join(args.log_dir, '*.csv')))
+    if not paths:
+        raise ValueError(f"No patient logs found in {args.log_dir}.")
+
+    log_df = load_patient_logs(paths)
+    grid = np.arange(0.0, args.end + 1e-9, args.step)
+    timelines_df = timelines_to_frame(occupancy_timelines(log_df, grid, scenario=scenario), grid)
+    timelines_df.to_csv(args.out, index=False)
+    print(f"Wrote {len(paths)} replications x {len(grid)} grid points to {args.out}")
+
+
+if __name__ == "__main__":
+    run_timelines()
@@ -0,0 +1,229 @@
+import argparse
+import csv
+import glob
+import gzip
+import heapq
+import json
+import math
+import os
+
+from scenarios import load_scenario
+from timelines import CENSUS_INTERVAL, resource_intervals
+
+# Trace timestamps are microseconds; simulation time is hours since 7 am.
+US_PER_HOUR = 3600 * 1e6
+CLINIC_OPEN_HOUR = 7
+HOURS_PER_DAY = 24
+
+PATIENT_PID = 1
+CENSUS_PID = 2
+RESOURCE_PID_BASE = 10
+
+
+def _to_float(value):
+    if value is None or value == '':
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class ChromeTraceWriter:
+    """
+    Streams Chrome trace-event JSON (the 'JSON Array Format') to disk.
+
+    Events are written as soon as they are emitted, so memory stays bounded by one
+    simulated day no matter how many days are exported. The output opens directly
+    in chrome://tracing and in the Perfetto UI; a '.gz' suffix writes gzip.
+    """
+    def __init__(self, path):
+        self.path = path
+        if path.endswith('.gz'):
+            self.file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('[\n')
+        self.first_event = True
+        self.named_tracks = set()
+        self.num_events = 0
+
+    def emit(self, event):
+        if not self.first_event:
+            self.file.write(',\n')
+        self.file.write(json.dumps(event, separators=(',', ':')))
+        self.first_event = False
+        self.num_events += 1
+
+    def name_track(self, pid, name, tid=None, thread_name=None):
+        """Emits process/thread name metadata the first time a track is used."""
+        if (pid, None) not in self.named_tracks:
+            self.emit({'ph': 'M', 'name': 'process_name', 'pid': pid, 'args': {'name': name}})
+            self.emit({'ph': 'M', 'name': 'process_sort_index', 'pid': pid, 'args': {'sort_index': pid}})
+            self.named_tracks.add((pid, None))
+        if tid is not None and (pid, tid) not in self.named_tracks:
+            self.emit({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}})
+            self.emit({'ph': 'M', 'name': 'thread_sort_index', 'pid': pid, 'tid': tid, 'args': {'sort_index': tid}})
+            self.named_tracks.add((pid, tid))
+
+    def close(self):
+        self.file.write('\n]\n')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _ts(day, hours):
+    return (day * HOURS_PER_DAY + CLINIC_OPEN_HOUR + hours) * US_PER_HOUR
+
+
+def _patient_intervals(row, intervals):
+    """Yields (resource, got_column, start, end) for every stage the patient occupied."""
+    for resource, pairs in intervals.items():
+        for got_col, release_col in pairs:
+            start = _to_float(row.get(got_col))
+            end = _to_float(row.get(release_col))
+            if not (math.isnan(start) or math.isnan(end)):
+                yield resource, got_col, start, end
+
+
+def _assign_lanes(intervals):
+    """
+    Places intervals on the lowest-numbered free server lane, like a Gantt chart.
+
+    Args:
+        intervals (list): (start, end, payload) tuples.
+
+    Returns:
+        list: (lane, start, end, payload) tuples.
+    """
+    busy = []  # heap of (end, lane)
+    free = []  # heap of lanes
+    next_lane = 0
+    placed = []
+    for start, end, payload in sorted(intervals, key=lambda item: (item[0], item[1])):
+        while busy and busy[0][0] <= start:
+            heapq.heappush(free, heapq.heappop(busy)[1])
+        if free:
+            lane = heapq.heappop(free)
+        else:
+            lane = next_lane
+            next_lane += 1
+        heapq.heappush(busy, (end, lane))
+        placed.append((lane, start, end, payload))
+    return placed
+
+
+def _emit_counter(writer, pid, name, day, intervals):
+    """Emits a step counter of how many intervals are open over time."""
+    edges = [(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals]
+    edges.sort(key=lambda item: (item[0], item[1]))
+    level = 0
+    for time, delta in edges:
+        level += delta
+        writer.emit({'ph': 'C', 'name': name, 'pid': pid, 'ts': _ts(day, time), 'args': {name: level}})
+
+
+def write_day(writer, rows, day=0, scenario=None):
+    """
+    Emits one simulated day of patient journeys and resource busy intervals.
+
+    Args:
+        writer (ChromeTraceWriter): Open trace writer.
+        rows (iterable): Patient log rows as dicts (clinic.timestamps_list or csv.DictReader rows).
+        day (int): Day index; each day is shifted by 24 hours on the trace timeline.
+        scenario (dict, optional): Scenario the day was simulated with, which decides the
+            resource lanes (see timelines.resource_intervals). Defaults to the baseline.
+    """
+    intervals = resource_intervals(scenario)
+    resource_pids = {name: RESOURCE_PID_BASE + i for i, name in enumerate(intervals)}
+    busy_intervals = {name: [] for name in intervals}
+    visits = []
+
+    writer.name_track(PATIENT_PID, 'Patients')
+    for row in rows:
+        patient = int(_to_float(row.get('patient_id')))
+        patient_type = row.get('patient_type') or 'unknown'
+        arrival = _to_float(row.get(CENSUS_INTERVAL[0]))
+        exit_ts = _to_float(row.get(CENSUS_INTERVAL[1]))
+        label = f'day {day} pt {patient} ({patient_type})'
+
+        writer.name_track(PATIENT_PID, 'Patients', patient, f'pt {patient}')
+        writer.emit({'ph': 'X', 'name': patient_type, 'cat': 'visit', 'pid': PATIENT_PID, 'tid': patient,
+                     'ts': _ts(day, arrival), 'dur': (exit_ts - arrival) * US_PER_HOUR,
+                     'args': {'day': day, 'patient_id': patient}})
+        visits.append((arrival, exit_ts))
+
+        # the same column pair can appear under two resources (e.g. a biopsy
+        # holds the scanner and a radiologist); the patient track shows it once
+        stages_seen = set()
+        for resource, got_col, start, end in _patient_intervals(row, intervals):
+            busy_intervals[resource].append((start, end, label))
+            if (got_col, start, end) in stages_seen:
+                continue
+            stages_seen.add((got_col, start, end))
+            stage = got_col.split('_', 1)[1][:-3]
+            writer.emit({'ph': 'X', 'name': stage, 'cat': resource, 'pid': PATIENT_PID, 'tid': patient,
+                         'ts': _ts(day, start), 'dur': (end - start) * US_PER_HOUR})
+
+    writer.name_track(CENSUS_PID, 'Clinic census')
+    _emit_counter(writer, CENSUS_PID, 'patients_in_clinic', day, visits)
+
+    for resource, resource_busy in busy_intervals.items():
+        pid = resource_pids[resource]
+        for lane, start, end, label in _assign_lanes(resource_busy):
+            writer.name_track(pid, resource, lane, f'{resource} #{lane + 1}')
+            writer.emit({'ph': 'X', 'name': label, 'cat': resource, 'pid': pid, 'tid': lane,
+                         'ts': _ts(day, start), 'dur': (end - start) * US_PER_HOUR})
+        _emit_counter(writer, pid, f'{resource}_busy', day, [(start, end) for start, end, _ in resource_busy])
+
+
+def export_logs(paths, out_path, scenario=None):
+    """
+    Converts per-seed patient log CSVs into one trace file, one day at a time.
+
+    Args:
+        paths (list): Patient log CSV paths; file k becomes day k on the timeline.
+        out_path (str): Destination .json or .json.gz file.
+        scenario (dict, optional): Scenario the logs were simulated with. Defaults to the baseline.
+
+    Returns:
+        int: Number of trace events written.
+    """
+    with ChromeTraceWriter(out_path) as writer:
+        for day, path in enumerate(paths):
+            with open(path, newline='') as f:
+                write_day(writer, csv.DictReader(f), day=day, scenario=scenario)
+        return writer.num_events
+
+
+def run_trace_export():
+    """
+    Command line entry point for exporting patient logs as a Chrome/Perfetto trace.
+    """
+    parser = argparse.ArgumentParser(description="Export simulated patient journeys as a Chrome trace.")
+    parser.add_argument('--log_dir', type=str, default='./output/log_1ss', help='Folder of per-seed patient log CSVs')
+    parser.add_argument('--max_days', type=int, default=None, help='Only export the first N logs (sorted by name)')
+    parser.add_argument('--out', type=str, default='./output/trace.json.gz', help='Output .json or .json.gz path')
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='JSON/YAML/TOML file with the scenario the logs were simulated with (default: baseline)')
+    args = parser.parse_args()
+
+    scenario = None
+    if args.scenario:
+        scenario = load_scenario(args.scenario)
+
+    paths = sorted(glob.glob(os.path.join(args.log_dir, '*.csv')))[:args.max_days]
+    if not paths:
+        raise ValueError(f"No patient logs found in {args.log_dir}.")
+
+    num_events = export_logs(paths, args.out, scenario)
+    print(f"Wrote {num_events} trace events for {len(paths)} days to {args.out}")
+
+
+if __name__ == "__main__":
+    run_trace_export()
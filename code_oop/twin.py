@@ -0,0 +1,536 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import math
+import os
+import socketserver
+import time
+
+import numpy as np
+
+from kpis import PATIENT_KPIS, column_array, normalize_patient_type
+from scenarios import CLINIC_HOURS, EXAM_TYPES, load_scenario, resolve_scenario
+from timelines import CENSUS_INTERVAL, collect_intervals, step_function
+from utils import CheckinStaffHandler, PublicWaitRoomHandler, ConsentRoomHandler, ChangeRoomHandler, \
+    GownedWaitRoomHandler, MriGuidedBiopsyWorkflow, MriOnlyWorkflow, ScreenMammoNoDxWorkflow, \
+    ScreenMammoDxMammoUSWorkflow, ScreenMammoDxMammoWorkflow, ScreenMammoDxUSWorkflow, DxMammoUSWorkflow, \
+    DxMammoWorkflow, DxUSWorkflow, USGuidedBiopsyWorkflow, MammoGuidedBiopsyWorkflow, ScreenUSWorkflow
+
+# Stages a feed reports, in the order of a patient's path; 'exam' is the whole
+# exam-type specific part of the visit (scanner, US, AI assessment, radiologist).
+STAGES = ['checkin_staff', 'public_wait_room', 'consent_staff', 'change_room', 'gowned_wait_room', 'exam',
+          'checkout_change_room']
+EVENTS = ['arrival', 'exit'] + [f'{action}_{stage}' for stage in STAGES for action in ('got', 'release')]
+
+# Single-resource stages: (MammoClinic resource, service time, got timestamp, release timestamp).
+STAGE_SERVICE = {
+    'checkin_staff': ('checkin_staff', 'pt_checkin', 'got_checkin_staff_ts', 'release_checkin_staff_ts'),
+    'public_wait_room': ('public_wait_room', 'use_public_wait_room', 'got_public_wait_room_ts',
+                         'release_public_wait_room_ts'),
+    'consent_staff': ('consent_staff', 'consent_patient', 'got_consent_staff_ts', 'release_consent_staff_ts'),
+    'change_room': ('change_room', 'use_change_room', 'got_change_room_ts', 'release_change_room_ts'),
+    'gowned_wait_room': ('gowned_wait_room', 'use_gowned_wait_room', 'got_gowned_wait_room_ts',
+                         'release_gowned_wait_room_ts'),
+    'checkout_change_room': ('change_room', 'use_change_room', 'got_checkout_change_room_ts',
+                             'release_checkout_change_room_ts'),
+}
+
+# Patient type (booked exam type, or the same-day path a screening turned into) ->
+# (workflow handler, which radiologist flag it takes).
+EXAM_HANDLERS = {
+    'screen': (ScreenMammoNoDxWorkflow, 'rad_change'),
+    'screen + dx mammo us': (ScreenMammoDxMammoUSWorkflow, 'rad_change'),
+    'screen + dx mammo': (ScreenMammoDxMammoWorkflow, 'rad_change'),
+    'screen + dx us': (ScreenMammoDxUSWorkflow, 'rad_change'),
+    'dx mammo us': (DxMammoUSWorkflow, 'rad_change_2'),
+    'dx mammo': (DxMammoWorkflow, 'rad_change_2'),
+    'dx us': (DxUSWorkflow, 'rad_change_2'),
+    'us bx': (USGuidedBiopsyWorkflow, None),
+    'mammo bx': (MammoGuidedBiopsyWorkflow, None),
+    'screen us': (ScreenUSWorkflow, None),
+    'mri-guided bx': (MriGuidedBiopsyWorkflow, None),
+    'mri': (MriOnlyWorkflow, None),
+}
+MRI_TYPES = ['mri-guided bx', 'mri']
+CONSENT_TYPES = ['us bx', 'mammo bx', 'screen us']
+
+# Waits whose counts over time are forecast as queue lengths.
+QUEUES = [name for name in PATIENT_KPIS if name.startswith('wait_for_')]
+PERCENTILES = [10, 50, 90]
+
+
+def parse_time(value):
+    """Feed time as hours since opening: a number, or a clock time such as '13:45'."""
+    if isinstance(value, str) and ':' in value:
+        hours, minutes = value.split(':')
+        return int(hours) - CLINIC_HOURS[0] + int(minutes) / 60
+    return float(value)
+
+
+def patient_path(patient_type):
+    """Stages a patient of this type passes through, in order."""
+    if patient_type in MRI_TYPES:
+        return ['checkin_staff', 'exam']
+    return [stage for stage in STAGES if stage != 'consent_staff' or patient_type in CONSENT_TYPES]
+
+
+class ClinicState(object):
+    """
+    Live state of a clinic day, built up from a feed of patient events.
+
+    Events are dicts with 'time' (hours since opening or 'HH:MM'), 'patient' (any
+    id) and 'event', one of EVENTS: 'arrival', 'got_<stage>' when a patient starts a
+    stage of STAGES, 'release_<stage>' when they finish it, and 'exit'. An arrival
+    carries the booked 'exam_type' (see scenarios.EXAM_TYPES); a 'patient_type'
+    such as 'screen + dx mammo us' may be given once a screening turned into a
+    same-day workup. {'event': 'now', 'time': ...} only moves the clock.
+
+    Args:
+        time (float, optional): Current time in hours since opening. Defaults to 0.
+    """
+    def __init__(self, time=0.0):
+        self.time = time
+        self.patients = {}
+
+    @classmethod
+    def from_events(cls, events, now=None):
+        state = cls()
+        for event in events:
+            state.apply(event)
+        if now is not None:
+            state.time = now
+        return state
+
+    def apply(self, event):
+        """Updates the state with one feed event."""
+        name = event.get('event')
+        event_time = parse_time(event['time'])
+        self.time = max(self.time, event_time)
+        if name == 'now':
+            return
+        if name not in EVENTS:
+            raise ValueError(f"Unknown feed event {name!r}, expected 'now' or one of {EVENTS}.")
+        patient_id = event['patient']
+        if name == 'arrival':
+            exam_type = normalize_patient_type(event.get('exam_type'))
+            if exam_type not in EXAM_TYPES:
+                raise ValueError(f"Arrival of patient {patient_id!r} needs an exam_type from {EXAM_TYPES}.")
+            self.patients[patient_id] = {'exam_type': exam_type, 'patient_type': exam_type, 'type_reported': False,
+                                         'timestamps': {'patient_id': patient_id, 'arrival_ts': event_time},
+                                         'last_event': 'arrival', 'last_time': event_time}
+            return
+        if patient_id not in self.patients:
+            raise ValueError(f"Feed event {name!r} for patient {patient_id!r} before their arrival.")
+        patient = self.patients[patient_id]
+        if event.get('patient_type'):
+            patient_type = normalize_patient_type(event['patient_type'])
+            if patient_type not in EXAM_HANDLERS:
+                raise ValueError(f"Unknown patient_type {event['patient_type']!r}, expected one of "
+                                 f"{list(EXAM_HANDLERS)}.")
+            patient['patient_type'] = patient_type
+            patient['type_reported'] = True
+        patient['timestamps'][f'{name}_ts' if name != 'exit' else 'exit_system_ts'] = event_time
+        patient['last_event'], patient['last_time'] = name, event_time
+
+    @property
+    def num_arrivals(self):
+        return len(self.patients)
+
+    def in_flight(self):
+        """Ids of the patients still in the clinic, those being served first, then by waiting time."""
+        patients = [(patient_id, patient) for patient_id, patient in self.patients.items()
+                    if patient['last_event'] != 'exit']
+        patients.sort(key=lambda item: (not item[1]['last_event'].startswith('got_'), item[1]['last_time']))
+        return [patient_id for patient_id, _ in patients]
+
+    def finished(self):
+        return [patient for patient in self.patients.values() if patient['last_event'] == 'exit']
+
+    def counts(self):
+        """Number of in-flight patients per stage, waiting ('before_<stage>') or being served."""
+        counts = {}
+        for patient_id in self.in_flight():
+            patient = self.patients[patient_id]
+            path = patient_path(patient['patient_type'])
+            event = patient['last_event']
+            if event.startswith('got_'):
+                key = event[len('got_'):]
+            else:
+                done = -1 if event == 'arrival' else path.index(event[len('release_'):])
+                key = f'before_{path[done + 1]}' if done + 1 < len(path) else 'leaving'
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+
+def residual_service(rg, mean_sd, elapsed, max_tries=100):
+    """
+    Remaining service time of a stage that started `elapsed` hours ago: a service
+    time drawn given it exceeds elapsed, minus elapsed (0 once overdue).
+    """
+    for _ in range(max_tries):
+        duration = rg.normal(*mean_sd)
+        if duration > elapsed:
+            return duration - elapsed
+    return 0.0
+
+
+def _same_day_type(rg, context, arrival_ts):
+    """Draws the path of a screening patient like run_workflow does for their arrival hour."""
+    hour = math.floor(arrival_ts) + CLINIC_HOURS[0]
+    if not context.ai_on_dict.get(hour):
+        return 'screen'
+    pct_dx_after_ai = context.pct_dx_after_ai
+    u = rg.random()
+    if u < pct_dx_after_ai * 0.7:
+        return 'screen + dx mammo us'
+    if u < pct_dx_after_ai * 0.85:
+        return 'screen + dx mammo'
+    if u < pct_dx_after_ai:
+        return 'screen + dx us'
+    return 'screen'
+
+
+def _stage_handler(env, clinic, patient_id, timestamps, stage, patient_type, context):
+    if stage == 'checkin_staff':
+        return CheckinStaffHandler(env, patient_id, clinic, timestamps)
+    if stage == 'public_wait_room':
+        return PublicWaitRoomHandler(env, patient_id, clinic, timestamps)
+    if stage == 'consent_staff':
+        # number > pct_dx_us_scheduled: the consent path
+        return ConsentRoomHandler(env, patient_id, clinic, timestamps, 1, 0)
+    if stage == 'change_room':
+        return ChangeRoomHandler(env, patient_id, clinic, timestamps, 'got_change_room_ts', 'release_change_room_ts')
+    if stage == 'gowned_wait_room':
+        return GownedWaitRoomHandler(env, patient_id, clinic, timestamps)
+    if stage == 'checkout_change_room':
+        return ChangeRoomHandler(env, patient_id, clinic, timestamps, 'got_checkout_change_room_ts',
+                                 'release_checkout_change_room_ts')
+    handler, flag = EXAM_HANDLERS[patient_type]
+    if flag is None:
+        return handler(env, patient_id, clinic, timestamps)
+    return handler(env, patient_id, clinic, timestamps, getattr(context, flag))
+
+
+def resume_patient(context, patient_id, patient):
+    """
+    SimPy process that continues an in-flight patient's visit from the current time.
+
+    A patient in a single-resource stage takes the resource back at once and keeps it
+    for the residual service time; a patient in their exam repeats it from the start
+    (the feed has no finer steps, so this errs towards longer stays). Patients
+    between stages queue for the next one.
+    """
+    env, clinic, rg = context.env, context.clinic, context.rg
+    timestamps = dict(patient['timestamps'])
+    patient_type = patient['patient_type']
+    event = patient['last_event']
+    if patient_type == 'screen' and not patient['type_reported']:
+        patient_type = _same_day_type(rg, context, timestamps['arrival_ts'])
+    timestamps['patient_type'] = patient_type
+    path = patient_path(patient_type)
+
+    if event == 'arrival':
+        remaining = path
+    elif event.startswith('release_'):
+        remaining = path[path.index(event[len('release_'):]) + 1:]
+    else:
+        stage = event[len('got_'):]
+        remaining = path[path.index(stage):]
+        if stage in STAGE_SERVICE:
+            remaining = remaining[1:]
+            resource_name, service, got_key, release_key = STAGE_SERVICE[stage]
+            resource = getattr(clinic, resource_name)
+            with resource.request() as request:
+                yield request
+                elapsed = env.now - patient['last_time']
+                yield env.timeout(residual_service(rg, clinic.service_times[service], elapsed))
+                timestamps[release_key] = env.now
+
+    for stage in remaining:
+        yield env.process(_stage_handler(env, clinic, patient_id, timestamps, stage, patient_type, context).run())
+    timestamps['exit_system_ts'] = env.now
+    clinic.timestamps_list.append(timestamps)
+    return timestamps
+
+
+def _quantiles(values, axis=0):
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return {f'p{q}': None for q in PERCENTILES}
+    return {f'p{q}': np.nanpercentile(values, q, axis=axis).tolist() for q in PERCENTILES}
+
+
+def _forecast_chunk(scenario, state, seeds, grid):
+    """
+    Runs forward replications of the rest of the day from a live state in this process.
+
+    Returns:
+        dict: Per replication, the exit time of every in-flight patient, the LOS of the
+              patients still to arrive, the day's mean LOS, and queue and census counts on the grid.
+    """
+    from run_simulation import get_context
+
+    context = get_context(scenario)
+    in_flight = state.in_flight()
+    finished_los = [patient['timestamps']['exit_system_ts'] - patient['timestamps']['arrival_ts']
+                    for patient in state.finished()]
+    exits, new_los, day_mean_los, days = [], [], [], []
+    for seed in seeds:
+        context.reset(seed, start_time=state.time, first_patient=state.num_arrivals)
+        resumed = [context.env.process(resume_patient(context, patient_id, state.patients[patient_id]))
+                   for patient_id in in_flight]
+        rows, _ = context.run()
+        # in-flight exits come from their own processes (unfinished ones never leave); the
+        # arrivals run_clinic numbers first_patient + 1, ... get negative ids, apart from the feed's
+        resumed_rows = {id(process.value) for process in resumed if process.triggered}
+        exits.append([process.value['exit_system_ts'] if process.triggered else np.nan for process in resumed])
+        arrived_later = np.array([id(row) not in resumed_rows for row in rows], dtype=bool)
+        for row in itertools.compress(rows, arrived_later):
+            row['patient_id'] = -row['patient_id']
+        los = column_array(rows, 'exit_system_ts') - column_array(rows, 'arrival_ts')
+        new_los.extend(los[arrived_later].tolist())
+        all_los = np.concatenate([finished_los, los])
+        day_mean_los.append(float(np.nanmean(all_los)) if len(all_los) else np.nan)
+        days.append(rows)
+
+    rows = [row for day in days for row in day]
+    replication = np.repeat(np.arange(len(days)), [len(day) for day in days])
+    names = {column for name in QUEUES for pair in PATIENT_KPIS[name] for column in pair} | set(CENSUS_INTERVAL)
+    columns = {name: column_array(rows, name) for name in names}
+    counts = {}
+    for name in QUEUES:
+        pairs = [(start, end) for end, start in PATIENT_KPIS[name]]
+        counts[name] = step_function(*collect_intervals(columns, pairs, replication), grid, len(days))
+    counts['census'] = step_function(*collect_intervals(columns, [CENSUS_INTERVAL], replication), grid, len(days))
+    return {'exits': exits, 'new_los': new_los, 'day_mean_los': day_mean_los, 'counts': counts}
+
+
+class DigitalTwin(object):
+    """
+    Forecasts the rest of a clinic day from its live state with parallel forward replications.
+
+    The worker pool and each worker's SimulationContext stay up between forecasts,
+    so a repeated forecast only pays for the simulation itself.
+
+    Args:
+        scenario (dict, optional): The clinic being mirrored. Defaults to the baseline scenario.
+        workers (int, optional): Worker processes. 1 runs in this process. Defaults to all cores.
+    """
+    def __init__(self, scenario=None, workers=None):
+        self.scenario = resolve_scenario(scenario or {})
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def forecast(self, state, num_replications=200, first_seed=1, step=0.25):
+        """
+        Simulates the rest of the day num_replications times from `state`.
+
+        Args:
+            state (ClinicState): Current clinic state.
+            num_replications (int, optional): Forward replications. Defaults to 200.
+            first_seed (int, optional): Seeds are first_seed, first_seed+1, ... Defaults to 1.
+            step (float, optional): Spacing of the queue forecast in hours. Defaults to 0.25.
+
+        Returns:
+            dict: 'in_flight' (per patient: stage and p10/p50/p90 exit time and LOS), 'new_arrivals_los'
+                  and 'day_mean_los' percentiles, 'queues' (per wait and 'census': p10/p50/p90 counts
+                  on 'grid') and 'num_replications'.
+        """
+        seeds = list(range(first_seed, first_seed + num_replications))
+        grid = np.arange(state.time, self.scenario['stoptime'] + 2 + 1e-9, step)
+        if self.workers == 1:
+            chunks = [_forecast_chunk(self.scenario, state, seeds, grid)]
+        else:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            size = -(-len(seeds) // self.workers)
+            futures = [self._pool.submit(_forecast_chunk, self.scenario, state, seeds[i:i + size], grid)
+                       for i in range(0, len(seeds), size)]
+            chunks = [future.result() for future in futures]
+
+        in_flight = state.in_flight()
+        exits = np.concatenate([np.array(chunk['exits'], dtype=float).reshape(len(chunk['exits']), len(in_flight))
+                                for chunk in chunks])
+        patients = []
+        for j, patient_id in enumerate(in_flight):
+            patient = state.patients[patient_id]
+            arrival = patient['timestamps']['arrival_ts']
+            patients.append({'patient': patient_id, 'last_event': patient['last_event'],
+                             'exit': _quantiles(exits[:, j]), 'los': _quantiles(exits[:, j] - arrival)})
+        queues = {name: _quantiles(np.concatenate([chunk['counts'][name] for chunk in chunks]))
+                  for name in chunks[0]['counts']}
+        return {
+            'time': state.time,
+            'num_replications': num_replications,
+            'in_flight': patients,
+            'new_arrivals_los': _quantiles([los for chunk in chunks for los in chunk['new_los']]),
+            'day_mean_los': _quantiles([los for chunk in chunks for los in chunk['day_mean_los']]),
+            'grid': grid.tolist(),
+            'queues': queues,
+        }
+
+
+def events_from_log(rows, until):
+    """
+    Feed events of a simulated day up to time `until`, to test the twin against the model itself.
+
+    The exam stage runs from the first to the last exam-specific timestamp.
+    """
+    common = {f'{action}_{stage}_ts' for stage in STAGE_SERVICE for action in ('got', 'release')}
+    events = []
+    for row in rows:
+        patient_type = normalize_patient_type(row['patient_type'])
+        exam_type = 'screen' if patient_type.startswith('screen +') else patient_type
+        stamps = {key: value for key, value in row.items()
+                  if key.endswith('_ts') and isinstance(value, float) and value == value}
+        exam_times = [value for key, value in stamps.items()
+                      if key not in common and key not in ('arrival_ts', 'exit_system_ts')]
+        timeline = [(row['arrival_ts'], 'arrival')]
+        timeline += [(value, key[:-len('_ts')]) for key, value in stamps.items() if key in common]
+        if exam_times:
+            timeline += [(min(exam_times), 'got_exam'), (max(exam_times), 'release_exam')]
+        timeline.append((row['exit_system_ts'], 'exit'))
+        for event_time, name in sorted(timeline, key=lambda item: (item[0], EVENTS.index(item[1])
+                                                                   if item[1] != 'exit' else len(EVENTS))):
+            if event_time <= until:
+                event = {'time': round(event_time, 6), 'patient': row['patient_id'], 'event': name}
+                if name == 'arrival':
+                    event['exam_type'] = exam_type
+                if name == 'got_exam':
+                    event['patient_type'] = patient_type
+                events.append(event)
+    events.sort(key=lambda event: event['time'])
+    events.append({'time': until, 'event': 'now'})
+    return events
+
+
+def read_feed(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(result):
+    """Human-readable forecast summary."""
+    lines = [f"Forecast at t = {result['time']:.2f} h ({result['num_replications']} replications)"]
+    los = result['new_arrivals_los']
+    if los['p50'] is not None:
+        lines.append(f"  LOS of patients still to arrive: p50 {los['p50']:.2f} h, p90 {los['p90']:.2f} h")
+    day = result['day_mean_los']
+    lines.append(f"  Day mean LOS: p10 {day['p10']:.3f}, p50 {day['p50']:.3f}, p90 {day['p90']:.3f} h")
+    late = sorted(result['in_flight'], key=lambda patient: -(patient['los']['p90'] or 0))[:5]
+    if late:
+        lines.append("  In-flight patients with the longest p90 LOS:")
+        for patient in late:
+            lines.append(f"    {patient['patient']!s:<8} {patient['last_event']:<28} exit p50 "
+                         f"{patient['exit']['p50']:.2f} h, LOS p90 {patient['los']['p90']:.2f} h")
+    lines.append("  Median queue lengths (next 2 h):")
+    next_two_hours = [i for i, t in enumerate(result['grid']) if t <= result['time'] + 2]
+    for name, bands in result['queues'].items():
+        medians = [bands['p50'][i] for i in next_two_hours]
+        if any(medians):
+            lines.append(f"    {name:<28}" + ' '.join(f"{value:4.0f}" for value in medians))
+    return '\n'.join(lines)
+
+
+class _FeedHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                if message.get('event') == 'forecast':
+                    result = self.server.twin.forecast(self.server.state, message.get('num_replications',
+                                                                                      self.server.num_replications))
+                    reply = result
+                else:
+                    self.server.state.apply(message)
+                    reply = None
+            except (ValueError, KeyError) as error:
+                reply = {'error': str(error)}
+            if reply is not None:
+                self.wfile.write((json.dumps(reply) + '\n').encode())
+
+
+def run_twin():
+    """
+    Command line entry point: forecasts the rest of the day from a live event feed (file or TCP socket).
+    """
+    parser = argparse.ArgumentParser(description="Digital-twin forecast of the rest of the clinic day.")
+    parser.add_argument('--feed', type=str, default=None, help='JSON lines file of feed events')
+    parser.add_argument('--follow', action='store_true', help='Keep reading --feed and forecast when it grows')
+    parser.add_argument('--interval', type=float, default=5.0, help='Seconds between checks with --follow')
+    parser.add_argument('--listen', type=str, default=None,
+                        help="host:port to accept feed events on; a line {\"event\": \"forecast\"} gets a forecast")
+    parser.add_argument('--now', type=str, default=None, help='Current time (hours or HH:MM); default: latest event')
+    parser.add_argument('--scenario', type=str, default=None, help='Scenario file of the clinic (one scenario)')
+    parser.add_argument('--num_replications', type=int, default=200, help='Forward replications per forecast')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--demo_feed', type=str, default=None,
+                        help='Write the feed of a simulated day (--demo_seed) up to --now to this file and exit')
+    parser.add_argument('--demo_seed', type=int, default=7, help='Seed of the --demo_feed day')
+    parser.add_argument('--out', type=str, default=None, help='Optional JSON file for the last forecast')
+    args = parser.parse_args()
+
+    scenario = {}
+    if args.scenario:
+        scenario = load_scenario(args.scenario)
+    now = None if args.now is None else parse_time(args.now)
+
+    if args.demo_feed:
+        from run_simulation import SimulationContext
+
+        context = SimulationContext(scenario)
+        context.reset(args.demo_seed)
+        rows, _ = context.run()
+        events = events_from_log(rows, 4.0 if now is None else now)
+        with open(args.demo_feed, 'w') as f:
+            for event in events:
+                f.write(json.dumps(event) + '\n')
+        print(f"Wrote {len(events)} events to {args.demo_feed}")
+        return
+
+    with DigitalTwin(scenario, workers=args.workers) as twin:
+        if args.listen:
+            host, port = args.listen.rsplit(':', 1)
+            with socketserver.TCPServer((host, int(port)), _FeedHandler) as server:
+                server.twin, server.state, server.num_replications = twin, ClinicState(), args.num_replications
+                print(f"Listening for feed events on {host}:{port}")
+                server.serve_forever()
+            return
+        if not args.feed:
+            raise ValueError("Give --feed, --listen or --demo_feed.")
+
+        seen = 0
+        while True:
+            events = read_feed(args.feed)
+            if len(events) != seen:
+                seen = len(events)
+                state = ClinicState.from_events(events, now)
+                start = time.perf_counter()
+                result = twin.forecast(state, args.num_replications)
+                print(summarize(result))
+                print(f"  ({state.num_arrivals} patients so far, {len(result['in_flight'])} in the clinic: "
+                      f"{state.counts()}; forecast took {time.perf_counter() - start:.2f} s)")
+                if args.out:
+                    with open(args.out, 'w') as f:
+                        json.dump(result, f, indent=2)
+            if not args.follow:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    run_twin()
@@ -1,5 +1,34 @@
+import csv
+
 import simpy
-import pandas as pd
+
+from scenarios import SERVICE_TIMES
+
+# Placeholder for timestamps a patient's path never reaches; written as an empty CSV field.
+NA = float('nan')
+
+
+def _csv_field(value):
+    if isinstance(value, float):
+        return '' if value != value else repr(float(value))
+    return '' if value is None else value
+
+
+def write_patient_log(timestamps_list, path):
+    """
+    Writes a day's timestamps dicts to a CSV file, one row per patient.
+
+    Columns appear in the order they were first recorded. Produces the same file
+    as pandas.DataFrame(timestamps_list).to_csv(path, index=False) without
+    importing pandas.
+    """
+    fieldnames = list(dict.fromkeys(key for timestamps in timestamps_list for key in timestamps))
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(fieldnames)
+        for timestamps in timestamps_list:
+            writer.writerow([_csv_field(timestamps.get(key)) for key in fieldnames])
+
 
 class MammoClinic(object):
     """
@@ -10,10 +39,15 @@ class MammoClinic(object):
     def __init__(self, env, num_checkin_staff, num_public_wait_room,
                  num_consent_staff, num_change_room, num_gowned_wait_room,
                  num_scanner, num_us_machine, num_radiologist,
-                 num_radiologist_same_day, rad_change, rad_change_2, rg): # Added parameters
+                 num_radiologist_same_day, rad_change, rad_change_2, rg, service_times=None,
+                 exam_dicts=None): # Added parameters
         # simulation env
         self.env = env
         self.rg = rg # Use the passed random generator
+        # (mean, sd) per service, defaults overridden by the scenario's service_times
+        self.service_times = dict(SERVICE_TIMES, **(service_times or {}))
+        # per-hour {exam type: share} dicts; None uses the exam mix in ./data
+        self.exam_dicts = exam_dicts
 
         # create list to hold timestamps dictionaries (one per pt)
         self.timestamps_list = []
@@ -34,47 +68,52 @@ class MammoClinic(object):
         else:
             self.radiologist_same_day = None # Explicitly set to None if not used
 
+    def _draw(self, name):
+        # one service time, normal with the (mean, sd) of service_times[name]; a draw below
+        # zero (rare at the default times) is clamped, as env.timeout() raises on it
+        return max(0.0, self.rg.normal(*self.service_times[name]))
+
     def pt_checkin(self, patient):
-        yield self.env.timeout(self.rg.normal(0.05, 0.01))
+        yield self.env.timeout(self._draw('pt_checkin'))
 
     def use_public_wait_room(self, patient):
-        yield self.env.timeout(self.rg.normal(0.01, 0.001))
+        yield self.env.timeout(self._draw('use_public_wait_room'))
 
     def consent_patient(self, patient):
-        yield self.env.timeout(self.rg.normal(0.05, 0.01))
+        yield self.env.timeout(self._draw('consent_patient'))
 
     def use_change_room(self, patient):
-        yield self.env.timeout(self.rg.normal(0.05, 0.01))
+        yield self.env.timeout(self._draw('use_change_room'))
 
     def use_gowned_wait_room(self, patient):
-        yield self.env.timeout(self.rg.normal(0.01, 0.001))
+        yield self.env.timeout(self._draw('use_gowned_wait_room'))
 
     def get_screen_mammo(self, patient):
-        yield self.env.timeout(self.rg.normal(0.1, 0.01))
+        yield self.env.timeout(self._draw('get_screen_mammo'))
 
     def get_dx_mammo(self, patient):
-        yield self.env.timeout(self.rg.normal(0.1, 0.01))
+        yield self.env.timeout(self._draw('get_dx_mammo'))
 
     def get_dx_us(self, patient): # Changed from get_dx_US to get_dx_us
-        yield self.env.timeout(self.rg.normal(0.2, 0.05))
+        yield self.env.timeout(self._draw('get_dx_us'))
 
     def get_ai_assess(self, patient):
-        yield self.env.timeout(self.rg.normal(0.01, 0.001))
+        yield self.env.timeout(self._draw('get_ai_assess'))
 
     def rad_review(self, patient):
-        yield self.env.timeout(self.rg.normal(0.05, 0.01))
+        yield self.env.timeout(self._draw('rad_review'))
 
     def get_us_guided_bx(self, patient):
-        yield self.env.timeout(self.rg.normal(0.5, 0.1))
+        yield self.env.timeout(self._draw('get_us_guided_bx'))
 
     def get_mammo_guided_bx(self, patient):
-        yield self.env.timeout(self.rg.normal(0.5, 0.1))
+        yield self.env.timeout(self._draw('get_mammo_guided_bx'))
 
     def get_screen_us(self, patient):
-        yield self.env.timeout(self.rg.normal(0.2, 0.05))
+        yield self.env.timeout(self._draw('get_screen_us'))
 
     def get_mri_guided_bx(self, patient):
-        yield self.env.timeout(self.rg.normal(1.0, 0.2))
+        yield self.env.timeout(self._draw('get_mri_guided_bx'))
 
 
 class BaseWorkflowHandler:
@@ -133,8 +172,8 @@ class ConsentRoomHandler(BaseWorkflowHandler):
                 yield self.env.process(self.clinic.consent_patient(self.patient))
                 self.timestamps['release_consent_staff_ts'] = self.env.now
         else:
-            self.timestamps['got_consent_staff_ts'] = pd.NA
-            self.timestamps['release_consent_staff_ts'] = pd.NA
+            self.timestamps['got_consent_staff_ts'] = NA
+            self.timestamps['release_consent_staff_ts'] = NA
 
 
 class ChangeRoomHandler(BaseWorkflowHandler):
@@ -561,7 +600,7 @@ class USGuidedBiopsyWorkflow(BaseWorkflowHandler):
         with self.clinic.us_machine.request() as request, self.clinic.radiologist.request() as request_rad:
             yield request & request_rad
             self.timestamps['got_us_machine_bx_ts'] = self.env.now
-            self.timestamps['got_scanner_bx_ts'] = pd.NA
+            self.timestamps['got_scanner_bx_ts'] = NA
             yield self.env.process(self.clinic.get_us_guided_bx(self.patient)) 
             self.timestamps['release_us_machine_after_bx_ts'] = self.env.now
 